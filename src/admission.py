@@ -0,0 +1,183 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from fastapi import Request
+
+# Priority classes, lower is served first
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request can't be admitted, `retry_after` is a hint in seconds."""
+
+    def __init__(self, model: str, retry_after: int) -> None:
+        super().__init__(f"Too many requests for model '{model}'")
+        self.model = model
+        self.retry_after = retry_after
+
+
+class Slot:
+    """A granted execution slot, release it when the agent run is done."""
+
+    def __init__(self, gate: "ModelGate") -> None:
+        self._gate = gate
+        self._acquired_at = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._gate._release(time.monotonic() - self._acquired_at)
+
+
+class ModelGate:
+    """
+    Priority semaphore for one model: at most `limit` concurrent runs and `max_queue`
+    waiting requests, served by priority class and then in arrival order.
+    """
+
+    def __init__(self, model: str, limit: int, max_queue: int) -> None:
+        self.model = model
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiting = 0
+        # Moving average of how long slots are held, for the Retry-After hint
+        self.hold_time = 1.0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.hold_time * (self.waiting + 1) / max(self.limit, 1)))
+
+    async def acquire(self, priority: int, timeout: float) -> Slot:
+        if self.active < self.limit and not self.waiting:
+            self.active += 1
+            return Slot(self)
+        if self.waiting >= self.max_queue:
+            raise AdmissionRejected(self.model, self.retry_after())
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self.waiting += 1
+        try:
+            # A released slot is handed over directly, see _release()
+            await asyncio.wait_for(future, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            handed_over = future.done() and not future.cancelled()
+            if isinstance(e, asyncio.CancelledError):
+                if handed_over:
+                    self._release()
+                raise
+            if not handed_over:
+                raise AdmissionRejected(self.model, self.retry_after()) from None
+        finally:
+            self.waiting -= 1
+        return Slot(self)
+
+    def _release(self, held: float | None = None) -> None:
+        if held is not None:
+            self.hold_time = 0.8 * self.hold_time + 0.2 * held
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            # Waiters that timed out or disconnected are cancelled
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+
+def _parse_mapping(value: str) -> dict[str, str]:
+    pairs = (item.split("=", 1) for item in value.split(",") if "=" in item)
+    return {key.strip(): value.strip() for key, value in pairs}
+
+
+class AdmissionController:
+    """
+    Admission control for agent runs, with one ModelGate per model.
+
+    Requests wait up to `timeout` seconds for a slot, and are rejected straight away
+    when the model's wait queue is full.
+    """
+
+    def __init__(
+        self,
+        default_limit: int = 16,
+        limits: dict[str, int] | None = None,
+        max_queue: int = 64,
+        timeout: float = 10.0,
+        key_priorities: dict[str, int] | None = None,
+    ) -> None:
+        self.default_limit = default_limit
+        self.limits = limits or {}
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.key_priorities = key_priorities or {}
+        self.gates: dict[str, ModelGate] = {}
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        limits = _parse_mapping(os.getenv("MODEL_CONCURRENCY", ""))
+        priorities = _parse_mapping(os.getenv("ADMISSION_KEY_PRIORITIES", ""))
+        return cls(
+            default_limit=int(os.getenv("MODEL_CONCURRENCY_DEFAULT", "16")),
+            limits={model: int(limit) for model, limit in limits.items()},
+            max_queue=int(os.getenv("ADMISSION_QUEUE_SIZE", "64")),
+            timeout=float(os.getenv("ADMISSION_TIMEOUT", "10")),
+            key_priorities={key: PRIORITIES[name] for key, name in priorities.items()},
+        )
+
+    def gate(self, model: str) -> ModelGate:
+        if model not in self.gates:
+            limit = self.limits.get(model, self.default_limit)
+            self.gates[model] = ModelGate(model, limit, self.max_queue)
+        return self.gates[model]
+
+    async def acquire(self, model: str, priority: int = PRIORITIES["normal"]) -> Slot:
+        try:
+            return await self.gate(model).acquire(priority, self.timeout)
+        except AdmissionRejected:
+            self.rejected += 1
+            raise
+
+    @asynccontextmanager
+    async def admit(self, model: str, priority: int = PRIORITIES["normal"]) -> AsyncIterator[None]:
+        slot = await self.acquire(model, priority)
+        try:
+            yield
+        finally:
+            slot.release()
+
+    def priority(self, api_key: str | None) -> int:
+        return self.key_priorities.get(api_key or "", PRIORITIES["normal"])
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        return {
+            model: {"limit": gate.limit, "active": gate.active, "waiting": gate.waiting}
+            for model, gate in self.gates.items()
+        }
+
+
+admission = AdmissionController.from_env()
+
+
+def request_priority(request: Request) -> int:
+    """
+    Priority class of a request, from the API key in its bearer token or X-API-Key.
+
+    With AUTH_SECRET set, only the bearer token is verified, so X-API-Key is ignored
+    and priority comes from the bearer alone.
+    """
+    authorization = request.headers.get("Authorization", "")
+    api_key = None
+    if authorization.lower().startswith("bearer "):
+        api_key = authorization[7:].strip()
+    if not os.getenv("AUTH_SECRET"):
+        api_key = request.headers.get("X-API-Key", api_key)
+    return admission.priority(api_key)
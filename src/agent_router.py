@@ -0,0 +1,183 @@
+from typing import Annotated, Any
+
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi.responses import StreamingResponse
+
+from admission import admission, request_priority
+from agent_services import abatch, ahistory, ahistory_stream, start_stream_run
+from agents.model_router import model_router
+from response_cache import response_cache
+from runs import Run, run_manager
+from schema import BatchInput, BatchOutput, ChatHistory, ChatHistoryInput, RunStatus, StreamInput
+
+agent_router = APIRouter(tags=["Agent"])
+
+
+def _sse_response_example() -> dict[int, Any]:
+    return {
+        status.HTTP_200_OK: {
+            "description": "Server Sent Event Response",
+            "content": {
+                "text/event-stream": {
+                    "example": 'data: {"type":"token","content":"Hello"}\n\ndata: {"type":"token","content":" World"}\n\ndata: [DONE]\n\n',
+                    "schema": {"type": "string"},
+                }
+            },
+        }
+    }
+
+
+def _get_run(run_id: str) -> Run:
+    run = run_manager.get(run_id)
+    if run is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=f"Run '{run_id}' not found"
+        )
+    return run
+
+
+@agent_router.post(
+    "/{agent_id}/stream", response_class=StreamingResponse, responses=_sse_response_example()
+)
+async def stream(
+    user_input: StreamInput, agent_id: str, priority: Annotated[int, Depends(request_priority)]
+) -> StreamingResponse:
+    """
+    Stream an agent's response to a user input, including intermediate messages and tokens.
+
+    Use thread_id to persist and continue a multi-turn conversation. run_id kwarg
+    is also attached to all messages for recording feedback.
+
+    Set `stream_tokens=false` to return intermediate messages but not token-by-token.
+
+    The run continues in the background if the connection drops. Its ID is returned in
+    the `X-Run-ID` header, reconnect to `/runs/{run_id}/stream` with the `Last-Event-ID`
+    header to resume.
+
+    Runs are admitted per model: when too many are queued, or no slot frees up in time,
+    the request fails with 503 and a `Retry-After` header.
+
+    When the response cache is enabled, a cached response is sent as a single message
+    with `response_metadata.cache` set to the tier that matched ("exact" or "semantic").
+
+    When a model call was retried or failed over, tokens of the failed attempts may
+    have been streamed. Its message then has `response_metadata.failed_attempts` set,
+    and its content replaces the tokens streamed for it.
+    """
+    run = await start_stream_run(user_input, agent_id=agent_id, priority=priority)
+    return StreamingResponse(
+        run.subscribe(), media_type="text/event-stream", headers={"X-Run-ID": run.run_id}
+    )
+
+
+@agent_router.get(
+    "/runs/{run_id}/stream", response_class=StreamingResponse, responses=_sse_response_example()
+)
+async def resume_stream(
+    run_id: str, last_event_id: Annotated[int | None, Header()] = None
+) -> StreamingResponse:
+    """
+    Follow a background run, resuming after the `Last-Event-ID` header if given.
+
+    Events are buffered per run for a limited time and count. When older ones are gone,
+    an error event reports how many were missed before the remaining ones are sent.
+    """
+    run = _get_run(run_id)
+    return StreamingResponse(run.subscribe(last_event_id), media_type="text/event-stream")
+
+
+@agent_router.get("/admission/stats")
+async def admission_stats() -> dict[str, dict[str, int]]:
+    """Get the concurrency limit, running and queued requests of each model."""
+    return admission.stats()
+
+
+@agent_router.get("/models/stats")
+async def model_stats() -> dict[str, Any]:
+    """
+    Get live model statistics and tier routing.
+
+    For each model that has been called: rolling p50/p95 time-to-first-token (seconds)
+    and output tokens/sec, error rate and availability. `tiers` shows the model each
+    tier alias (usable as `model` in requests) currently routes to.
+    """
+    return model_router.summary()
+
+
+@agent_router.get("/cache/stats")
+async def cache_stats() -> dict[str, Any]:
+    """
+    Get response cache counters: entries, exact and semantic hits, misses and responses
+    stored. The cache is off unless RESPONSE_CACHE=true.
+    """
+    return response_cache.stats()
+
+
+@agent_router.get("/runs/stats")
+async def run_stats() -> dict[str, int]:
+    """
+    Get background run counters.
+
+    Includes the runs cancelled after their client disconnected, and an estimate of the
+    tokens saved by cancelling them.
+    """
+    return run_manager.stats()
+
+
+@agent_router.get("/runs/{run_id}")
+async def run_status(run_id: str) -> RunStatus:
+    """Get the status of a background run."""
+    run = _get_run(run_id)
+    return RunStatus(
+        run_id=run.run_id,
+        agent_id=run.agent_id,
+        thread_id=run.thread_id,
+        status=run.status,
+        last_event_id=run.next_event_id - 1,
+        subscribers=run.subscribers,
+        created_at=run.created_at,
+        finished_at=run.finished_at,
+    )
+
+
+@agent_router.post("/{agent_id}/batch_invoke")
+async def batch_invoke(
+    batch_input: BatchInput, agent_id: str, priority: Annotated[int, Depends(request_priority)]
+) -> BatchOutput:
+    """
+    Invoke an agent with a batch of user inputs in a single request.
+
+    Inputs are processed concurrently, up to `max_concurrency` at a time, and results
+    are returned in input order. Failed inputs are reported with a per-item `error`
+    instead of failing the whole batch.
+    """
+    return await abatch(batch_input=batch_input, agent_id=agent_id, priority=priority)
+
+
+@agent_router.post("/{agent_id}/history")
+async def history(history_input: ChatHistoryInput, agent_id: str) -> ChatHistory:
+    """
+    Get the chat history of a thread.
+
+    Use `limit` to get only the most recent messages, and pass the returned
+    `next_cursor` as `before` to page back through older ones.
+    """
+    return await ahistory(history_input=history_input, agent_id=agent_id)
+
+
+@agent_router.post(
+    "/{agent_id}/history/stream",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/x-ndjson": {}}}},
+)
+async def stream_history(history_input: ChatHistoryInput, agent_id: str) -> StreamingResponse:
+    """
+    Stream the chat history of a thread as newline-delimited JSON, one message per line.
+
+    Takes the same pagination parameters as `/history`. If there are older messages the
+    last line is `{"next_cursor": <cursor>}`.
+    """
+    return StreamingResponse(
+        await ahistory_stream(history_input=history_input, agent_id=agent_id),
+        media_type="application/x-ndjson",
+    )
@@ -1,44 +1,405 @@
+import asyncio
+from collections.abc import AsyncGenerator, AsyncIterator
 from typing import Any
-from uuid import uuid4
+from uuid import UUID, uuid4
 import logging
 
-from fastapi import HTTPException
+from fastapi import HTTPException, status
 
 from langgraph.graph.state import CompiledStateGraph
-from langchain_core.messages import AnyMessage, HumanMessage
+from langchain_core.messages import AIMessage, AnyMessage, HumanMessage
 from langchain_core.runnables import RunnableConfig
-from schema import UserInput, ChatMessage
-from agents import DEFAULT_AGENT, agents
+from schema import (
+    BatchInput,
+    BatchOutput,
+    BatchResult,
+    ChatHistory,
+    ChatHistoryInput,
+    ChatMessage,
+    StreamInput,
+    UserInput,
+)
+from admission import PRIORITIES, AdmissionRejected, admission
+from agents import DEFAULT_AGENT, GUARDED_AGENTS, agents
+from agents.llama_guard import SafetyAssessment, get_llama_guard
+from agents.model_router import model_router
+from agents.models import models
+from response_cache import CacheKey, normalize_message, response_cache, thread_prefix
+from runs import Run, run_manager
 
 from agent_utils import (
     convert_message_content_to_string,
     langchain_to_chat_message,
     remove_tool_calls,
 )
+from sse import (
+    CUSTOM_DATA_TAG,
+    DONE_FRAME,
+    ERROR_FRAME,
+    SILENT_TOKEN_TAGS,
+    SPECULATIVE_TAG,
+    SPECULATIVE_VERDICT_EVENT,
+    is_graph_step,
+    message_frame,
+)
 
 logger = logging.getLogger(__name__)
 
+# Messages converted between yields to the event loop when serving long histories
+HISTORY_CHUNK_SIZE = 100
+
+
+def thread_config(agent_id: str, thread_id: str, **configurable: Any) -> RunnableConfig:
+    """
+    Config for a thread of an agent. The agents share one checkpointer and thread IDs
+    come from clients, so each agent's threads are checkpointed under their own key.
+    """
+    return RunnableConfig(configurable={"thread_id": f"{agent_id}:{thread_id}", **configurable})
+
+
+def _backend_model(model: str) -> str:
+    """
+    The model a request runs on. Tier aliases are resolved up front, so admission gates
+    the backend that is actually called. Models that aren't configured are rejected
+    before anything is created for them.
+    """
+    try:
+        backend = model_router.resolve(model)
+    except KeyError:
+        backend = None
+    if backend is None or backend not in models:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Model '{model}' is not available",
+        )
+    return backend
+
 
-def _parse_input(user_input: UserInput) -> tuple[dict[str, Any], str]:
+def _parse_input(user_input: UserInput, agent_id: str) -> tuple[dict[str, Any], UUID, str]:
     run_id = uuid4()
     thread_id = user_input.thread_id or str(uuid4())
+    config = thread_config(agent_id, thread_id, model=_backend_model(user_input.model))
+    config["run_id"] = run_id
     kwargs = {
         "input": {"messages": [HumanMessage(content=user_input.message)]},
-        "config": RunnableConfig(
-            configurable={"thread_id": thread_id, "model": user_input.model}, run_id=run_id
-        ),
+        "config": config,
     }
-    return kwargs, run_id
+    return kwargs, run_id, thread_id
 
 
-async def ainvoke(user_input: UserInput, agent_id: str = DEFAULT_AGENT) -> ChatMessage:
-    agent: CompiledStateGraph = agents[agent_id]
-    kwargs, run_id = _parse_input(user_input)
+def get_agent(agent_id: str) -> CompiledStateGraph:
+    if agent_id not in agents:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=f"Agent '{agent_id}' not found"
+        )
+    return agents[agent_id]
+
+
+async def _cache_lookup(
+    agent: CompiledStateGraph, agent_id: str, user_input: UserInput, kwargs: dict[str, Any]
+) -> tuple[CacheKey | None, AIMessage | None]:
+    """
+    Look up the response cache, returning the cache key (None when the agent isn't
+    cached) and on a hit the cached response, written to the thread as if the model had
+    produced it. A failing lookup is a miss, and the response isn't cached.
+    """
+    if not response_cache.caches(agent_id):
+        return None, None
     try:
-        response = await agent.ainvoke(**kwargs)
-        output = langchain_to_chat_message(response["messages"][-1])
-        output.run_id = str(run_id)
-        return output
+        return await _acache_lookup(agent, agent_id, user_input, kwargs)
+    except Exception as e:
+        logger.warning(f"Response cache lookup failed: {e!r}")
+        return None, None
+
+
+async def _acache_lookup(
+    agent: CompiledStateGraph, agent_id: str, user_input: UserInput, kwargs: dict[str, Any]
+) -> tuple[CacheKey, AIMessage | None]:
+    history: list[AnyMessage] = []
+    if user_input.thread_id:
+        state_snapshot = await agent.aget_state(kwargs["config"])
+        history = state_snapshot.values.get("messages", [])
+    key = (
+        agent_id,
+        user_input.model,
+        thread_prefix(history),
+        normalize_message(user_input.message),
+    )
+
+    async def input_is_safe() -> bool:
+        # A semantic match answers a message the agent's input guard hasn't checked
+        messages = [*history, *kwargs["input"]["messages"]]
+        safety = await get_llama_guard().ainvoke("User", messages)
+        return safety.safety_assessment != SafetyAssessment.UNSAFE
+
+    verify = input_is_safe if agent_id in GUARDED_AGENTS else None
+    cached = await response_cache.lookup(key, verify)
+    if cached is None:
+        return key, None
+    response, tier = cached
+    message = response.model_copy(
+        update={"id": None, "response_metadata": {**response.response_metadata, "cache": tier}}
+    )
+    await agent.aupdate_state(
+        kwargs["config"], {"messages": [*kwargs["input"]["messages"], message]}, as_node="model"
+    )
+    return key, message
+
+
+async def _ainvoke_agent(
+    agent: CompiledStateGraph, user_input: UserInput, agent_id: str, priority: int
+) -> ChatMessage:
+    kwargs, run_id, _ = _parse_input(user_input, agent_id)
+    key, message = await _cache_lookup(agent, agent_id, user_input, kwargs)
+    if message is None:
+        async with admission.admit(kwargs["config"]["configurable"]["model"], priority):
+            response = await agent.ainvoke(**kwargs)
+        message = response["messages"][-1]
+        if key is not None and isinstance(message, AIMessage):
+            await response_cache.store(key, message)
+    output = langchain_to_chat_message(message)
+    output.run_id = str(run_id)
+    return output
+
+
+def _overloaded(e: AdmissionRejected) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+async def ainvoke(
+    user_input: UserInput, agent_id: str = DEFAULT_AGENT, priority: int = PRIORITIES["normal"]
+) -> ChatMessage:
+    agent = get_agent(agent_id)
+    try:
+        return await _ainvoke_agent(agent, user_input, agent_id, priority)
+    except AdmissionRejected as e:
+        raise _overloaded(e)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"An exception occurred: {e}")
         raise HTTPException(status_code=500, detail="Unexpected error")
+
+
+async def abatch(
+    batch_input: BatchInput, agent_id: str = DEFAULT_AGENT, priority: int = PRIORITIES["normal"]
+) -> BatchOutput:
+    """
+    Invoke the agent with every input of the batch, at most `max_concurrency` at a time.
+
+    Results are returned in input order. A failing input does not fail the batch, its
+    error is reported on the corresponding result instead. Each input goes through
+    the response cache and admission control on its own.
+    """
+    agent = get_agent(agent_id)
+    semaphore = asyncio.Semaphore(batch_input.max_concurrency)
+
+    async def ainvoke_item(user_input: UserInput) -> BatchResult:
+        async with semaphore:
+            try:
+                output = await _ainvoke_agent(agent, user_input, agent_id, priority)
+                return BatchResult(output=output)
+            except AdmissionRejected as e:
+                return BatchResult(error=str(e))
+            except HTTPException as e:
+                return BatchResult(error=e.detail)
+            except Exception as e:
+                logger.error(f"An exception occurred in batch item: {e}")
+                return BatchResult(error="Unexpected error")
+
+    results = await asyncio.gather(*(ainvoke_item(i) for i in batch_input.inputs))
+    return BatchOutput(results=results)
+
+
+def _event_messages(event: dict[str, Any]) -> list[Any]:
+    """Messages to send for a graph event, if any."""
+    match event["event"]:
+        # on_chain_end gets called a bunch of times in a graph execution, only keep the
+        # messages written to the graph state after a node finishes
+        case "on_chain_end":
+            output = event["data"].get("output")
+            if isinstance(output, dict) and "messages" in output and is_graph_step(event["tags"]):
+                return output["messages"]
+        # Intermediate messages from agents.utils.CustomData.adispatch()
+        case "on_custom_event":
+            if CUSTOM_DATA_TAG in event["tags"]:
+                return [event["data"]]
+    return []
+
+
+async def _stream_items(
+    user_input: StreamInput,
+    agent: CompiledStateGraph,
+    kwargs: dict[str, Any],
+    run_id: UUID,
+    cache_key: CacheKey | None = None,
+) -> AsyncGenerator[str | bytes | int, None]:
+    """
+    Run the agent, yielding token text (str), complete SSE frames (bytes) and the output
+    tokens of each model call (int). The final response is stored in the response cache
+    under `cache_key`, if given.
+
+    Tokens of a speculative model call are held until the input safety verdict, then
+    sent if the input is safe and dropped otherwise.
+    """
+    run_id_str = str(run_id)
+    final: AnyMessage | None = None
+    held: list[str] = []
+    speculation_safe: bool | None = None
+
+    try:
+        async for event in agent.astream_events(**kwargs, version="v2"):
+            if not event:
+                continue
+
+            # Tokens are by far the most frequent event, handle them first
+            if event["event"] == "on_chat_model_stream":
+                if user_input.stream_tokens and SILENT_TOKEN_TAGS.isdisjoint(event["tags"]):
+                    content = remove_tool_calls(event["data"]["chunk"].content)
+                    if content:
+                        # Empty content in the context of OpenAI usually means
+                        # that the model is asking for a tool to be invoked.
+                        # So we only send non-empty content.
+                        token = convert_message_content_to_string(content)
+                        if SPECULATIVE_TAG not in event["tags"] or speculation_safe:
+                            yield token
+                        elif speculation_safe is None:
+                            held.append(token)
+                continue
+
+            if event["event"] == "on_chat_model_end":
+                usage = getattr(event["data"].get("output"), "usage_metadata", None)
+                if usage:
+                    yield usage["output_tokens"]
+                continue
+
+            if event["event"] == "on_custom_event" and event["name"] == SPECULATIVE_VERDICT_EVENT:
+                speculation_safe = event["data"]["safe"]
+                if speculation_safe:
+                    for token in held:
+                        yield token
+                held.clear()
+                continue
+
+            for message in _event_messages(event):
+                final = message
+                try:
+                    chat_message = langchain_to_chat_message(message)
+                    chat_message.run_id = run_id_str
+                except Exception as e:
+                    logger.error(f"Error parsing message: {e}")
+                    yield ERROR_FRAME
+                    continue
+                # LangGraph re-sends the input message, which feels weird, so drop it
+                if chat_message.type == "human" and chat_message.content == user_input.message:
+                    continue
+                yield message_frame(chat_message)
+        if cache_key is not None and isinstance(final, AIMessage):
+            await response_cache.store(cache_key, final)
+    except Exception as e:
+        logger.error(f"Error in message generator: {e}")
+        yield ERROR_FRAME
+
+    yield DONE_FRAME
+
+
+async def _cached_items(message: AIMessage, run_id: UUID) -> AsyncGenerator[bytes, None]:
+    chat_message = langchain_to_chat_message(message)
+    chat_message.run_id = str(run_id)
+    yield message_frame(chat_message)
+    yield DONE_FRAME
+
+
+async def start_stream_run(
+    user_input: StreamInput, agent_id: str = DEFAULT_AGENT, priority: int = PRIORITIES["normal"]
+) -> Run:
+    """
+    Start streaming the agent's response in a background run.
+
+    This is the workhorse method for the /stream endpoint. The run keeps going if the
+    client disconnects, clients follow it with `Run.subscribe()`. It holds an admission
+    slot for its model until it ends. Responses served from the response cache are sent
+    as a single message, without running the agent.
+    """
+    agent = get_agent(agent_id)
+    kwargs, run_id, thread_id = _parse_input(user_input, agent_id)
+    key, cached = await _cache_lookup(agent, agent_id, user_input, kwargs)
+    if cached is not None:
+        return run_manager.start(
+            run_id=str(run_id),
+            agent_id=agent_id,
+            thread_id=thread_id,
+            items=_cached_items(cached, run_id),
+        )
+    try:
+        slot = await admission.acquire(kwargs["config"]["configurable"]["model"], priority)
+    except AdmissionRejected as e:
+        raise _overloaded(e)
+    run = run_manager.start(
+        run_id=str(run_id),
+        agent_id=agent_id,
+        thread_id=thread_id,
+        items=_stream_items(user_input, agent, kwargs, run_id, key),
+    )
+    run.task.add_done_callback(lambda _: slot.release())
+    return run
+
+
+async def _history_page(
+    history_input: ChatHistoryInput, agent_id: str
+) -> tuple[list[AnyMessage], int | None]:
+    """Page of thread messages ending at the `before` cursor, and the cursor for older ones."""
+    agent = get_agent(agent_id)
+    state_snapshot = await agent.aget_state(config=thread_config(agent_id, history_input.thread_id))
+    messages: list[AnyMessage] = state_snapshot.values.get("messages", [])
+    end = len(messages)
+    if history_input.before is not None:
+        end = min(history_input.before, end)
+    start = 0
+    if history_input.limit is not None:
+        start = max(end - history_input.limit, 0)
+    return messages[start:end], start or None
+
+
+async def _convert_messages(messages: list[AnyMessage]) -> AsyncIterator[ChatMessage]:
+    for i, message in enumerate(messages):
+        if i and i % HISTORY_CHUNK_SIZE == 0:
+            await asyncio.sleep(0)
+        yield langchain_to_chat_message(message)
+
+
+async def ahistory(history_input: ChatHistoryInput, agent_id: str = DEFAULT_AGENT) -> ChatHistory:
+    try:
+        messages, next_cursor = await _history_page(history_input, agent_id)
+        chat_messages = [m async for m in _convert_messages(messages)]
+        return ChatHistory(messages=chat_messages, next_cursor=next_cursor)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"An exception occurred: {e}")
+        raise HTTPException(status_code=500, detail="Unexpected error")
+
+
+async def ahistory_stream(
+    history_input: ChatHistoryInput, agent_id: str = DEFAULT_AGENT
+) -> AsyncIterator[str]:
+    """
+    Stream a page of the thread history as newline-delimited JSON.
+
+    Each line is a ChatMessage; when there are older messages, the last line is
+    `{"next_cursor": <cursor>}`. The thread is read before returning, so errors are
+    raised before the response starts.
+    """
+    messages, next_cursor = await _history_page(history_input, agent_id)
+
+    async def lines() -> AsyncIterator[str]:
+        async for chat_message in _convert_messages(messages):
+            yield chat_message.model_dump_json() + "\n"
+        if next_cursor is not None:
+            yield f'{{"next_cursor": {next_cursor}}}\n'
+
+    return lines()
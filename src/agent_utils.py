@@ -49,6 +49,9 @@ def langchain_to_chat_message(message: BaseMessage) -> ChatMessage:
                 content=convert_message_content_to_string(message.content),
                 tool_call_id=message.tool_call_id,
             )
+            # e.g. the tool's latency_ms, see agents.tools.create_tool_node()
+            if message.response_metadata:
+                tool_message.response_metadata = message.response_metadata
             return tool_message
         case LangchainChatMessage():
             if message.role == "custom":
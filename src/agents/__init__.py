@@ -1,3 +1,3 @@
-from agents.agents import DEFAULT_AGENT, agents
+from agents.agents import DEFAULT_AGENT, GUARDED_AGENTS, agents
 
-__all__ = ["agents", "DEFAULT_AGENT"]
+__all__ = ["agents", "DEFAULT_AGENT", "GUARDED_AGENTS"]
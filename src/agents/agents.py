@@ -12,3 +12,6 @@ agents: dict[str, CompiledStateGraph] = {
     "research-assistant": research_assistant,
     "bg-task-agent": bg_task_agent,
 }
+
+# Agents checking their input with LlamaGuard
+GUARDED_AGENTS = {"research-assistant"}
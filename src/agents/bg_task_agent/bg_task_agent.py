@@ -3,14 +3,15 @@ import asyncio
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.messages import AIMessage
 from langchain_core.runnables import RunnableConfig, RunnableLambda, RunnableSerializable
-from langgraph.checkpoint.memory import MemorySaver
-from langgraph.graph import END, MessagesState, StateGraph
+from langgraph.graph import END, StateGraph
 
 from agents.bg_task_agent.task import Task
-from agents.models import models
+from agents.context import ContextState, context_manager
+from agents.model_router import model_router
+from checkpointer import BoundedMemorySaver
 
 
-class AgentState(MessagesState, total=False):
+class AgentState(ContextState, total=False):
     """`total=False` is PEP589 specs.
 
     documentation: https://typing.readthedocs.io/en/latest/spec/typeddict.html#totality
@@ -19,19 +20,19 @@ class AgentState(MessagesState, total=False):
 
 def wrap_model(model: BaseChatModel) -> RunnableSerializable[AgentState, AIMessage]:
     preprocessor = RunnableLambda(
-        lambda state: state["messages"],
+        lambda state: context_manager.messages(state),
         name="StateModifier",
     )
     return preprocessor | model
 
 
 async def acall_model(state: AgentState, config: RunnableConfig) -> AgentState:
-    m = models[config["configurable"].get("model", "gpt-4o-mini")]
-    model_runnable = wrap_model(m)
-    response = await model_runnable.ainvoke(state, config)
+    model = config["configurable"].get("model", "gpt-4o-mini")
+    context = await context_manager.asummarize(state, config)
+    response = await model_router.ainvoke(model, wrap_model, {**state, **context}, config)
 
     # We return a list, because this will get added to the existing list
-    return {"messages": [response]}
+    return {"messages": [response], **context}
 
 
 async def bg_task(state: AgentState, config: RunnableConfig) -> AgentState:
@@ -60,5 +61,5 @@ agent.add_edge("bg_task", "model")
 agent.add_edge("model", END)
 
 bg_task_agent = agent.compile(
-    checkpointer=MemorySaver(),
+    checkpointer=BoundedMemorySaver(),
 )
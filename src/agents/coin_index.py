@@ -0,0 +1,111 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+COINGECKO_API_URL = "https://api.coingecko.com/api/v3"
+
+# Many coins share a ticker symbol, these resolve to the coin users almost always mean.
+PREFERRED_COIN_IDS = {
+    "btc": "bitcoin",
+    "eth": "ethereum",
+    "weth": "weth",
+    "usdc": "usd-coin",
+    "usdt": "tether",
+    "dai": "dai",
+    "sol": "solana",
+    "bnb": "binancecoin",
+    "xrp": "ripple",
+    "ada": "cardano",
+    "doge": "dogecoin",
+    "avax": "avalanche-2",
+    "matic": "matic-network",
+    "pol": "polygon-ecosystem-token",
+    "link": "chainlink",
+    "op": "optimism",
+    "arb": "arbitrum",
+    "cbeth": "coinbase-wrapped-staked-eth",
+    "cbbtc": "coinbase-wrapped-btc",
+    "aero": "aerodrome-finance",
+    "degen": "degen-base",
+}
+
+
+class CoinIndex:
+    """
+    Index of CoinGecko coin ids by id, symbol and name.
+
+    The coin list is fetched once from CoinGecko (or read from a local cache file, if
+    configured and fresh) and kept in memory, so symbols like "BTC" resolve to
+    CoinGecko ids without a request per lookup.
+    """
+
+    def __init__(self, path: str | None = None, max_age: float = 24 * 3600) -> None:
+        self.path = path
+        self.max_age = max_age
+        self.ids: set[str] = set()
+        self.symbols: dict[str, str] = {}
+        self.names: dict[str, str] = {}
+        self.loaded = False
+        self._failed_at: float | None = None
+        self._lock = asyncio.Lock()
+
+    def _build(self, coins: list[dict]) -> None:
+        for coin in coins:
+            coin_id = coin["id"]
+            self.ids.add(coin_id)
+            self.symbols.setdefault(coin.get("symbol", "").lower(), coin_id)
+            self.names.setdefault(coin.get("name", "").lower(), coin_id)
+        self.loaded = True
+
+    def _read_cache_file(self) -> list[dict] | None:
+        if not self.path or not os.path.exists(self.path):
+            return None
+        if time.time() - os.path.getmtime(self.path) > self.max_age:
+            return None
+        with open(self.path) as f:
+            return json.load(f)
+
+    def _write_cache_file(self, coins: list[dict]) -> None:
+        if self.path:
+            with open(self.path, "w") as f:
+                json.dump(coins, f)
+
+    async def load(self, client: httpx.AsyncClient) -> None:
+        """Load the index, unless already loaded or a load failed in the last 5 minutes."""
+        if self.loaded or (self._failed_at and time.monotonic() - self._failed_at < 300):
+            return
+        async with self._lock:
+            if self.loaded:
+                return
+            try:
+                coins = await asyncio.to_thread(self._read_cache_file)
+                if coins is None:
+                    response = await client.get(f"{COINGECKO_API_URL}/coins/list")
+                    response.raise_for_status()
+                    coins = response.json()
+                    await asyncio.to_thread(self._write_cache_file, coins)
+                self._build(coins)
+            except (httpx.HTTPError, OSError, ValueError, KeyError, TypeError) as e:
+                logger.warning(f"Unable to load CoinGecko coin index: {e}")
+                self._failed_at = time.monotonic()
+
+    def resolve(self, query: str) -> str | None:
+        """Resolve a symbol, name or id to a CoinGecko id."""
+        key = query.strip().lower()
+        if key in PREFERRED_COIN_IDS:
+            return PREFERRED_COIN_IDS[key]
+        if not self.loaded:
+            # Without the index, the best guess is that the query is already an id
+            return key or None
+        if key in self.ids:
+            return key
+        return self.symbols.get(key) or self.names.get(key)
+
+
+coin_index = CoinIndex(path=os.getenv("COINGECKO_INDEX_PATH"))
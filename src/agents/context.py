@@ -0,0 +1,199 @@
+import json
+import logging
+import os
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+    ToolMessage,
+    trim_messages,
+)
+from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.config import merge_configs
+from langgraph.graph import MessagesState
+
+from agents.model_router import model_router
+from sse import CONTEXT_SUMMARY_TAG
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = """
+    Summarize the conversation below between a user and an AI assistant, so the
+    assistant can continue it without the original messages. Keep facts, decisions,
+    open questions and anything the user asked to remember, leave out small talk.
+    If there is a summary of the earlier conversation, extend it.
+    """
+
+
+class ContextState(MessagesState, total=False):
+    """State of agents using the ContextManager."""
+
+    # Rolling summary of older messages, and the ID of the last message it covers
+    summary: str
+    summarized_until: str
+    # ID of the user message of the turn in which summarizing last failed
+    summary_failed_turn: str
+
+
+def _text(content: str | list) -> str:
+    if isinstance(content, str):
+        return content
+    return "".join(
+        block if isinstance(block, str) else block.get("text", "")
+        for block in content
+        if isinstance(block, str) or block.get("type") == "text"
+    )
+
+
+def count_tokens(messages: list[BaseMessage]) -> int:
+    """
+    Approximate token count of messages, at ~4 characters per token. Much cheaper than
+    the providers' tokenizers, and close enough for budgeting.
+    """
+    chars = 0
+    for message in messages:
+        chars += len(_text(message.content)) + 16
+        if isinstance(message, AIMessage) and message.tool_calls:
+            chars += len(json.dumps([call["args"] for call in message.tool_calls]))
+    return chars // 4
+
+
+def _plain_model(model: BaseChatModel) -> BaseChatModel:
+    # The router caches what a build function returns, so summarization calls use this
+    # named build rather than a lambda
+    return model
+
+
+def _turn_id(messages: list[BaseMessage]) -> str | None:
+    """ID of the user message starting the current turn."""
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage):
+            return message.id
+    return None
+
+
+class ContextManager:
+    """
+    Keeps the messages sent to the model within a token budget.
+
+    Tool outputs longer than `tool_output_chars` are truncated, and only the most recent
+    turns fitting in `max_tokens` are sent. With `summarize`, once the conversation
+    outgrows the budget, its older turns are folded into a rolling summary stored in
+    the graph state and sent in the system prompt. The thread keeps every message.
+    """
+
+    def __init__(
+        self, max_tokens: int = 12000, tool_output_chars: int = 8000, summarize: bool = True
+    ) -> None:
+        self.max_tokens = max_tokens
+        self.tool_output_chars = tool_output_chars
+        self.summarize = summarize
+
+    @classmethod
+    def from_env(cls) -> "ContextManager":
+        return cls(
+            max_tokens=int(os.getenv("CONTEXT_MAX_TOKENS", "12000")),
+            tool_output_chars=int(os.getenv("CONTEXT_TOOL_OUTPUT_CHARS", "8000")),
+            summarize=os.getenv("CONTEXT_SUMMARY", "true") == "true",
+        )
+
+    def _unsummarized(self, state: ContextState) -> list[BaseMessage]:
+        messages = state["messages"]
+        until = state.get("summarized_until")
+        if until:
+            for i, message in enumerate(messages):
+                if message.id == until:
+                    return messages[i + 1 :]
+        return messages
+
+    def _truncate(self, message: BaseMessage) -> BaseMessage:
+        if (
+            isinstance(message, ToolMessage)
+            and isinstance(message.content, str)
+            and len(message.content) > self.tool_output_chars
+        ):
+            dropped = len(message.content) - self.tool_output_chars
+            content = message.content[: self.tool_output_chars]
+            return message.model_copy(
+                update={"content": f"{content}\n[... {dropped} characters truncated]"}
+            )
+        return message
+
+    def _trim(self, messages: list[BaseMessage], max_tokens: int) -> list[BaseMessage]:
+        # Start on a user message so tool calls are never separated from their results
+        trimmed = trim_messages(
+            messages,
+            max_tokens=max_tokens,
+            token_counter=count_tokens,
+            strategy="last",
+            start_on="human",
+        )
+        if trimmed or not messages:
+            return trimmed
+        # The current turn alone is over budget, it still has to be sent
+        for i in range(len(messages) - 1, -1, -1):
+            if isinstance(messages[i], HumanMessage):
+                return messages[i:]
+        return messages
+
+    def messages(
+        self, state: ContextState, system_message: SystemMessage | None = None
+    ) -> list[BaseMessage]:
+        """The messages to send to the model, led by the system message and summary."""
+        messages = [self._truncate(m) for m in self._unsummarized(state)]
+        messages = self._trim(messages, self.max_tokens)
+        summary = state.get("summary")
+        if summary:
+            text = f"Summary of the earlier conversation:\n{summary}"
+            if system_message is None:
+                system_message = SystemMessage(content=text)
+            elif isinstance(system_message.content, str):
+                system_message = SystemMessage(content=f"{system_message.content}\n\n{text}")
+            else:
+                # Appended after the content blocks, so a prompt cache breakpoint still
+                # covers the static instructions
+                block = {"type": "text", "text": text}
+                system_message = SystemMessage(content=[*system_message.content, block])
+        return [system_message, *messages] if system_message is not None else messages
+
+    async def asummarize(self, state: ContextState, config: RunnableConfig) -> ContextState:
+        """
+        Fold the older turns into the summary if the conversation is over budget.
+
+        Returns the state update, empty when there is nothing to summarize. Keeps the
+        most recent turns within half the budget, leaving room for the next ones. After
+        a failure, summarizing isn't retried until the next user turn.
+        """
+        if not self.summarize:
+            return {}
+        turn_id = _turn_id(state["messages"])
+        if turn_id is not None and state.get("summary_failed_turn") == turn_id:
+            return {}
+        messages = [self._truncate(m) for m in self._unsummarized(state)]
+        if count_tokens(messages) <= self.max_tokens:
+            return {}
+        recent = self._trim(messages, self.max_tokens // 2)
+        older = messages[: len(messages) - len(recent)]
+        if not older:
+            return {}
+        prompt = [SystemMessage(content=SUMMARY_PROMPT)]
+        if state.get("summary"):
+            prompt.append(HumanMessage(content=f"Earlier summary:\n{state['summary']}"))
+        transcript = "\n\n".join(f"{m.type}: {_text(m.content)}" for m in older)
+        prompt.append(HumanMessage(content=f"Conversation:\n{transcript}"))
+
+        model = config["configurable"].get("model", "gpt-4o-mini")
+        summary_config = merge_configs(config, RunnableConfig(tags=[CONTEXT_SUMMARY_TAG]))
+        try:
+            response = await model_router.ainvoke(model, _plain_model, prompt, summary_config)
+        except Exception as e:
+            # Trimming alone still keeps the request within budget
+            logger.warning(f"Context summarization failed: {e!r}")
+            return {"summary_failed_turn": turn_id} if turn_id is not None else {}
+        return {"summary": _text(response.content), "summarized_until": older[-1].id}
+
+
+context_manager = ContextManager.from_env()
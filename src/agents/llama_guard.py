@@ -1,11 +1,20 @@
+import asyncio
+import hashlib
+import json
 import os
+import sqlite3
+import threading
+import time
 from enum import Enum
+from functools import cache
 
+import httpx
 from langchain_core.messages import AIMessage, AnyMessage, HumanMessage
 from langchain_core.prompts import PromptTemplate
-from langchain_groq import ChatGroq
 from pydantic import BaseModel, Field
 
+from agents.cache import TTLCache
+
 
 class SafetyAssessment(Enum):
     SAFE = "safe"
@@ -56,6 +65,11 @@ Provide your safety assessment for ONLY THE LAST {{role}} in the above conversat
 - First line must read 'safe' or 'unsafe'.
 - If unsafe, a second line must include a comma-separated list of violated categories."""
 
+llama_guard_prompt = PromptTemplate.from_template(llama_guard_instructions)
+
+# Connection pool for the guard model, shared by every request in the process.
+LLAMA_GUARD_HTTP_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20)
+
 
 def parse_llama_guard_output(output: str) -> LlamaGuardOutput:
     if output == "safe":
@@ -74,42 +88,275 @@ def parse_llama_guard_output(output: str) -> LlamaGuardOutput:
         return LlamaGuardOutput(safety_assessment=SafetyAssessment.ERROR)
 
 
+def _normalize_content(content: str | list[str | dict]) -> str:
+    if isinstance(content, str):
+        return " ".join(content.split())
+    return json.dumps(content, sort_keys=True)
+
+
+class SafetyVerdictCache:
+    """
+    Content-addressed cache of LlamaGuard verdicts.
+
+    Verdicts are keyed on a hash of the checked role and the normalized conversation,
+    held in an in-memory LRU with a TTL and optionally persisted to a SQLite file so
+    they survive restarts. ERROR verdicts are never cached. The async methods run the
+    SQLite queries in a worker thread, off the event loop. Expired rows are deleted when
+    read, and every `prune_every` writes.
+    """
+
+    prune_every = 256
+
+    def __init__(
+        self, maxsize: int = 4096, ttl: float | None = 3600.0, path: str | None = None
+    ) -> None:
+        self.ttl = ttl
+        self.memory: TTLCache[str, LlamaGuardOutput] = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.db: sqlite3.Connection | None = None
+        # The connection is used from worker threads, one query at a time
+        self._db_lock = threading.Lock()
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS verdicts "
+                "(key TEXT PRIMARY KEY, verdict TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS verdicts_created_at ON verdicts (created_at)"
+            )
+            self.db.commit()
+        self._db_writes = 0
+
+    @staticmethod
+    def key(role: str, messages: list[AnyMessage]) -> str:
+        conversation = [
+            [m.type, _normalize_content(m.content)] for m in messages if m.type in ["ai", "human"]
+        ]
+        payload = json.dumps([role, conversation], ensure_ascii=False)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _db_get(self, key: str) -> LlamaGuardOutput | None:
+        with self._db_lock:
+            row = self.db.execute(
+                "SELECT verdict, created_at FROM verdicts WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self.ttl is not None and time.time() - row[1] >= self.ttl:
+                self.db.execute("DELETE FROM verdicts WHERE key = ?", (key,))
+                self.db.commit()
+                return None
+        return LlamaGuardOutput.model_validate_json(row[0])
+
+    def _db_set(self, key: str, verdict: LlamaGuardOutput) -> None:
+        with self._db_lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO verdicts (key, verdict, created_at) VALUES (?, ?, ?)",
+                (key, verdict.model_dump_json(), time.time()),
+            )
+            self._db_writes += 1
+            if self.ttl is not None and self._db_writes % self.prune_every == 0:
+                self.db.execute(
+                    "DELETE FROM verdicts WHERE created_at < ?", (time.time() - self.ttl,)
+                )
+            self.db.commit()
+
+    def get(self, key: str) -> LlamaGuardOutput | None:
+        verdict = self.memory.get(key)
+        if verdict is None and self.db is not None:
+            verdict = self._db_get(key)
+            if verdict is not None:
+                self.memory.set(key, verdict)
+        return verdict
+
+    async def aget(self, key: str) -> LlamaGuardOutput | None:
+        verdict = self.memory.get(key)
+        if verdict is None and self.db is not None:
+            verdict = await asyncio.to_thread(self._db_get, key)
+            if verdict is not None:
+                self.memory.set(key, verdict)
+        return verdict
+
+    def set(self, key: str, verdict: LlamaGuardOutput) -> None:
+        if verdict.safety_assessment == SafetyAssessment.ERROR:
+            return
+        self.memory.set(key, verdict)
+        if self.db is not None:
+            self._db_set(key, verdict)
+
+    async def aset(self, key: str, verdict: LlamaGuardOutput) -> None:
+        if verdict.safety_assessment == SafetyAssessment.ERROR:
+            return
+        self.memory.set(key, verdict)
+        if self.db is not None:
+            await asyncio.to_thread(self._db_set, key, verdict)
+
+
+def _estimate_tokens(message: AnyMessage) -> int:
+    # Rough estimate (~4 characters per token), good enough for budgeting the prompt
+    return len(_normalize_content(message.content)) // 4 + 1
+
+
+def _cache_from_env() -> SafetyVerdictCache | None:
+    maxsize = int(os.getenv("LLAMA_GUARD_CACHE_SIZE", "4096"))
+    if maxsize <= 0:
+        return None
+    ttl = float(os.getenv("LLAMA_GUARD_CACHE_TTL", "3600"))
+    return SafetyVerdictCache(
+        maxsize=maxsize,
+        ttl=ttl if ttl > 0 else None,
+        path=os.getenv("LLAMA_GUARD_CACHE_PATH"),
+    )
+
+
 class LlamaGuard:
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        cache: SafetyVerdictCache | None = None,
+        window_turns: int | None = None,
+        window_tokens: int | None = None,
+    ) -> None:
         if os.getenv("GROQ_API_KEY") is None:
             print("GROQ_API_KEY not set, skipping LlamaGuard")
             self.model = None
             return
-        self.model = ChatGroq(model="llama-guard-3-8b", temperature=0.0).with_config(
+        self.cache = cache if cache is not None else _cache_from_env()
+        # Only the last `window_turns` turns / `window_tokens` tokens of a conversation are
+        # sent to the guard model, 0 sends the whole conversation.
+        if window_turns is None:
+            window_turns = int(os.getenv("LLAMA_GUARD_WINDOW_TURNS", "0"))
+        if window_tokens is None:
+            window_tokens = int(os.getenv("LLAMA_GUARD_WINDOW_TOKENS", "0"))
+        self.window_turns = window_turns
+        self.window_tokens = window_tokens
+        from langchain_groq import ChatGroq
+
+        self.model = ChatGroq(
+            model="llama-guard-3-8b",
+            temperature=0.0,
+            http_client=httpx.Client(limits=LLAMA_GUARD_HTTP_LIMITS),
+            http_async_client=httpx.AsyncClient(limits=LLAMA_GUARD_HTTP_LIMITS),
+        ).with_config(
             tags=["llama_guard"],
         )
-        self.prompt = PromptTemplate.from_template(llama_guard_instructions)
+        self.prompt = llama_guard_prompt
+
+    def _window(self, messages: list[AnyMessage]) -> tuple[list[AnyMessage], list[AnyMessage]]:
+        """Split the conversation into earlier turns and the window checked by the guard."""
+        conversation = [m for m in messages if m.type in ["ai", "human"]]
+        start = 0
+        if self.window_turns > 0:
+            turn_starts = [i for i, m in enumerate(conversation) if m.type == "human"]
+            if len(turn_starts) > self.window_turns:
+                start = turn_starts[-self.window_turns]
+        if self.window_tokens > 0:
+            tokens = sum(_estimate_tokens(m) for m in conversation[start:])
+            # Always keep the last message, it is the one being assessed
+            while tokens > self.window_tokens and start < len(conversation) - 1:
+                tokens -= _estimate_tokens(conversation[start])
+                start += 1
+        return conversation[:start], conversation[start:]
+
+    def _earlier_keys(self, earlier: list[AnyMessage]) -> list[str]:
+        """Cache keys the turns before the window were last checked under, best first."""
+        if self.cache is None or not earlier:
+            return []
+        keys = [self.cache.key("Agent", earlier)]
+        last_human = max((i for i, m in enumerate(earlier) if m.type == "human"), default=-1)
+        if last_human >= 0:
+            keys.append(self.cache.key("User", earlier[: last_human + 1]))
+        return keys
+
+    def _earlier_verdict(self, earlier: list[AnyMessage]) -> LlamaGuardOutput | None:
+        """Verdict cached when the turns before the window were last checked, if any."""
+        for key in self._earlier_keys(earlier):
+            if verdict := self.cache.get(key):
+                return verdict
+        return None
+
+    async def _aearlier_verdict(self, earlier: list[AnyMessage]) -> LlamaGuardOutput | None:
+        for key in self._earlier_keys(earlier):
+            if verdict := await self.cache.aget(key):
+                return verdict
+        return None
 
     def _compile_prompt(self, role: str, messages: list[AnyMessage]) -> str:
+        earlier, window = self._window(messages)
+        return self._format_prompt(role, earlier, window, self._earlier_verdict(earlier))
+
+    async def _acompile_prompt(self, role: str, messages: list[AnyMessage]) -> str:
+        earlier, window = self._window(messages)
+        return self._format_prompt(role, earlier, window, await self._aearlier_verdict(earlier))
+
+    def _format_prompt(
+        self,
+        role: str,
+        earlier: list[AnyMessage],
+        window: list[AnyMessage],
+        verdict: LlamaGuardOutput | None,
+    ) -> str:
         role_mapping = {"ai": "Agent", "human": "User"}
-        messages_str = [
-            f"{role_mapping[m.type]}: {m.content}" for m in messages if m.type in ["ai", "human"]
-        ]
+        messages_str = [f"{role_mapping[m.type]}: {m.content}" for m in window]
+        if earlier:
+            summary = f"[{len(earlier)} earlier messages omitted"
+            if verdict:
+                summary += f", previously assessed as {verdict.safety_assessment.value}"
+                if verdict.unsafe_categories:
+                    summary += f" ({', '.join(verdict.unsafe_categories)})"
+            messages_str.insert(0, summary + "]")
         conversation_history = "\n\n".join(messages_str)
         return self.prompt.format(role=role, conversation_history=conversation_history)
 
+    def _cached_verdict(
+        self, role: str, messages: list[AnyMessage]
+    ) -> tuple[str | None, LlamaGuardOutput | None]:
+        if self.cache is None:
+            return None, None
+        key = self.cache.key(role, messages)
+        return key, self.cache.get(key)
+
+    def _store_verdict(self, key: str | None, output: LlamaGuardOutput) -> LlamaGuardOutput:
+        if self.cache is not None and key is not None:
+            self.cache.set(key, output)
+        return output
+
+    async def _astore_verdict(self, key: str | None, output: LlamaGuardOutput) -> LlamaGuardOutput:
+        if self.cache is not None and key is not None:
+            await self.cache.aset(key, output)
+        return output
+
     def invoke(self, role: str, messages: list[AnyMessage]) -> LlamaGuardOutput:
         if self.model is None:
             return LlamaGuardOutput(safety_assessment=SafetyAssessment.SAFE)
+        key, cached = self._cached_verdict(role, messages)
+        if cached is not None:
+            return cached
         compiled_prompt = self._compile_prompt(role, messages)
         result = self.model.invoke([HumanMessage(content=compiled_prompt)])
-        return parse_llama_guard_output(result.content)
+        return self._store_verdict(key, parse_llama_guard_output(result.content))
 
     async def ainvoke(self, role: str, messages: list[AnyMessage]) -> LlamaGuardOutput:
         if self.model is None:
             return LlamaGuardOutput(safety_assessment=SafetyAssessment.SAFE)
-        compiled_prompt = self._compile_prompt(role, messages)
+        key, cached = None, None
+        if self.cache is not None:
+            key = self.cache.key(role, messages)
+            cached = await self.cache.aget(key)
+        if cached is not None:
+            return cached
+        compiled_prompt = await self._acompile_prompt(role, messages)
         result = await self.model.ainvoke([HumanMessage(content=compiled_prompt)])
-        return parse_llama_guard_output(result.content)
+        return await self._astore_verdict(key, parse_llama_guard_output(result.content))
+
+
+@cache
+def get_llama_guard() -> LlamaGuard:
+    """Get the process-wide LlamaGuard, creating it on first use."""
+    return LlamaGuard()
 
 
 if __name__ == "__main__":
-    llama_guard = LlamaGuard()
+    llama_guard = get_llama_guard()
     output = llama_guard.invoke(
         "Agent",
         [
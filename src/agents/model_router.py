@@ -0,0 +1,421 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from collections.abc import Callable, Mapping
+from typing import Any
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from agents.models import ModelRegistry, models
+
+logger = logging.getLogger(__name__)
+
+# Errors worth retrying or failing over on, matched by status code or exception name
+# since every provider SDK has its own exception types.
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+RETRYABLE_ERROR_NAMES = {
+    "APIConnectionError",
+    "APITimeoutError",
+    "ConnectError",
+    "DeadlineExceeded",
+    "InternalServerError",
+    "ReadTimeout",
+    "ResourceExhausted",
+    "ServiceUnavailable",
+    "ThrottlingException",
+    "TimeoutError",
+    "TimeoutException",
+}
+RATE_LIMIT_ERROR_NAMES = {"RateLimitError", "ResourceExhausted", "ThrottlingException"}
+
+# Models that can stand in for each other
+DEFAULT_FAILOVER_GROUPS = [
+    ["gpt-4o-mini", "claude-3-haiku", "gemini-1.5-flash", "bedrock-haiku", "llama-3.1-70b"],
+]
+
+
+def _status_code(e: Exception) -> int | None:
+    status_code = getattr(e, "status_code", None) or getattr(e, "code", None)
+    return status_code if isinstance(status_code, int) else None
+
+
+def is_retryable(e: Exception) -> bool:
+    return (
+        _status_code(e) in RETRYABLE_STATUS_CODES
+        or type(e).__name__ in RETRYABLE_ERROR_NAMES
+        or isinstance(e, asyncio.TimeoutError)
+    )
+
+
+def _retry_after(e: Exception) -> float | None:
+    """The provider's Retry-After hint in seconds, if the error carries one."""
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None)
+    try:
+        return float(headers["retry-after"]) if headers and "retry-after" in headers else None
+    except (TypeError, ValueError):
+        return None
+
+
+class Budget:
+    """Requests and tokens used by a model in the last minute, against optional limits."""
+
+    def __init__(self, rpm: int | None = None, tpm: int | None = None) -> None:
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests: deque[float] = deque()
+        self._tokens: deque[tuple[float, int]] = deque()
+        self._token_total = 0
+
+    def _expire(self, now: float) -> None:
+        while self._requests and now - self._requests[0] > 60:
+            self._requests.popleft()
+        while self._tokens and now - self._tokens[0][0] > 60:
+            self._token_total -= self._tokens.popleft()[1]
+
+    def has_capacity(self) -> bool:
+        self._expire(time.monotonic())
+        return (self.rpm is None or len(self._requests) < self.rpm) and (
+            self.tpm is None or self._token_total < self.tpm
+        )
+
+    def record_request(self) -> None:
+        self._requests.append(time.monotonic())
+
+    def record_tokens(self, tokens: int) -> None:
+        self._tokens.append((time.monotonic(), tokens))
+        self._token_total += tokens
+
+
+class ModelHealth:
+    """Moving averages of a model's latency and error rate, and rate-limit cooldown."""
+
+    def __init__(self) -> None:
+        self.latency = 1.0
+        self.error_rate = 0.0
+        self.cooldown_until = 0.0
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.cooldown_until
+
+    def score(self) -> float:
+        """Lower is better: slow or failing models sort last."""
+        return self.latency * (1 + 4 * self.error_rate)
+
+    def record_success(self, latency: float) -> None:
+        self.requests += 1
+        self.latency = 0.8 * self.latency + 0.2 * latency
+        self.error_rate *= 0.8
+
+    def record_failure(self, e: Exception) -> None:
+        self.requests += 1
+        self.errors += 1
+        self.error_rate = 0.8 * self.error_rate + 0.2
+        if _status_code(e) == 429 or type(e).__name__ in RATE_LIMIT_ERROR_NAMES:
+            self.cooldown_until = time.monotonic() + (_retry_after(e) or 5.0)
+
+
+# Tier aliases accepted as model names, routed to the fastest healthy member
+DEFAULT_TIERS = {
+    "fast": ["gemini-1.5-flash", "claude-3-haiku", "bedrock-haiku", "gpt-4o-mini"],
+    "smart": ["gpt-4o-mini", "llama-3.1-70b", "claude-3-haiku"],
+}
+
+
+def _percentile(samples: list[float], percentile: float) -> float | None:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * percentile), len(ordered) - 1)]
+
+
+class ModelStats(BaseCallbackHandler):
+    """
+    Rolling time-to-first-token and output tokens/sec of a model, over its last
+    `window` calls. Attached as a callback to the model's runs.
+    """
+
+    # Only records timestamps, no need to run in an executor
+    run_inline = True
+
+    def __init__(self, window: int = 200) -> None:
+        self.ttft: deque[float] = deque(maxlen=window)
+        self.tokens_per_second: deque[float] = deque(maxlen=window)
+        self._runs: dict[UUID, list] = {}
+
+    def on_chat_model_start(
+        self, serialized: Any, messages: Any, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        # Start time, first token time and streamed token count
+        self._runs[run_id] = [time.monotonic(), None, 0]
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.get(run_id)
+        if run is not None and token:
+            if run[1] is None:
+                run[1] = time.monotonic()
+            run[2] += 1
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        start, first_token, tokens = run
+        end = time.monotonic()
+        # Without streaming, the first token arrives with the whole response
+        first_token = first_token or end
+        message = (
+            getattr(response.generations[0][0], "message", None) if response.generations else None
+        )
+        usage = getattr(message, "usage_metadata", None)
+        if usage:
+            tokens = usage["output_tokens"]
+        self.ttft.append(first_token - start)
+        # Generation speed after the first token, or overall for non-streaming models
+        duration = end - first_token if end - first_token > 0.01 else end - start
+        if tokens and duration > 0:
+            self.tokens_per_second.append(tokens / duration)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._runs.pop(run_id, None)
+
+    def summary(self) -> dict[str, float | int | None]:
+        ttft, tps = list(self.ttft), list(self.tokens_per_second)
+        return {
+            "samples": len(ttft),
+            "ttft_p50": _percentile(ttft, 0.5),
+            "ttft_p95": _percentile(ttft, 0.95),
+            "tokens_per_second_p50": _percentile(tps, 0.5),
+            "tokens_per_second_p95": _percentile(tps, 0.95),
+        }
+
+
+def record_prompt_cache(response: AIMessage) -> None:
+    """
+    Report prompt cache usage in the response metadata, in the same shape for every
+    provider: `{"cache_read": tokens, "cache_creation": tokens, "input_tokens": tokens}`.
+    """
+    usage = response.usage_metadata
+    details = (usage or {}).get("input_token_details") or {}
+    if "cache_read" in details or "cache_creation" in details:
+        response.response_metadata["prompt_cache"] = {
+            "cache_read": details.get("cache_read", 0),
+            "cache_creation": details.get("cache_creation", 0),
+            "input_tokens": usage["input_tokens"],
+        }
+
+
+def _parse_mapping(value: str) -> dict[str, int]:
+    pairs = (item.split("=", 1) for item in value.split(",") if "=" in item)
+    return {key.strip(): int(value) for key, value in pairs}
+
+
+class ModelRouter:
+    """
+    Calls models from the registry with retries and failover.
+
+    Retryable errors (rate limits, timeouts, server errors) are retried up to
+    `max_attempts` times per model with jittered exponential backoff. After that, or
+    straight away when the model is rate limited or over its budget, the call fails
+    over to the other models of its failover group, healthiest first.
+
+    Tier aliases (e.g. "fast", "smart") can be used as model names, they resolve to the
+    tier member with the lowest median time-to-first-token that is currently usable.
+    """
+
+    def __init__(
+        self,
+        registry: Mapping[str, BaseChatModel],
+        failover_groups: list[list[str]] | None = None,
+        max_attempts: int = 2,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        rpm: dict[str, int] | None = None,
+        tpm: dict[str, int] | None = None,
+        tiers: dict[str, list[str]] | None = None,
+    ) -> None:
+        self.registry = registry
+        self.tiers = tiers if tiers is not None else DEFAULT_TIERS
+        self.failover_groups = (
+            failover_groups if failover_groups is not None else DEFAULT_FAILOVER_GROUPS
+        )
+        self.max_attempts = max(max_attempts, 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._rpm = rpm or {}
+        self._tpm = tpm or {}
+        self.health: dict[str, ModelHealth] = {}
+        self.budgets: dict[str, Budget] = {}
+        self.stats: dict[str, ModelStats] = {}
+        # Built runnables by (build, model name), with the model they were built from
+        self._runnables: dict[tuple[Callable, str], tuple[BaseChatModel, Runnable]] = {}
+        self.failovers = 0
+
+    @classmethod
+    def from_env(cls, registry: Mapping[str, BaseChatModel]) -> "ModelRouter":
+        groups = os.getenv("MODEL_FAILOVER_GROUPS")
+        tiers = os.getenv("MODEL_TIERS")
+        return cls(
+            registry,
+            failover_groups=[group.split("|") for group in groups.split(";")] if groups else None,
+            max_attempts=int(os.getenv("MODEL_RETRY_ATTEMPTS", "2")),
+            rpm=_parse_mapping(os.getenv("MODEL_RPM", "")),
+            tpm=_parse_mapping(os.getenv("MODEL_TPM", "")),
+            tiers={
+                alias: members.split("|")
+                for alias, members in (tier.split("=", 1) for tier in tiers.split(";"))
+            }
+            if tiers
+            else None,
+        )
+
+    def _health(self, model: str) -> ModelHealth:
+        return self.health.setdefault(model, ModelHealth())
+
+    def _budget(self, model: str) -> Budget:
+        if model not in self.budgets:
+            self.budgets[model] = Budget(self._rpm.get(model), self._tpm.get(model))
+        return self.budgets[model]
+
+    def _stats(self, model: str) -> ModelStats:
+        return self.stats.setdefault(model, ModelStats())
+
+    def _runnable(
+        self, name: str, build: Callable[[BaseChatModel], Runnable[Any, AIMessage]]
+    ) -> Runnable[Any, AIMessage]:
+        """
+        `build(registry[name])` with the model's stats callback, built once per agent and
+        model so tool binding and prompt setup stay out of every call.
+        """
+        model = self.registry[name]
+        cached = self._runnables.get((build, name))
+        # Rebuild if the registry entry was replaced
+        if cached is None or cached[0] is not model:
+            runnable = build(model).with_config(callbacks=[self._stats(name)])
+            cached = self._runnables[(build, name)] = (model, runnable)
+        return cached[1]
+
+    def _speed(self, model: str) -> float:
+        """Expected time to first token, from live stats once there are enough samples."""
+        stats = self._stats(model)
+        ttft = _percentile(list(stats.ttft), 0.5) if len(stats.ttft) >= 5 else None
+        health = self._health(model)
+        return (ttft if ttft is not None else health.latency) * (1 + 4 * health.error_rate)
+
+    def resolve(self, model: str) -> str:
+        """Resolve a tier alias to the fastest usable model of the tier."""
+        if model not in self.tiers:
+            return model
+        members = [name for name in self.tiers[model] if name in self.registry]
+        if not members:
+            raise KeyError(model)
+        usable = [name for name in members if self._usable(name)] or members
+        return min(usable, key=self._speed)
+
+    def _usable(self, model: str) -> bool:
+        return self._health(model).available and self._budget(model).has_capacity()
+
+    def candidates(self, model: str) -> list[str]:
+        """The requested model, then its usable alternatives from best to worst."""
+        alternatives = {
+            name
+            for group in self.failover_groups
+            if model in group
+            for name in group
+            if name != model and name in self.registry and self._usable(name)
+        }
+        ranked = sorted(alternatives, key=lambda name: self._health(name).score())
+        if self._usable(model) or not ranked:
+            return [model, *ranked]
+        return ranked
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    async def ainvoke(
+        self,
+        model: str,
+        build: Callable[[BaseChatModel], Runnable[Any, AIMessage]],
+        input: Any,
+        config: RunnableConfig | None = None,
+    ) -> AIMessage:
+        """
+        Invoke `build(registry[model])`, retrying and failing over on provider errors.
+        `build` should be a module level function, its results are cached per model.
+
+        Failed attempts may already have streamed tokens. When there were any, the
+        response has `response_metadata["failed_attempts"]` set, so clients know to
+        replace the streamed text with the message content.
+        """
+        model = self.resolve(model)
+        if model not in self.registry:
+            raise KeyError(model)
+        error: Exception | None = None
+        failed_attempts = 0
+        for name in self.candidates(model):
+            if isinstance(self.registry, ModelRegistry):
+                # Building a model imports its provider package, keep it off the event loop
+                await self.registry.aget(name)
+            runnable = self._runnable(name, build)
+            health, budget = self._health(name), self._budget(name)
+            for attempt in range(self.max_attempts):
+                budget.record_request()
+                start = time.monotonic()
+                try:
+                    response = await runnable.ainvoke(input, config)
+                except Exception as e:
+                    if not is_retryable(e):
+                        raise
+                    health.record_failure(e)
+                    logger.warning(f"Model {name} failed (attempt {attempt + 1}): {e!r}")
+                    error = e
+                    failed_attempts += 1
+                    if attempt + 1 < self.max_attempts and health.available:
+                        await asyncio.sleep(self._backoff(attempt))
+                        continue
+                    break
+                health.record_success(time.monotonic() - start)
+                if response.usage_metadata:
+                    budget.record_tokens(response.usage_metadata["total_tokens"])
+                    record_prompt_cache(response)
+                if failed_attempts:
+                    response.response_metadata["failed_attempts"] = failed_attempts
+                if name != model:
+                    self.failovers += 1
+                    logger.info(f"Failed over from model {model} to {name}")
+                return response
+        if error is None:
+            raise RuntimeError(f"No model to invoke for '{model}'")
+        raise error
+
+    def summary(self) -> dict[str, Any]:
+        """Live statistics of every model that has been called, and current tier routing."""
+        models_summary = {
+            name: {
+                **self._stats(name).summary(),
+                "error_rate": round(health.error_rate, 3),
+                "available": health.available,
+            }
+            for name, health in self.health.items()
+        }
+        tiers = {}
+        for alias in self.tiers:
+            try:
+                tiers[alias] = self.resolve(alias)
+            except KeyError:
+                tiers[alias] = None
+        return {"models": models_summary, "tiers": tiers, "failovers": self.failovers}
+
+
+model_router = ModelRouter.from_env(models)
@@ -1,31 +1,150 @@
+import asyncio
 import os
+import threading
+from collections.abc import Callable, Iterable, Iterator, Mapping, MutableMapping
 
-from langchain_anthropic import ChatAnthropic
-from langchain_aws import ChatBedrock
 from langchain_core.language_models.chat_models import BaseChatModel
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_groq import ChatGroq
-from langchain_openai import ChatOpenAI
+from langchain_core.messages import SystemMessage
+
+# Provider packages are imported by the factories, only when a model is first used.
+
+
+def _gpt_4o_mini() -> BaseChatModel:
+    from langchain_openai import ChatOpenAI
+
+    # stream_usage reports token usage, including cached prompt tokens, when streaming
+    return ChatOpenAI(model="gpt-4o-mini", temperature=0.5, streaming=True, stream_usage=True)
+
+
+def _llama_3_1_70b() -> BaseChatModel:
+    from langchain_groq import ChatGroq
+
+    return ChatGroq(model="llama-3.1-70b-versatile", temperature=0.5)
+
+
+def _gemini_1_5_flash() -> BaseChatModel:
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return ChatGoogleGenerativeAI(model="gemini-1.5-flash", temperature=0.5, streaming=True)
+
+
+def _claude_3_haiku() -> BaseChatModel:
+    from langchain_anthropic import ChatAnthropic
+
+    return ChatAnthropic(model="claude-3-haiku-20240307", temperature=0.5, streaming=True)
+
+
+def _bedrock_haiku() -> BaseChatModel:
+    from langchain_aws import ChatBedrock
+
+    return ChatBedrock(model_id="anthropic.claude-3-5-haiku-20241022-v1:0", temperature=0.5)
+
+
+def system_prompt(instructions: str, model: BaseChatModel) -> SystemMessage:
+    """
+    System message for `model`, marked as a prompt cache breakpoint where the provider
+    needs it. Anthropic caches the prefix up to the breakpoint, covering the tool schemas
+    and the system prompt. OpenAI caches long prompt prefixes automatically.
+    """
+    if model._llm_type == "anthropic-chat":
+        block = {"type": "text", "text": instructions, "cache_control": {"type": "ephemeral"}}
+        return SystemMessage(content=[block])
+    return SystemMessage(content=instructions)
+
+
+class ModelRegistry(MutableMapping[str, BaseChatModel]):
+    """
+    Chat models by name, each built (and its provider package imported) on first access.
+
+    Membership and iteration only look at which models are configured, so checking or
+    listing models doesn't construct anything. Models can also be set directly.
+    """
+
+    def __init__(self, factories: Mapping[str, Callable[[], BaseChatModel]]) -> None:
+        self._factories = dict(factories)
+        self._instances: dict[str, BaseChatModel] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name: str) -> BaseChatModel:
+        model = self._instances.get(name)
+        if model is None:
+            with self._lock:
+                model = self._instances.get(name)
+                if model is None:
+                    model = self._factories[name]()
+                    self._instances[name] = model
+        return model
+
+    async def aget(self, name: str) -> BaseChatModel:
+        """Like `registry[name]`, building the model in a worker thread on first access."""
+        model = self._instances.get(name)
+        if model is None:
+            model = await asyncio.to_thread(self.__getitem__, name)
+        return model
+
+    def __setitem__(self, name: str, model: BaseChatModel) -> None:
+        self._instances[name] = model
+        self._factories.pop(name, None)
+
+    def __delitem__(self, name: str) -> None:
+        if name not in self:
+            raise KeyError(name)
+        self._instances.pop(name, None)
+        self._factories.pop(name, None)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._instances or name in self._factories
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._instances
+        yield from (name for name in self._factories if name not in self._instances)
+
+    def __len__(self) -> int:
+        return len(self._instances.keys() | self._factories.keys())
+
+    def copy(self) -> "ModelRegistry":
+        registry = ModelRegistry(self._factories)
+        registry._instances = dict(self._instances)
+        return registry
+
+    def update(self, other: Mapping[str, BaseChatModel] = (), /, **kwargs: BaseChatModel) -> None:
+        if isinstance(other, ModelRegistry):
+            # Keep the other registry's models lazy
+            self._factories.update(other._factories)
+            self._instances.update(other._instances)
+            other = {}
+        super().update(other, **kwargs)
+
+    def clear(self) -> None:
+        self._factories.clear()
+        self._instances.clear()
+
+    def built(self) -> list[str]:
+        """Names of the models constructed so far."""
+        return list(self._instances)
+
+    def warm_up(self, names: Iterable[str]) -> None:
+        """Build the given models ahead of their first request, skipping unknown ones."""
+        for name in names:
+            if name in self:
+                self[name]
+
 
 # NOTE: models with streaming=True will send tokens as they are generated
 # if the /stream endpoint is called with stream_tokens=True (the default)
-models: dict[str, BaseChatModel] = {}
+_factories: dict[str, Callable[[], BaseChatModel]] = {}
 if os.getenv("OPENAI_API_KEY") is not None:
-    models["gpt-4o-mini"] = ChatOpenAI(model="gpt-4o-mini", temperature=0.5, streaming=True)
+    _factories["gpt-4o-mini"] = _gpt_4o_mini
 if os.getenv("GROQ_API_KEY") is not None:
-    models["llama-3.1-70b"] = ChatGroq(model="llama-3.1-70b-versatile", temperature=0.5)
+    _factories["llama-3.1-70b"] = _llama_3_1_70b
 if os.getenv("GOOGLE_API_KEY") is not None:
-    models["gemini-1.5-flash"] = ChatGoogleGenerativeAI(
-        model="gemini-1.5-flash", temperature=0.5, streaming=True
-    )
+    _factories["gemini-1.5-flash"] = _gemini_1_5_flash
 if os.getenv("ANTHROPIC_API_KEY") is not None:
-    models["claude-3-haiku"] = ChatAnthropic(
-        model="claude-3-haiku-20240307", temperature=0.5, streaming=True
-    )
+    _factories["claude-3-haiku"] = _claude_3_haiku
 if os.getenv("USE_AWS_BEDROCK") == "true":
-    models["bedrock-haiku"] = ChatBedrock(
-        model_id="anthropic.claude-3-5-haiku-20241022-v1:0", temperature=0.5
-    )
+    _factories["bedrock-haiku"] = _bedrock_haiku
+
+models = ModelRegistry(_factories)
 
 if not models:
     print("No LLM available. Please set environment variables to enable at least one LLM.")
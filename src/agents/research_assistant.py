@@ -1,27 +1,58 @@
+import asyncio
 import os
 from datetime import datetime
+from decimal import Decimal
+from functools import cache
 from typing import Literal
-import requests
 
-from langchain_community.tools import DuckDuckGoSearchResults
+import httpx
+from langchain_core.callbacks import adispatch_custom_event
 from langchain_core.language_models.chat_models import BaseChatModel
-from langchain_core.messages import AIMessage, SystemMessage
+from langchain_core.messages import AIMessage
 from langchain_core.runnables import RunnableConfig, RunnableLambda, RunnableSerializable
-from langgraph.checkpoint.memory import MemorySaver
-from langgraph.graph import END, MessagesState, StateGraph
+from langchain_core.runnables.config import merge_configs
+from langchain_core.tools import BaseTool, tool
+from langgraph.graph import END, StateGraph
 from langgraph.managed import IsLastStep
-from langgraph.prebuilt import ToolNode
 
-from agents.llama_guard import LlamaGuard, LlamaGuardOutput, SafetyAssessment
-from agents.models import models
-from agents.tools import calculator
+from agents.cache import TTLCache
+from agents.coin_index import COINGECKO_API_URL, coin_index
+from agents.context import ContextState, context_manager
+from agents.llama_guard import LlamaGuardOutput, SafetyAssessment, get_llama_guard
+from agents.model_router import model_router
+from agents.models import system_prompt
+from agents.tools import calculator, create_tool_node
+from agents.utils import get_http_client
+from checkpointer import BoundedMemorySaver
+from sse import SPECULATIVE_TAG, SPECULATIVE_VERDICT_EVENT
 
-import requests
+
+class AgentState(ContextState, total=False):
+    """`total=False` is PEP589 specs.
+
+    documentation: https://typing.readthedocs.io/en/latest/spec/typeddict.html#totality
+    """
+
+    safety: LlamaGuardOutput
+    is_last_step: IsLastStep
+
+
+# Run the input safety check concurrently with the first model call instead of before it.
+SPECULATIVE_GUARD = os.getenv("LLAMA_GUARD_SPECULATIVE") == "true"
+
+
+def format_price(price: float) -> str:
+    """Price with 8 significant digits in fixed-point notation, e.g. 0.000012 not 1.2e-05."""
+    return format(Decimal(f"{price:.8g}"), "f")
 
 
 class DevBotTools:
+    # Successful results are cached per query; prices go stale much faster than search results
+    search_cache: TTLCache[str, dict] = TTLCache(maxsize=1024, ttl=600)
+    price_cache: TTLCache[str, float] = TTLCache(maxsize=4096, ttl=30)
+
     @staticmethod
-    def base_network_info(query: str) -> dict:
+    async def base_network_info(query: str) -> dict:
         """
         Perform a general internet search to retrieve information about the Base network.
 
@@ -31,6 +62,10 @@ class DevBotTools:
         Returns:
         - dict: A dictionary containing the search results or a helpful error message.
         """
+        cache_key = " ".join(query.lower().split())
+        if cached := DevBotTools.search_cache.get(cache_key):
+            return cached
+
         # Updated to use DuckDuckGo Search API with better error handling
         search_url = "https://api.duckduckgo.com/"
         params = {
@@ -40,9 +75,11 @@ class DevBotTools:
             "skip_disambig": 1,
         }
         try:
-            response = requests.get(search_url, params=params, timeout=10)
+            response = await get_http_client().get(search_url, params=params)
             response.raise_for_status()
             search_results = response.json()
+            if not isinstance(search_results, dict):
+                raise ValueError("Unexpected search response")
             results = search_results.get("RelatedTopics", [])
 
             # Process and format results
@@ -52,60 +89,111 @@ class DevBotTools:
                     for item in results
                     if "Text" in item and "FirstURL" in item
                 ]
-                return {"results": processed_results[:5]}  # Return the top 5 results
-
-            return {"message": "No relevant results found for your query."}
-        except requests.Timeout:
+                output = {"results": processed_results[:5]}  # Return the top 5 results
+            else:
+                output = {"message": "No relevant results found for your query."}
+            DevBotTools.search_cache.set(cache_key, output)
+            return output
+        except httpx.TimeoutException:
             return {
                 "error": "Timeout Error",
                 "message": "The search request timed out. Please try again.",
             }
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             return {"error": "Network Error", "message": str(e)}
+        except ValueError:
+            return {
+                "error": "Invalid Response",
+                "message": "The search service returned an invalid response. Please try again.",
+            }
 
     @staticmethod
-    def crypto_price(query: str) -> dict:
+    async def crypto_prices(symbols: list[str]) -> dict:
         """
-        Fetch current cryptocurrency prices.
+        Fetch current USD prices for one or more cryptocurrencies in a single request.
 
         Parameters:
-        - query (str): The cryptocurrency name or symbol (e.g., BTC, ETH, Bitcoin).
+        - symbols (list[str]): Cryptocurrency symbols, names or CoinGecko ids
+          (e.g., ["BTC", "ethereum", "Solana"]).
 
         Returns:
-        - dict: A dictionary containing the current price in USD or an error message.
+        - dict: A compact table of prices in USD, or an error message.
         """
-        url = "https://api.coingecko.com/api/v3/simple/price"
-        # Format the query to ensure it's compatible with CoinGecko's API
-        params = {"ids": query.lower(), "vs_currencies": "usd"}
-        try:
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-
-            # Parse response
-            data = response.json()
-            if query.lower() in data:
-                price = data[query.lower()]["usd"]
-                return {"message": f"The current price of {query.upper()} is ${price:.2f} USD."}
-            else:
+        client = get_http_client()
+        await coin_index.load(client)
+        resolved = {symbol: coin_index.resolve(symbol) for symbol in symbols}
+        prices = {
+            coin_id: DevBotTools.price_cache.get(coin_id)
+            for coin_id in set(resolved.values())
+            if coin_id
+        }
+        missing = sorted(coin_id for coin_id, price in prices.items() if price is None)
+        if missing:
+            url = f"{COINGECKO_API_URL}/simple/price"
+            params = {"ids": ",".join(missing), "vs_currencies": "usd"}
+            try:
+                response = await client.get(url, params=params)
+                response.raise_for_status()
+                data = response.json()
+            except httpx.TimeoutException:
                 return {
-                    "message": f"Unable to retrieve the price for '{query}'. Please check the cryptocurrency name or symbol."
+                    "error": "Timeout Error",
+                    "message": "The request to CoinGecko timed out. Please try again later.",
                 }
-        except requests.Timeout:
-            return {
-                "error": "Timeout Error",
-                "message": "The request to CoinGecko timed out. Please try again later.",
-            }
-        except requests.RequestException as e:
-            return {"error": "Network Error", "message": str(e)}
+            except httpx.HTTPError as e:
+                return {"error": "Network Error", "message": str(e)}
+            except ValueError:
+                data = None
+            # Error payloads can be lists or strings
+            if not isinstance(data, dict):
+                return {
+                    "error": "Invalid Response",
+                    "message": "CoinGecko returned an invalid response. Please try again later.",
+                }
+            for coin_id in missing:
+                entry = data.get(coin_id)
+                if isinstance(entry, dict) and "usd" in entry:
+                    prices[coin_id] = entry["usd"]
+                    DevBotTools.price_cache.set(coin_id, prices[coin_id])
+
+        rows = ["symbol|id|usd"]
+        unknown = []
+        for symbol, coin_id in resolved.items():
+            price = prices.get(coin_id) if coin_id else None
+            if price is None:
+                unknown.append(symbol)
+            else:
+                rows.append(f"{symbol.upper()}|{coin_id}|{format_price(price)}")
+        output: dict = {"prices": "\n".join(rows)}
+        if unknown:
+            output["message"] = (
+                f"Unable to retrieve the price for {', '.join(unknown)}. "
+                "Please check the cryptocurrency name or symbol."
+            )
+        return output
+
+
+@cache
+def _duckduckgo_search() -> BaseTool:
+    # langchain_community is slow to import, only load it for the first search
+    from langchain_community.tools import DuckDuckGoSearchResults
+
+    return DuckDuckGoSearchResults(name="WebSearch")
+
+
+@tool("WebSearch")
+async def web_search(query: str) -> str:
+    """A wrapper around Duck Duck Go Search. Useful for when you need to answer questions
+    about current events. Input should be a search query."""
+    return await _duckduckgo_search().ainvoke(query)
 
 
-web_search = DuckDuckGoSearchResults(name="WebSearch")
 python_repl = calculator  # Repurpose calculator for code and math execution
 tools = [web_search, python_repl]
 
 # Add tools specific to blockchain and Base network
 tools.append(DevBotTools.base_network_info)
-tools.append(DevBotTools.crypto_price)
+tools.append(DevBotTools.crypto_prices)
 
 # Define system instructions for DevBot
 current_date = datetime.now().strftime("%B %d, %Y")
@@ -116,16 +204,18 @@ instructions = f"""
     A few things to remember:
     - Always confirm the developer's requirements before providing code examples or blockchain resources.
     - Provide concise, accurate answers to coding, blockchain, or cryptocurrency queries.
-    - Use the Base Network Info tool to fetch Base-specific information, and the Crypto Price tool for real-time cryptocurrency data.
+    - Use the Base Network Info tool to fetch Base-specific information, and the Crypto Prices tool for real-time cryptocurrency data. Look up all the coins you need in a single Crypto Prices call.
     - Use markdown-formatted links for any citations or documentation references.
     - For coding tasks, generate examples with detailed explanations.
     """
 
 
-def wrap_model(model: BaseChatModel) -> RunnableSerializable[MessagesState, AIMessage]:
+def wrap_model(model: BaseChatModel) -> RunnableSerializable[AgentState, AIMessage]:
+    # Built once per model by the model router, see ModelRouter._runnable()
+    system_message = system_prompt(instructions, model)
     model = model.bind_tools(tools)
     preprocessor = RunnableLambda(
-        lambda state: [SystemMessage(content=instructions)] + state["messages"],
+        lambda state: context_manager.messages(state, system_message),
         name="StateModifier",
     )
     return preprocessor | model
@@ -135,19 +225,24 @@ def format_safety_message(safety: LlamaGuardOutput) -> AIMessage:
     content = (
         f"This conversation was flagged for unsafe content: {', '.join(safety.unsafe_categories)}"
     )
-    return AIMessage(content=content)
+    # Not an answer to the input, keep it out of the response cache
+    return AIMessage(content=content, response_metadata={"cacheable": False})
 
 
-async def acall_model(state: MessagesState, config: RunnableConfig) -> MessagesState:
-    m = models[config["configurable"].get("model", "gpt-4o-mini")]
-    model_runnable = wrap_model(m)
-    response = await model_runnable.ainvoke(state, config)
+async def acall_model(state: AgentState, config: RunnableConfig) -> AgentState:
+    model = config["configurable"].get("model", "gpt-4o-mini")
+    context = await context_manager.asummarize(state, config)
+    response = await model_router.ainvoke(model, wrap_model, {**state, **context}, config)
 
     # Run LlamaGuard safety check
-    llama_guard = LlamaGuard()
+    llama_guard = get_llama_guard()
     safety_output = await llama_guard.ainvoke("Agent", state["messages"] + [response])
     if safety_output.safety_assessment == SafetyAssessment.UNSAFE:
-        return {"messages": [format_safety_message(safety_output)], "safety": safety_output}
+        return {
+            "messages": [format_safety_message(safety_output)],
+            "safety": safety_output,
+            **context,
+        }
 
     if "is_last_step" not in state:
         state["is_last_step"] = False
@@ -158,34 +253,58 @@ async def acall_model(state: MessagesState, config: RunnableConfig) -> MessagesS
                 AIMessage(
                     id=response.id,
                     content="Sorry, need more steps to process this request.",
+                    response_metadata={"cacheable": False},
                 )
-            ]
+            ],
+            **context,
         }
-    return {"messages": [response]}
+    return {"messages": [response], **context}
 
 
-async def llama_guard_input(state: MessagesState, config: RunnableConfig) -> MessagesState:
-    llama_guard = LlamaGuard()
+async def llama_guard_input(state: AgentState, config: RunnableConfig) -> AgentState:
+    llama_guard = get_llama_guard()
     safety_output = await llama_guard.ainvoke("User", state["messages"])
     return {"safety": safety_output, "messages": state["messages"]}
 
 
-async def block_unsafe_content(state: MessagesState, config: RunnableConfig) -> MessagesState:
+async def block_unsafe_content(state: AgentState, config: RunnableConfig) -> AgentState:
     safety: LlamaGuardOutput = state["safety"]
     return {"messages": [format_safety_message(safety)]}
 
 
+async def speculative_guard_input(state: AgentState, config: RunnableConfig) -> AgentState:
+    """
+    Check the input with LlamaGuard while the first model call is already running.
+
+    The speculative model call is tagged, so the stream holds its tokens back until the
+    verdict is dispatched: they are released once the input is known to be safe. If
+    the input is unsafe they are discarded, and the model call is cancelled.
+    """
+    model_config = merge_configs(config, RunnableConfig(tags=[SPECULATIVE_TAG]))
+    model_task = asyncio.create_task(acall_model(state, model_config))
+    try:
+        safety_output = await get_llama_guard().ainvoke("User", state["messages"])
+    except BaseException:
+        model_task.cancel()
+        raise
+    safe = safety_output.safety_assessment != SafetyAssessment.UNSAFE
+    await adispatch_custom_event(SPECULATIVE_VERDICT_EVENT, {"safe": safe}, config=config)
+    if not safe:
+        model_task.cancel()
+        return {"messages": [format_safety_message(safety_output)], "safety": safety_output}
+    model_output = await model_task
+    return {**model_output, "safety": model_output.get("safety", safety_output)}
+
+
 # Define the graph
-agent = StateGraph(MessagesState)
+agent = StateGraph(AgentState)
 agent.add_node("model", acall_model)
-agent.add_node("tools", ToolNode(tools))
-agent.add_node("guard_input", llama_guard_input)
-agent.add_node("block_unsafe_content", block_unsafe_content)
+agent.add_node("tools", create_tool_node(tools))
 agent.set_entry_point("guard_input")
 
 
 # Check for unsafe input and block further processing if found
-def check_safety(state: MessagesState) -> Literal["unsafe", "safe"]:
+def check_safety(state: AgentState) -> Literal["unsafe", "safe"]:
     safety: LlamaGuardOutput = state["safety"]
     match safety.safety_assessment:
         case SafetyAssessment.UNSAFE:
@@ -194,19 +313,8 @@ def check_safety(state: MessagesState) -> Literal["unsafe", "safe"]:
             return "safe"
 
 
-agent.add_conditional_edges(
-    "guard_input", check_safety, {"unsafe": "block_unsafe_content", "safe": "model"}
-)
-
-# Always END after blocking unsafe content
-agent.add_edge("block_unsafe_content", END)
-
-# Always run "model" after "tools"
-agent.add_edge("tools", "model")
-
-
 # After "model", if there are tool calls, run "tools". Otherwise END.
-def pending_tool_calls(state: MessagesState) -> Literal["tools", "done"]:
+def pending_tool_calls(state: AgentState) -> Literal["tools", "done"]:
     last_message = state["messages"][-1]
     if not isinstance(last_message, AIMessage):
         raise TypeError(f"Expected AIMessage, got {type(last_message)}")
@@ -215,8 +323,24 @@ def pending_tool_calls(state: MessagesState) -> Literal["tools", "done"]:
     return "done"
 
 
+if SPECULATIVE_GUARD:
+    # The guard node already made the first model call (or blocked the input)
+    agent.add_node("guard_input", speculative_guard_input)
+    agent.add_conditional_edges("guard_input", pending_tool_calls, {"tools": "tools", "done": END})
+else:
+    agent.add_node("guard_input", llama_guard_input)
+    agent.add_node("block_unsafe_content", block_unsafe_content)
+    agent.add_conditional_edges(
+        "guard_input", check_safety, {"unsafe": "block_unsafe_content", "safe": "model"}
+    )
+    # Always END after blocking unsafe content
+    agent.add_edge("block_unsafe_content", END)
+
+# Always run "model" after "tools"
+agent.add_edge("tools", "model")
+
 agent.add_conditional_edges("model", pending_tool_calls, {"tools": "tools", "done": END})
 
 research_assistant = agent.compile(
-    checkpointer=MemorySaver(),
+    checkpointer=BoundedMemorySaver(),
 )
@@ -1,8 +1,15 @@
+import asyncio
 import math
+import os
 import re
+import time
+from collections.abc import Callable, Sequence
 
 import numexpr
-from langchain_core.tools import BaseTool, tool
+from langchain_core.messages import AIMessage, ToolCall, ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import BaseTool, StructuredTool, tool
+from langgraph.graph import MessagesState
 
 
 def calculator_func(expression: str) -> str:
@@ -38,3 +45,92 @@ def calculator_func(expression: str) -> str:
 
 calculator: BaseTool = tool(calculator_func)
 calculator.name = "Calculator"
+
+
+TOOL_CALL_ERROR_TEMPLATE = "Error: {error}\n Please fix your mistakes."
+
+
+def _is_async_tool(t: BaseTool) -> bool:
+    if isinstance(t, StructuredTool):
+        return t.coroutine is not None
+    return type(t)._arun is not BaseTool._arun
+
+
+def create_tool_node(
+    tools: Sequence[BaseTool | Callable],
+    timeout: float | None = None,
+    timeouts: dict[str, float] | None = None,
+    max_sync_workers: int | None = None,
+) -> Callable:
+    """
+    Create a graph node that runs all tool calls of the last AIMessage concurrently.
+
+    Native async tools run on the event loop, sync tools run in worker threads, with at
+    most `max_sync_workers` of them at a time. Each call is limited to `timeout` seconds
+    (or its entry in `timeouts`), and its latency is recorded in the `latency_ms` key of
+    the resulting ToolMessage's response_metadata. Errors and timeouts are returned to
+    the model as error ToolMessages instead of failing the graph.
+
+    Note that a timed out sync tool can't be interrupted, its thread runs to completion
+    in the background.
+    """
+    if timeout is None:
+        timeout = float(os.getenv("TOOL_TIMEOUT", "30"))
+    if max_sync_workers is None:
+        max_sync_workers = int(os.getenv("TOOL_MAX_SYNC_WORKERS", "8"))
+    timeouts = timeouts or {}
+    tools_by_name: dict[str, BaseTool] = {}
+    for t in tools:
+        t = t if isinstance(t, BaseTool) else tool(t)
+        tools_by_name[t.name] = t
+    sync_workers = asyncio.Semaphore(max_sync_workers)
+
+    async def arun_sync_tool(t: BaseTool, call: ToolCall, config: RunnableConfig) -> ToolMessage:
+        # BaseTool.ainvoke runs sync tools in the loop's executor, the semaphore bounds
+        # how many of them occupy a thread at once.
+        async with sync_workers:
+            return await t.ainvoke(call, config)
+
+    async def arun_tool_call(call: ToolCall, config: RunnableConfig) -> ToolMessage:
+        start = time.perf_counter()
+        t = tools_by_name.get(call["name"])
+        call_timeout = timeouts.get(call["name"], timeout)
+        try:
+            if t is None:
+                raise ValueError(
+                    f"{call['name']} is not a valid tool, try one of [{', '.join(tools_by_name)}]."
+                )
+            if _is_async_tool(t):
+                run = t.ainvoke(call, config)
+            else:
+                run = arun_sync_tool(t, call, config)
+            message = await asyncio.wait_for(run, timeout=call_timeout)
+        except asyncio.TimeoutError:
+            message = ToolMessage(
+                content=TOOL_CALL_ERROR_TEMPLATE.format(
+                    error=f"{call['name']} timed out after {call_timeout:g} seconds."
+                ),
+                name=call["name"],
+                tool_call_id=call["id"],
+                status="error",
+            )
+        except Exception as e:
+            message = ToolMessage(
+                content=TOOL_CALL_ERROR_TEMPLATE.format(error=repr(e)),
+                name=call["name"],
+                tool_call_id=call["id"],
+                status="error",
+            )
+        message.response_metadata["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return message
+
+    async def acall_tools(state: MessagesState, config: RunnableConfig) -> MessagesState:
+        last_message = state["messages"][-1]
+        if not isinstance(last_message, AIMessage):
+            raise TypeError(f"Expected AIMessage, got {type(last_message)}")
+        outputs = await asyncio.gather(
+            *(arun_tool_call(call, config) for call in last_message.tool_calls)
+        )
+        return {"messages": list(outputs)}
+
+    return acall_tools
@@ -1,5 +1,7 @@
+import asyncio
 from typing import Any
 
+import httpx
 from langchain_core.callbacks import adispatch_custom_event
 from langchain_core.messages import ChatMessage
 from langchain_core.runnables import RunnableConfig
@@ -28,3 +30,24 @@ class CustomData(BaseModel):
             data=self.to_langchain(),
             config=merge_configs(config, dispatch_config),
         )
+
+
+# Connection pool shared by the agents' tools
+TOOLS_HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+_http_client: httpx.AsyncClient | None = None
+_http_client_loop: asyncio.AbstractEventLoop | None = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Get the pooled async HTTP client shared by the agents' tools.
+
+    Connections are bound to the event loop they were opened on, so the client is
+    recreated if it is used from a different loop.
+    """
+    global _http_client, _http_client_loop
+    loop = asyncio.get_running_loop()
+    if _http_client is None or _http_client.is_closed or _http_client_loop is not loop:
+        _http_client = httpx.AsyncClient(limits=TOOLS_HTTP_LIMITS, timeout=10)
+        _http_client_loop = loop
+    return _http_client
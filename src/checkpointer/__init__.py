@@ -0,0 +1,5 @@
+from checkpointer.factory import create_checkpointer
+from checkpointer.memory import BoundedMemorySaver
+from checkpointer.serde import CompactSerializer, get_serializer
+
+__all__ = ["create_checkpointer", "BoundedMemorySaver", "CompactSerializer", "get_serializer"]
@@ -0,0 +1,63 @@
+import os
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+from checkpointer.memory import BoundedMemorySaver
+from checkpointer.serde import get_serializer
+
+
+def _postgres_conninfo() -> str:
+    """Connection string for psycopg, derived from the SQLAlchemy DATABASE_URL by default."""
+    url = os.getenv("CHECKPOINTER_DATABASE_URL") or os.getenv("DATABASE_URL")
+    if not url:
+        raise ValueError("No DATABASE_URL set for the Postgres checkpointer")
+    # Strip the SQLAlchemy driver, e.g. postgresql+asyncpg:// -> postgresql://
+    scheme, sep, rest = url.partition("://")
+    return scheme.split("+")[0] + sep + rest
+
+
+@asynccontextmanager
+async def create_checkpointer(backend: str | None = None) -> AsyncIterator[BaseCheckpointSaver]:
+    """
+    Create the checkpointer shared by the agents, selected with CHECKPOINTER.
+
+    - `memory` (default): in-process BoundedMemorySaver, lost on restart and not shared
+      across workers.
+    - `sqlite`: AsyncSqliteSaver on CHECKPOINTER_SQLITE_PATH (default `checkpoints.db`).
+    - `postgres`: AsyncPostgresSaver on DATABASE_URL (or CHECKPOINTER_DATABASE_URL), using a
+      connection pool of CHECKPOINTER_POOL_MIN_SIZE to CHECKPOINTER_POOL_MAX_SIZE
+      connections. Requires the `postgres` extra.
+
+    Checkpoints are written with the serializer selected by CHECKPOINTER_SERDE.
+    Resources are released when the context manager exits.
+    """
+    backend = backend or os.getenv("CHECKPOINTER", "memory")
+    match backend:
+        case "memory":
+            yield BoundedMemorySaver()
+        case "sqlite":
+            path = os.getenv("CHECKPOINTER_SQLITE_PATH", "checkpoints.db")
+            async with AsyncSqliteSaver.from_conn_string(path) as saver:
+                saver.serde = get_serializer()
+                yield saver
+        case "postgres":
+            from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+            from psycopg.rows import dict_row
+            from psycopg_pool import AsyncConnectionPool
+
+            async with AsyncConnectionPool(
+                conninfo=_postgres_conninfo(),
+                min_size=int(os.getenv("CHECKPOINTER_POOL_MIN_SIZE", "2")),
+                max_size=int(os.getenv("CHECKPOINTER_POOL_MAX_SIZE", "10")),
+                # Settings required by AsyncPostgresSaver
+                kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row},
+                open=False,
+            ) as pool:
+                saver = AsyncPostgresSaver(pool, serde=get_serializer())
+                await saver.setup()
+                yield saver
+        case _:
+            raise ValueError(f"Unknown checkpointer backend: {backend}")
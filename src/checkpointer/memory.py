@@ -0,0 +1,223 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Iterator, Sequence
+from typing import Any
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    SerializerProtocol,
+)
+from langgraph.checkpoint.memory import MemorySaver
+
+from checkpointer.serde import get_serializer
+
+
+def _limit(value: float | None, env_name: str, default: float) -> float | None:
+    if value is None:
+        value = float(os.getenv(env_name, default))
+    return value if value > 0 else None
+
+
+class _Writes(dict):
+    """
+    Pending writes by (thread_id, checkpoint_ns, checkpoint_id). MemorySaver uses a
+    defaultdict, which adds an entry for every checkpoint read; here a missing key reads
+    as empty without being stored, so only put_writes() adds entries.
+    """
+
+    def __missing__(self, key: tuple[str, str, str]) -> dict:
+        return {}
+
+
+def _checkpoint_size(saved: tuple) -> int:
+    checkpoint, metadata, _ = saved
+    return len(checkpoint[1]) + len(metadata[1])
+
+
+def _writes_size(writes: dict) -> int:
+    return sum(len(value[1]) for _, _, value in writes.values())
+
+
+class BoundedMemorySaver(MemorySaver):
+    """
+    In-memory checkpointer with bounded memory use, a drop-in for MemorySaver.
+
+    - Only the latest `keep_last` checkpoints of each thread (and their pending writes)
+      are kept, older history is pruned on every write.
+    - Threads not read or written for `ttl` seconds are evicted.
+    - When there are more than `max_threads` threads, or the serialized checkpoints take
+      more than `max_bytes`, least recently used threads are evicted.
+
+    Limits that aren't passed are read from the environment (CHECKPOINTER_KEEP_LAST,
+    CHECKPOINTER_THREAD_TTL, CHECKPOINTER_MAX_THREADS and CHECKPOINTER_MAX_BYTES), a
+    value of 0 disables the limit. Eviction counters are available from `stats()`.
+    Checkpoints are stored compressed unless another `serde` is passed.
+    """
+
+    def __init__(
+        self,
+        *,
+        serde: SerializerProtocol | None = None,
+        keep_last: int | None = None,
+        ttl: float | None = None,
+        max_threads: int | None = None,
+        max_bytes: int | None = None,
+    ) -> None:
+        super().__init__(serde=serde or get_serializer())
+        self.writes = _Writes()
+        keep_last = _limit(keep_last, "CHECKPOINTER_KEEP_LAST", 10)
+        # The latest checkpoint reads pending sends from its parent's writes, so always
+        # keep at least two checkpoints.
+        self.keep_last = max(int(keep_last), 2) if keep_last else None
+        self.ttl = _limit(ttl, "CHECKPOINTER_THREAD_TTL", 3600)
+        self.max_threads = _limit(max_threads, "CHECKPOINTER_MAX_THREADS", 1000)
+        self.max_bytes = _limit(max_bytes, "CHECKPOINTER_MAX_BYTES", 256 * 1024 * 1024)
+        self.total_bytes = 0
+        self.metrics = {
+            "evicted_threads": 0,
+            "expired_threads": 0,
+            "evicted_bytes": 0,
+            "pruned_checkpoints": 0,
+        }
+        self._last_access: OrderedDict[str, float] = OrderedDict()
+        self._thread_bytes: dict[str, int] = {}
+        self._thread_writes: dict[str, set[tuple[str, str, str]]] = {}
+        # The async methods run the sync ones in executor threads
+        self._lock = threading.RLock()
+
+    def _touch(self, thread_id: str) -> None:
+        self._last_access[thread_id] = time.monotonic()
+        self._last_access.move_to_end(thread_id)
+
+    def _evict(self, thread_id: str, metric: str = "evicted_threads") -> None:
+        self.storage.pop(thread_id, None)
+        for key in self._thread_writes.pop(thread_id, ()):
+            self.writes.pop(key, None)
+        self._last_access.pop(thread_id, None)
+        size = self._thread_bytes.pop(thread_id, 0)
+        self.total_bytes -= size
+        self.metrics[metric] += 1
+        self.metrics["evicted_bytes"] += size
+
+    def _is_expired(self, thread_id: str) -> bool:
+        last_access = self._last_access.get(thread_id)
+        return (
+            self.ttl is not None
+            and last_access is not None
+            and time.monotonic() - last_access > self.ttl
+        )
+
+    def _prune(self, thread_id: str, checkpoint_ns: str) -> None:
+        if self.keep_last is None:
+            return
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        if len(checkpoints) <= self.keep_last:
+            return
+        # Checkpoint IDs are monotonically increasing
+        for checkpoint_id in sorted(checkpoints)[: -self.keep_last]:
+            size = _checkpoint_size(checkpoints.pop(checkpoint_id))
+            key = (thread_id, checkpoint_ns, checkpoint_id)
+            size += _writes_size(self.writes.pop(key, {}))
+            self._thread_writes.get(thread_id, set()).discard(key)
+            self._add_bytes(thread_id, -size)
+            self.metrics["pruned_checkpoints"] += 1
+
+    def _add_bytes(self, thread_id: str, size: int) -> None:
+        # Running totals, so writes don't rescan the thread
+        self._thread_bytes[thread_id] = self._thread_bytes.get(thread_id, 0) + size
+        self.total_bytes += size
+
+    def _enforce_limits(self, current_thread_id: str) -> None:
+        # Least recently used threads are at the front
+        while self._last_access:
+            thread_id = next(iter(self._last_access))
+            if self._is_expired(thread_id):
+                self._evict(thread_id, "expired_threads")
+                continue
+            over_threads = (
+                self.max_threads is not None and len(self._last_access) > self.max_threads
+            )
+            over_bytes = self.max_bytes is not None and self.total_bytes > self.max_bytes
+            if not (over_threads or over_bytes) or thread_id == current_thread_id:
+                break
+            self._evict(thread_id)
+
+    def get_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            if self._is_expired(thread_id):
+                self._evict(thread_id, "expired_threads")
+                return None
+            checkpoint_tuple = super().get_tuple(config)
+            if thread_id in self._last_access:
+                self._touch(thread_id)
+            elif not self.storage.get(thread_id):
+                # Don't keep the empty entry the defaultdict created for an unknown thread
+                self.storage.pop(thread_id, None)
+            return checkpoint_tuple
+
+    def list(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> Iterator[CheckpointTuple]:
+        with self._lock:
+            checkpoint_tuples = list(
+                super().list(config, filter=filter, before=before, limit=limit)
+            )
+        yield from checkpoint_tuples
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        with self._lock:
+            checkpoints = self.storage[thread_id][checkpoint_ns]
+            replaced = checkpoints.get(checkpoint["id"])
+            next_config = super().put(config, checkpoint, metadata, new_versions)
+            size = _checkpoint_size(checkpoints[checkpoint["id"]])
+            self._add_bytes(thread_id, size - (_checkpoint_size(replaced) if replaced else 0))
+            self._prune(thread_id, checkpoint_ns)
+            self._touch(thread_id)
+            self._enforce_limits(thread_id)
+            return next_config
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        key = (
+            thread_id,
+            config["configurable"]["checkpoint_ns"],
+            config["configurable"]["checkpoint_id"],
+        )
+        with self._lock:
+            before = _writes_size(self.writes[key])
+            # MemorySaver.put_writes() assigns into the entry, create it first
+            self.writes.setdefault(key, {})
+            super().put_writes(config, writes, task_id)
+            self._thread_writes.setdefault(thread_id, set()).add(key)
+            self._add_bytes(thread_id, _writes_size(self.writes[key]) - before)
+            self._touch(thread_id)
+            self._enforce_limits(thread_id)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"threads": len(self._last_access), "bytes": self.total_bytes, **self.metrics}
@@ -0,0 +1,57 @@
+import os
+import zlib
+from typing import Any
+
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class CompactSerializer(JsonPlusSerializer):
+    """
+    Checkpoint serializer storing compressed msgpack, a drop-in for JsonPlusSerializer.
+
+    Values that serialize to at least `min_size` bytes of msgpack are compressed with
+    zstd, or zlib when the `zstandard` package isn't installed. Data written by the
+    default serializer (and uncompressed small values) is still read as is, so existing
+    checkpoints stay readable after switching.
+    """
+
+    def __init__(self, *, min_size: int = 512, level: int = 3) -> None:
+        super().__init__()
+        self.min_size = min_size
+        self.level = level
+
+    def dumps_typed(self, obj: Any) -> tuple[str, bytes]:
+        type_, data = super().dumps_typed(obj)
+        if type_ != "msgpack" or len(data) < self.min_size:
+            return type_, data
+        if zstandard is not None:
+            return "msgpack+zstd", zstandard.compress(data, self.level)
+        return "msgpack+zlib", zlib.compress(data, self.level)
+
+    def loads_typed(self, data: tuple[str, bytes]) -> Any:
+        type_, data_ = data
+        if type_ == "msgpack+zstd":
+            if zstandard is None:
+                raise RuntimeError("The zstandard package is required to read this checkpoint")
+            return super().loads_typed(("msgpack", zstandard.decompress(data_)))
+        if type_ == "msgpack+zlib":
+            return super().loads_typed(("msgpack", zlib.decompress(data_)))
+        return super().loads_typed(data)
+
+
+def get_serializer() -> JsonPlusSerializer:
+    """Serializer for checkpoints, selected with CHECKPOINTER_SERDE (`compact` or `default`)."""
+    match os.getenv("CHECKPOINTER_SERDE", "compact"):
+        case "compact":
+            return CompactSerializer(
+                min_size=int(os.getenv("CHECKPOINTER_COMPRESS_MIN_SIZE", "512"))
+            )
+        case "default":
+            return JsonPlusSerializer()
+        case serde:
+            raise ValueError(f"Unknown checkpoint serializer: {serde}")
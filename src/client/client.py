@@ -1,11 +1,31 @@
+import asyncio
 import json
 import os
 from collections.abc import AsyncGenerator, Generator
+from types import TracebackType
 from typing import Any
 
 import httpx
 
-from schema import ChatHistory, ChatHistoryInput, ChatMessage, Feedback, StreamInput, UserInput
+from schema import (
+    BatchInput,
+    BatchOutput,
+    BatchResult,
+    ChatHistory,
+    ChatHistoryInput,
+    ChatMessage,
+    Feedback,
+    StreamInput,
+    UserInput,
+)
+
+
+def _close_aclient(aclient: httpx.AsyncClient, loop: asyncio.AbstractEventLoop) -> asyncio.Future:
+    """Close an async client, on its own loop if that one is still running elsewhere."""
+    running = asyncio.get_running_loop()
+    if loop is not running and loop.is_running():
+        return asyncio.wrap_future(asyncio.run_coroutine_threadsafe(aclient.aclose(), loop))
+    return running.create_task(aclient.aclose())
 
 
 class AgentClient:
@@ -16,17 +36,106 @@ class AgentClient:
         base_url: str = "http://localhost:80",
         agent: str = "research-assistant",
         timeout: float | None = None,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = False,
     ) -> None:
         """
         Initialize the client.
 
+        The client owns a pooled sync and async HTTP connection pool which are reused
+        across calls. Close them with `close()` / `aclose()`, or use the client as a
+        (async) context manager.
+
         Args:
             base_url (str): The base URL of the agent service.
+            agent (str): The agent to call.
+            timeout (float, optional): Request timeout in seconds.
+            max_connections (int): Maximum number of concurrent connections per pool.
+            max_keepalive_connections (int): Maximum number of idle connections kept alive.
+            keepalive_expiry (float): Seconds an idle connection is kept alive.
+            http2 (bool): Enable HTTP/2. Requires the `h2` package (`httpx[http2]`).
         """
         self.base_url = base_url
         self.agent = agent
         self.auth_secret = os.getenv("AUTH_SECRET")
         self.timeout = timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.http2 = http2
+        self._client: httpx.Client | None = None
+        self._aclient: httpx.AsyncClient | None = None
+        self._aclient_loop: asyncio.AbstractEventLoop | None = None
+        # Pools of previous loops being closed in the background
+        self._closing: set[asyncio.Future] = set()
+
+    @property
+    def client(self) -> httpx.Client:
+        """Pooled sync HTTP client, created on first use."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.Client(limits=self.limits, http2=self.http2)
+        return self._client
+
+    @property
+    def aclient(self) -> httpx.AsyncClient:
+        """
+        Pooled async HTTP client, created on first use.
+
+        Connections are bound to the event loop they were opened on, so a new pool is
+        created if the client is used from a different loop (e.g. Streamlit runs each
+        script rerun in a fresh `asyncio.run()`). The previous loop's pool is closed
+        in the background.
+        """
+        loop = asyncio.get_running_loop()
+        if self._aclient is not None and self._aclient_loop is not loop:
+            closing = _close_aclient(self._aclient, self._aclient_loop)
+            self._closing.add(closing)
+            closing.add_done_callback(self._closing.discard)
+            self._aclient = None
+        if self._aclient is None or self._aclient.is_closed:
+            self._aclient = httpx.AsyncClient(limits=self.limits, http2=self.http2)
+            self._aclient_loop = loop
+        return self._aclient
+
+    def close(self) -> None:
+        """Close the sync connection pool."""
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def aclose(self) -> None:
+        """Close the async and sync connection pools."""
+        if self._aclient is not None:
+            await _close_aclient(self._aclient, self._aclient_loop)
+            self._aclient = None
+            self._aclient_loop = None
+        self.close()
+
+    def __enter__(self) -> "AgentClient":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    async def __aenter__(self) -> "AgentClient":
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        await self.aclose()
 
     @property
     def _headers(self) -> dict[str, str]:
@@ -54,16 +163,15 @@ class AgentClient:
             request.thread_id = thread_id
         if model:
             request.model = model
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/{self.agent}/invoke",
-                json=request.model_dump(),
-                headers=self._headers,
-                timeout=self.timeout,
-            )
-            if response.status_code == 200:
-                return ChatMessage.model_validate(response.json())
-            raise Exception(f"Error: {response.status_code} - {response.text}")
+        response = await self.aclient.post(
+            f"{self.base_url}/{self.agent}/invoke",
+            json=request.model_dump(),
+            headers=self._headers,
+            timeout=self.timeout,
+        )
+        if response.status_code == 200:
+            return ChatMessage.model_validate(response.json())
+        raise Exception(f"Error: {response.status_code} - {response.text}")
 
     def invoke(
         self, message: str, model: str | None = None, thread_id: str | None = None
@@ -84,7 +192,7 @@ class AgentClient:
             request.thread_id = thread_id
         if model:
             request.model = model
-        response = httpx.post(
+        response = self.client.post(
             f"{self.base_url}/{self.agent}/invoke",
             json=request.model_dump(),
             headers=self._headers,
@@ -94,6 +202,42 @@ class AgentClient:
             return ChatMessage.model_validate(response.json())
         raise Exception(f"Error: {response.status_code} - {response.text}")
 
+    async def abatch(
+        self,
+        messages: list[str],
+        model: str | None = None,
+        max_concurrency: int = 8,
+    ) -> list[BatchResult]:
+        """
+        Invoke the agent with a batch of messages in a single request.
+
+        Each message starts a new conversation. Results are returned in the same order
+        as the messages; a failed message has `error` set instead of `output`.
+
+        Args:
+            messages (list[str]): The messages to send to the agent
+            model (str, optional): LLM model to use for the agent
+            max_concurrency (int, optional): Maximum number of messages the service
+                processes concurrently. Default: 8
+
+        Returns:
+            list[BatchResult]: The response from the agent for each message
+        """
+        inputs = [UserInput(message=message) for message in messages]
+        if model:
+            for user_input in inputs:
+                user_input.model = model
+        request = BatchInput(inputs=inputs, max_concurrency=max_concurrency)
+        response = await self.aclient.post(
+            f"{self.base_url}/{self.agent}/batch_invoke",
+            json=request.model_dump(),
+            headers=self._headers,
+            timeout=self.timeout,
+        )
+        if response.status_code == 200:
+            return BatchOutput.model_validate(response.json()).results
+        raise Exception(f"Error: {response.status_code} - {response.text}")
+
     def _parse_stream_line(self, line: str) -> ChatMessage | str | None:
         line = line.strip()
         if line.startswith("data: "):
@@ -147,7 +291,7 @@ class AgentClient:
             request.thread_id = thread_id
         if model:
             request.model = model
-        with httpx.stream(
+        with self.client.stream(
             "POST",
             f"{self.base_url}/{self.agent}/stream",
             json=request.model_dump(),
@@ -157,7 +301,8 @@ class AgentClient:
             if response.status_code != 200:
                 raise Exception(f"Error: {response.status_code} - {response.text}")
             for line in response.iter_lines():
-                if line.strip():
+                # Skip blank lines and SSE fields other than data, like the event id
+                if line.startswith("data: "):
                     parsed = self._parse_stream_line(line)
                     if parsed is None:
                         break
@@ -192,22 +337,22 @@ class AgentClient:
             request.thread_id = thread_id
         if model:
             request.model = model
-        async with httpx.AsyncClient() as client:
-            async with client.stream(
-                "POST",
-                f"{self.base_url}/{self.agent}/stream",
-                json=request.model_dump(),
-                headers=self._headers,
-                timeout=self.timeout,
-            ) as response:
-                if response.status_code != 200:
-                    raise Exception(f"Error: {response.status_code} - {response.text}")
-                async for line in response.aiter_lines():
-                    if line.strip():
-                        parsed = self._parse_stream_line(line)
-                        if parsed is None:
-                            break
-                        yield parsed
+        async with self.aclient.stream(
+            "POST",
+            f"{self.base_url}/{self.agent}/stream",
+            json=request.model_dump(),
+            headers=self._headers,
+            timeout=self.timeout,
+        ) as response:
+            if response.status_code != 200:
+                raise Exception(f"Error: {response.status_code} - {response.text}")
+            async for line in response.aiter_lines():
+                # Skip blank lines and SSE fields other than data, like the event id
+                if line.startswith("data: "):
+                    parsed = self._parse_stream_line(line)
+                    if parsed is None:
+                        break
+                    yield parsed
 
     async def acreate_feedback(
         self, run_id: str, key: str, score: float, kwargs: dict[str, Any] = {}
@@ -220,30 +365,34 @@ class AgentClient:
         See: https://api.smith.langchain.com/redoc#tag/feedback/operation/create_feedback_api_v1_feedback_post
         """
         request = Feedback(run_id=run_id, key=key, score=score, kwargs=kwargs)
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/feedback",
-                json=request.model_dump(),
-                headers=self._headers,
-                timeout=self.timeout,
-            )
-            if response.status_code != 200:
-                raise Exception(f"Error: {response.status_code} - {response.text}")
-            response.json()
+        response = await self.aclient.post(
+            f"{self.base_url}/feedback",
+            json=request.model_dump(),
+            headers=self._headers,
+            timeout=self.timeout,
+        )
+        if response.status_code != 200:
+            raise Exception(f"Error: {response.status_code} - {response.text}")
+        response.json()
 
     def get_history(
         self,
         thread_id: str,
+        limit: int | None = None,
+        before: int | None = None,
     ) -> ChatHistory:
         """
         Get chat history.
 
         Args:
             thread_id (str, optional): Thread ID for identifying a conversation
+            limit (int, optional): Only get the most recent `limit` messages
+            before (int, optional): Cursor from `next_cursor` of a previous page, to get
+                the messages before it
         """
-        request = ChatHistoryInput(thread_id=thread_id)
-        response = httpx.post(
-            f"{self.base_url}/history",
+        request = ChatHistoryInput(thread_id=thread_id, limit=limit, before=before)
+        response = self.client.post(
+            f"{self.base_url}/{self.agent}/history",
             json=request.model_dump(),
             headers=self._headers,
             timeout=self.timeout,
@@ -1,3 +1,4 @@
+import asyncio
 import json
 import logging
 import os
@@ -13,17 +14,22 @@ from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from langchain_core._api import LangChainBetaWarning
 from langchain_core.messages import AnyMessage, HumanMessage
 from langchain_core.runnables import RunnableConfig
-from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 from langgraph.graph.state import CompiledStateGraph
 from langsmith import Client as LangsmithClient
 
 from agents import DEFAULT_AGENT, agents
+from agents.coin_index import coin_index
+from agents.models import models
+from agents.utils import get_http_client
+from checkpointer import create_checkpointer
+from schema import UserInput
 
 from agent_services import ainvoke
 
 
 from user import models as user_models
 from user.user_router import user_router
+from agent_router import agent_router
 from database import engine
 
 warnings.filterwarnings("ignore", category=LangChainBetaWarning)
@@ -56,29 +62,34 @@ async def create_db():
 
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
-    # Construct agent with Sqlite checkpointer
-    # TODO: It's probably dangerous to share the same checkpointer on multiple agents
-    async with AsyncSqliteSaver.from_conn_string("checkpoints.db") as saver:
+    await create_db()
+    # Load the CoinGecko symbol index once, instead of on the first price lookup
+    await coin_index.load(get_http_client())
+    # Models are built on first use, build the default model (or MODEL_WARMUP) ahead of
+    # the first request
+    warmup = os.getenv("MODEL_WARMUP", UserInput.model_fields["model"].default)
+    warmup = [name.strip() for name in warmup.split(",") if name.strip()]
+    if warmup:
+        await asyncio.to_thread(models.warm_up, warmup)
+    # Construct agents with the configured checkpointer. The agents share it, each agent's
+    # threads are stored under its own key (see agent_services.thread_config).
+    async with create_checkpointer() as saver:
         for a in agents.values():
             a.checkpointer = saver
         yield
-    # context manager will clean up the AsyncSqliteSaver on exit
+    # context manager will clean up the checkpointer on exit
 
 
 app = FastAPI(
-    # lifespan=lifespan,
+    lifespan=lifespan,
     title="Base Network Fork",
     description="A base network fork for language-based AI agents.",
     version="1.0.0"
     )
 
 
-
-@app.on_event("startup")
-async def on_startup():
-    await create_db()
-
 app.include_router(user_router)
+app.include_router(agent_router)
 
 # router = APIRouter(dependencies=bearer_depend)
 
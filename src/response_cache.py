@@ -0,0 +1,204 @@
+import hashlib
+import logging
+import os
+from collections.abc import Awaitable, Callable
+from typing import Literal
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage, AnyMessage
+
+from agents.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# (agent_id, model, thread prefix digest, normalized message)
+CacheKey = tuple[str, str, str, str]
+CacheTier = Literal["exact", "semantic"]
+
+
+def normalize_message(message: str) -> str:
+    """Case, whitespace and trailing punctuation insensitive form of a user message."""
+    return " ".join(message.lower().split()).rstrip("?!. ")
+
+
+def thread_prefix(messages: list[AnyMessage]) -> str:
+    """
+    Digest of the conversation before the user message, so responses are only reused
+    in the same context. New threads have an empty prefix.
+    """
+    if not messages:
+        return ""
+    digest = hashlib.sha256()
+    for message in messages:
+        digest.update(f"{message.type}\0{message.content}\0".encode())
+    return digest.hexdigest()
+
+
+def _unit(vector: list[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    return array / (np.linalg.norm(array) or 1.0)
+
+
+def is_cacheable(response: AIMessage) -> bool:
+    """
+    Whether a response is final and reusable. Responses asking for tool calls aren't
+    final, and agents mark replies that aren't answers (safety blocks, step limits)
+    with `response_metadata["cacheable"] = False`.
+    """
+    return (
+        not response.tool_calls
+        and bool(response.content)
+        and response.response_metadata.get("cacheable", True)
+    )
+
+
+class ResponseCache:
+    """
+    Opt-in cache of final agent responses, keyed on (agent, model, thread prefix,
+    normalized message), each entry expiring after `ttl` seconds.
+
+    With `embeddings`, a miss falls back to a semantic tier: a local vector index of the
+    cached messages, matching the most similar message of the same agent, model and
+    thread prefix when its cosine similarity is at least `similarity`. A semantic match
+    answers a message that wasn't seen before, callers can `verify` it before it's served.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        ttl: float = 300,
+        maxsize: int = 1024,
+        agents: set[str] | None = None,
+        embeddings: Embeddings | None = None,
+        similarity: float = 0.95,
+    ) -> None:
+        self.enabled = enabled
+        self.agents = agents
+        self.responses: TTLCache[CacheKey, AIMessage] = TTLCache(maxsize, ttl)
+        self.embeddings = embeddings
+        self.similarity = similarity
+        # Unit vectors of the cached messages by (agent, model, thread prefix)
+        self._index: dict[tuple[str, str, str], dict[str, np.ndarray]] = {}
+        # Embeddings computed on lookup, reused when storing the response
+        self._vectors: TTLCache[str, list[float]] = TTLCache(256, ttl)
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        agents = os.getenv("RESPONSE_CACHE_AGENTS", "research-assistant,chatbot")
+        embeddings = None
+        embedding_model = os.getenv("RESPONSE_CACHE_EMBEDDINGS")
+        enabled = os.getenv("RESPONSE_CACHE") == "true"
+        if enabled and embedding_model:
+            from langchain_openai import OpenAIEmbeddings
+
+            embeddings = OpenAIEmbeddings(model=embedding_model)
+        return cls(
+            enabled=enabled,
+            ttl=float(os.getenv("RESPONSE_CACHE_TTL", "300")),
+            maxsize=int(os.getenv("RESPONSE_CACHE_SIZE", "1024")),
+            agents={agent.strip() for agent in agents.split(",") if agent.strip()},
+            embeddings=embeddings,
+            similarity=float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95")),
+        )
+
+    def caches(self, agent_id: str) -> bool:
+        return self.enabled and (self.agents is None or agent_id in self.agents)
+
+    async def _embed(self, message: str) -> np.ndarray:
+        vector = self._vectors.get(message, count=False)
+        if vector is None:
+            vector = _unit(await self.embeddings.aembed_query(message))
+            self._vectors.set(message, vector)
+        return vector
+
+    def _live_vectors(self, context: tuple[str, str, str]) -> list[tuple[str, np.ndarray]]:
+        """Indexed messages of `context` whose response is still cached, dropping the rest."""
+        entries = self._index.get(context, {})
+        for message in [m for m in entries if (*context, m) not in self.responses]:
+            del entries[message]
+        if not entries:
+            self._index.pop(context, None)
+        return list(entries.items())
+
+    def _prune_index(self) -> None:
+        for context in list(self._index):
+            self._live_vectors(context)
+
+    async def _semantic_lookup(self, key: CacheKey) -> AIMessage | None:
+        context = key[:3]
+        candidates = self._live_vectors(context)
+        if not candidates:
+            return None
+        vector = await self._embed(key[3])
+        # Vectors are normalized, so the dot products are the cosine similarities
+        similarities = np.stack([v for _, v in candidates]) @ vector
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity:
+            return None
+        return self.responses.get((*context, candidates[best][0]), count=False)
+
+    async def lookup(
+        self, key: CacheKey, verify: Callable[[], Awaitable[bool]] | None = None
+    ) -> tuple[AIMessage, CacheTier] | None:
+        """
+        The cached response for `key` and the tier that matched it, if any. A semantic
+        match is only served if `verify()`, when given, returns True.
+        """
+        response = self.responses.get(key, count=False)
+        if response is not None:
+            self.exact_hits += 1
+            return response, "exact"
+        if self.embeddings is not None:
+            try:
+                response = await self._semantic_lookup(key)
+                if response is not None and verify is not None and not await verify():
+                    response = None
+            except Exception as e:
+                logger.warning(f"Semantic cache lookup failed: {e!r}")
+                response = None
+            if response is not None:
+                self.semantic_hits += 1
+                return response, "semantic"
+        self.misses += 1
+        return None
+
+    async def store(self, key: CacheKey, response: AIMessage) -> None:
+        """Cache a final response, see `is_cacheable()`."""
+        if not is_cacheable(response):
+            return
+        self.responses.set(key, response)
+        self.stores += 1
+        if self.embeddings is not None:
+            try:
+                vector = await self._embed(key[3])
+            except Exception as e:
+                logger.warning(f"Semantic cache indexing failed: {e!r}")
+                return
+            # Storing a message again replaces its entry
+            self._index.setdefault(key[:3], {})[key[3]] = vector
+            # Entries evicted from the responses are only dropped from the index on
+            # lookup, sweep the rest now and then
+            if self.stores % self.responses.maxsize == 0:
+                self._prune_index()
+
+    def stats(self) -> dict[str, int | float | bool]:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self.responses),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 3)
+            if lookups
+            else 0.0,
+        }
+
+
+response_cache = ResponseCache.from_env()
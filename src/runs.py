@@ -0,0 +1,263 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from collections.abc import AsyncGenerator, AsyncIterator
+from itertools import islice
+from typing import Literal
+
+from sse import StreamBuffer, error_frame
+
+logger = logging.getLogger(__name__)
+
+RunStatusValue = Literal["running", "done", "error", "cancelled"]
+
+
+class Run:
+    """
+    An agent run executing in the background, independent of any client connection.
+
+    Frames produced by the run are numbered and kept in a ring buffer of the last
+    `buffer_size` events, so clients can (re)subscribe at any point and resume after the
+    last event they received. While clients are subscribed, the run is paced by the
+    slowest one, so no event leaves the buffer before every subscriber has read it.
+    """
+
+    def __init__(
+        self,
+        run_id: str,
+        agent_id: str,
+        thread_id: str,
+        buffer_size: int,
+        cancel_grace: float | None = None,
+    ) -> None:
+        self.run_id = run_id
+        self.agent_id = agent_id
+        self.thread_id = thread_id
+        self.status: RunStatusValue = "running"
+        self.created_at = time.time()
+        self.finished_at: float | None = None
+        self.events: deque[tuple[int, bytes]] = deque(maxlen=buffer_size)
+        self.next_event_id = 1
+        # Next event ID of each live subscription
+        self._cursors: dict[object, int] = {}
+        # Output tokens of the run's model calls so far, from their usage metadata
+        self.output_tokens = 0
+        self.cancel_grace = cancel_grace
+        self.task: asyncio.Task | None = None
+        self._changed = asyncio.Condition()
+        self._abandoned: asyncio.TimerHandle | None = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status != "running"
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._cursors)
+
+    def _has_room(self) -> bool:
+        # Appending evicts the oldest event once the buffer is full, wait until every
+        # subscriber has read it
+        oldest_unread = min(self._cursors.values(), default=self.next_event_id)
+        return self.next_event_id - oldest_unread < self.events.maxlen
+
+    async def _append(self, frame: bytes) -> None:
+        async with self._changed:
+            await self._changed.wait_for(self._has_room)
+            self.events.append((self.next_event_id, frame))
+            self.next_event_id += 1
+            self._changed.notify_all()
+
+    def _set_status(self, status: RunStatusValue) -> None:
+        self.status = status
+        self.finished_at = time.time()
+        if self._abandoned is not None:
+            self._abandoned.cancel()
+            self._abandoned = None
+
+    async def _finish(self, status: RunStatusValue) -> None:
+        async with self._changed:
+            self._set_status(status)
+            self._changed.notify_all()
+
+    async def _notify(self) -> None:
+        async with self._changed:
+            self._changed.notify_all()
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        # A task cancelled before it first ran never enters execute(), so its status
+        # is only set here
+        if self.finished:
+            return
+        self._set_status("cancelled" if task.cancelled() else "error")
+        asyncio.get_running_loop().create_task(self._notify())
+
+    async def execute(self, items: AsyncGenerator[str | bytes | int, None]) -> None:
+        """
+        Run to completion, coalescing tokens (str), recording frames (bytes) and adding
+        up the output tokens of model calls (int).
+        """
+        buffer = StreamBuffer.from_env()
+
+        async def fill() -> None:
+            try:
+                async for item in items:
+                    if isinstance(item, str):
+                        await buffer.put_token(item)
+                    elif isinstance(item, int):
+                        self.output_tokens += item
+                    else:
+                        await buffer.put_frame(item)
+            finally:
+                await buffer.close()
+
+        producer = asyncio.create_task(fill())
+        status: RunStatusValue = "error"
+        try:
+            async for frame in buffer:
+                await self._append(frame)
+            await producer
+            status = "done"
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise
+        except Exception as e:
+            logger.error(f"Run {self.run_id} failed: {e}")
+        finally:
+            producer.cancel()
+            await asyncio.shield(self._finish(status))
+
+    async def subscribe(self, last_event_id: int | None = None) -> AsyncIterator[bytes]:
+        """
+        Stream the run's frames with SSE ids, starting after `last_event_id`.
+
+        Events that already left the ring buffer when subscribing are reported with an
+        error event, in place of the missing frames.
+        """
+        subscription = object()
+        next_id = (last_event_id or 0) + 1
+        first_id = self.events[0][0] if self.events else self.next_event_id
+        missed = first_id - next_id
+        next_id = max(next_id, first_id)
+        self._cursors[subscription] = next_id
+        if self._abandoned is not None:
+            self._abandoned.cancel()
+            self._abandoned = None
+        try:
+            if missed > 0:
+                yield error_frame(f"{missed} events of the run are no longer available")
+            while True:
+                async with self._changed:
+                    # Reading up to next_id lets a run paced by this subscriber go on
+                    self._cursors[subscription] = next_id
+                    self._changed.notify_all()
+                    await self._changed.wait_for(
+                        lambda: self.next_event_id > next_id or self.finished
+                    )
+                    first_id = self.events[0][0] if self.events else self.next_event_id
+                    events = list(islice(self.events, max(next_id - first_id, 0), None))
+                    finished = self.finished
+                for event_id, frame in events:
+                    yield b"id: %d\n" % event_id + frame
+                    next_id = event_id + 1
+                if finished and next_id >= self.next_event_id:
+                    return
+        finally:
+            del self._cursors[subscription]
+            if not self.finished:
+                asyncio.get_running_loop().create_task(self._notify())
+            if self.subscribers == 0 and not self.finished and self.cancel_grace is not None:
+                self._abandoned = asyncio.get_running_loop().call_later(
+                    self.cancel_grace, self._cancel_if_abandoned
+                )
+
+    def _cancel_if_abandoned(self) -> None:
+        # Cancelling the task cancels the graph, and with it in-flight model requests,
+        # LlamaGuard checks and async tool calls
+        self._abandoned = None
+        if self.subscribers == 0 and self.task is not None and not self.finished:
+            logger.info(f"Cancelling run {self.run_id}, its client disconnected")
+            self.task.cancel()
+
+
+class RunManager:
+    """
+    Registry of background agent runs, keyed by run_id.
+
+    Finished runs are kept for `ttl` seconds so clients can still fetch their status
+    and remaining events. A run left without subscribers for `cancel_grace` seconds is
+    cancelled (None lets runs always finish). The output tokens cancelled runs would
+    still have generated are estimated from the average of completed runs that called
+    a model, so runs served from the response cache don't count.
+    """
+
+    def __init__(
+        self, buffer_size: int = 1024, ttl: float = 300, cancel_grace: float | None = 5
+    ) -> None:
+        self.buffer_size = buffer_size
+        self.ttl = ttl
+        self.cancel_grace = cancel_grace
+        self.runs: dict[str, Run] = {}
+        self.metrics = {
+            "completed_runs": 0,
+            "completed_tokens": 0,
+            "cancelled_runs": 0,
+            "estimated_tokens_saved": 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> "RunManager":
+        cancel_grace = float(os.getenv("RUN_CANCEL_GRACE", "5"))
+        return cls(
+            buffer_size=int(os.getenv("RUN_BUFFER_SIZE", "1024")),
+            ttl=float(os.getenv("RUN_TTL", "300")),
+            cancel_grace=cancel_grace if cancel_grace >= 0 else None,
+        )
+
+    def _record(self, run: Run) -> None:
+        if run.status == "done" and run.output_tokens:
+            self.metrics["completed_runs"] += 1
+            self.metrics["completed_tokens"] += run.output_tokens
+        elif run.status == "cancelled":
+            self.metrics["cancelled_runs"] += 1
+            if self.metrics["completed_runs"]:
+                average = self.metrics["completed_tokens"] / self.metrics["completed_runs"]
+                self.metrics["estimated_tokens_saved"] += max(round(average) - run.output_tokens, 0)
+
+    def _remove_expired(self) -> None:
+        now = time.time()
+        expired = [
+            run_id
+            for run_id, run in self.runs.items()
+            if run.finished_at is not None and now - run.finished_at > self.ttl
+        ]
+        for run_id in expired:
+            del self.runs[run_id]
+
+    def start(
+        self,
+        run_id: str,
+        agent_id: str,
+        thread_id: str,
+        items: AsyncGenerator[str | bytes | int, None],
+    ) -> Run:
+        self._remove_expired()
+        run = Run(run_id, agent_id, thread_id, self.buffer_size, self.cancel_grace)
+        run.task = asyncio.create_task(run.execute(items))
+        run.task.add_done_callback(run._task_done)
+        run.task.add_done_callback(lambda _: self._record(run))
+        self.runs[run_id] = run
+        return run
+
+    def get(self, run_id: str) -> Run | None:
+        self._remove_expired()
+        return self.runs.get(run_id)
+
+    def stats(self) -> dict[str, int]:
+        running = sum(1 for run in self.runs.values() if not run.finished)
+        return {"running": running, **self.metrics}
+
+
+run_manager = RunManager.from_env()
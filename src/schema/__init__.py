@@ -1,9 +1,13 @@
 from schema.schema import (
+    BatchInput,
+    BatchOutput,
+    BatchResult,
     ChatHistory,
     ChatHistoryInput,
     ChatMessage,
     Feedback,
     FeedbackResponse,
+    RunStatus,
     StreamInput,
     UserInput,
 )
@@ -16,4 +20,8 @@ __all__ = [
     "FeedbackResponse",
     "ChatHistoryInput",
     "ChatHistory",
+    "BatchInput",
+    "BatchResult",
+    "BatchOutput",
+    "RunStatus",
 ]
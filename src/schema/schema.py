@@ -118,6 +118,39 @@ class FeedbackResponse(BaseModel):
     status: Literal["success"] = "success"
 
 
+class BatchInput(BaseModel):
+    """Batch of user inputs to invoke the agent with."""
+
+    inputs: list[UserInput] = Field(
+        description="User inputs to the agent. Results are returned in the same order.",
+        min_length=1,
+    )
+    max_concurrency: int = Field(
+        description="Maximum number of inputs run through the agent concurrently.",
+        default=8,
+        ge=1,
+        le=64,
+    )
+
+
+class BatchResult(BaseModel):
+    """Result for a single input of a batch."""
+
+    output: ChatMessage | None = Field(
+        description="Final message from the agent, if the input succeeded.",
+        default=None,
+    )
+    error: str | None = Field(
+        description="Error message, if the input failed.",
+        default=None,
+        examples=["Unexpected error"],
+    )
+
+
+class BatchOutput(BaseModel):
+    results: list[BatchResult]
+
+
 class ChatHistoryInput(BaseModel):
     """Input for retrieving chat history."""
 
@@ -125,7 +158,48 @@ class ChatHistoryInput(BaseModel):
         description="Thread ID to persist and continue a multi-turn conversation.",
         examples=["847c6285-8fc9-4560-a83f-4e6285809254"],
     )
+    limit: int | None = Field(
+        description="Maximum number of messages to return, the most recent first. All when unset.",
+        default=None,
+        ge=1,
+        examples=[50],
+    )
+    before: int | None = Field(
+        description="Cursor from a previous page: only return messages before this position.",
+        default=None,
+        ge=0,
+        examples=[150],
+    )
 
 
 class ChatHistory(BaseModel):
     messages: list[ChatMessage]
+    next_cursor: int | None = Field(
+        description="Cursor for the previous page of older messages, if there are any.",
+        default=None,
+    )
+
+
+class RunStatus(BaseModel):
+    """Status of a background agent run."""
+
+    run_id: str = Field(
+        description="Run ID, as attached to the run's messages.",
+        examples=["847c6285-8fc9-4560-a83f-4e6285809254"],
+    )
+    agent_id: str = Field(description="Agent executing the run.", examples=["research-assistant"])
+    thread_id: str = Field(
+        description="Thread ID of the conversation.",
+        examples=["847c6285-8fc9-4560-a83f-4e6285809254"],
+    )
+    status: Literal["running", "done", "error", "cancelled"] = Field(
+        description="State of the run.",
+        examples=["running"],
+    )
+    last_event_id: int = Field(
+        description="ID of the last event emitted by the run, 0 if none yet.",
+        examples=[42],
+    )
+    subscribers: int = Field(description="Number of clients following the run.", examples=[1])
+    created_at: float = Field(description="Unix time the run started.")
+    finished_at: float | None = Field(description="Unix time the run ended.", default=None)
@@ -0,0 +1,157 @@
+import asyncio
+import os
+import time
+from collections import deque
+from collections.abc import AsyncIterator
+from typing import Any
+
+from schema import ChatMessage
+
+try:
+    import orjson
+
+    def _dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+except ImportError:
+    import json
+
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+# Frames are built from constant prefixes, only the content is encoded per event
+TOKEN_PREFIX = b'data: {"type":"token","content":'
+MESSAGE_PREFIX = b'data: {"type":"message","content":'
+ERROR_PREFIX = b'data: {"type":"error","content":'
+FRAME_SUFFIX = b"}\n\n"
+ERROR_FRAME = b'data: {"type":"error","content":"Unexpected error"}\n\n'
+DONE_FRAME = b"data: [DONE]\n\n"
+
+GRAPH_STEP_TAG_PREFIX = "graph:step:"
+CUSTOM_DATA_TAG = "custom_data_dispatch"
+LLAMA_GUARD_TAG = "llama_guard"
+CONTEXT_SUMMARY_TAG = "context_summary"
+# Tokens of the speculative model call are held back until the input safety verdict,
+# dispatched as a custom event, releases or discards them
+SPECULATIVE_TAG = "speculative"
+SPECULATIVE_VERDICT_EVENT = "speculative_verdict"
+# Tokens of model calls with these tags are internal, not streamed to clients
+SILENT_TOKEN_TAGS = frozenset({LLAMA_GUARD_TAG, CONTEXT_SUMMARY_TAG})
+
+
+def token_frame(content: str) -> bytes:
+    return TOKEN_PREFIX + _dumps(content) + FRAME_SUFFIX
+
+
+def message_frame(message: ChatMessage) -> bytes:
+    return MESSAGE_PREFIX + message.model_dump_json().encode() + FRAME_SUFFIX
+
+
+def error_frame(content: str) -> bytes:
+    return ERROR_PREFIX + _dumps(content) + FRAME_SUFFIX
+
+
+def is_graph_step(tags: list[str]) -> bool:
+    """Whether the event's run is a graph node, rather than a runnable inside one."""
+    for tag in tags:
+        if tag.startswith(GRAPH_STEP_TAG_PREFIX):
+            return True
+    return False
+
+
+class _Tokens:
+    __slots__ = ("parts", "started")
+
+    def __init__(self, text: str, started: float) -> None:
+        self.parts = [text]
+        self.started = started
+
+
+class StreamBuffer:
+    """
+    Bounded queue of SSE frames between an agent run and the response body.
+
+    Tokens put within `coalesce_ms` of each other are merged into a single frame. At most
+    `maxsize` frames are queued: when a slow client lets the queue fill up, new tokens
+    are merged into the last queued token frame (`merge` policy) or dropped (`drop`
+    policy, the final message still carries the full content). Other frames wait for
+    room, pausing the producer.
+
+    Meant for a single producer and a single consumer task.
+    """
+
+    def __init__(self, maxsize: int = 256, coalesce_ms: float = 25, policy: str = "merge") -> None:
+        if policy not in ("merge", "drop"):
+            raise ValueError(f"Unknown stream queue policy: {policy}")
+        self.maxsize = max(maxsize, 1)
+        self.window = coalesce_ms / 1000
+        self.policy = policy
+        self.dropped_tokens = 0
+        self._items: deque[_Tokens | bytes] = deque()
+        self._closed = False
+        self._changed = asyncio.Condition()
+
+    @classmethod
+    def from_env(cls) -> "StreamBuffer":
+        return cls(
+            maxsize=int(os.getenv("STREAM_QUEUE_SIZE", "256")),
+            coalesce_ms=float(os.getenv("STREAM_COALESCE_MS", "25")),
+            policy=os.getenv("STREAM_QUEUE_POLICY", "merge"),
+        )
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    async def put_token(self, text: str) -> None:
+        async with self._changed:
+            now = time.monotonic()
+            last = self._items[-1] if self._items else None
+            full = len(self._items) >= self.maxsize
+            if isinstance(last, _Tokens) and (now - last.started < self.window or full):
+                if full and self.policy == "drop":
+                    self.dropped_tokens += 1
+                    return
+                last.parts.append(text)
+                return
+            if full:
+                if self.policy == "drop":
+                    self.dropped_tokens += 1
+                    return
+                await self._changed.wait_for(lambda: len(self._items) < self.maxsize)
+            self._items.append(_Tokens(text, now))
+            self._changed.notify_all()
+
+    async def put_frame(self, frame: bytes) -> None:
+        async with self._changed:
+            await self._changed.wait_for(lambda: len(self._items) < self.maxsize)
+            self._items.append(frame)
+            self._changed.notify_all()
+
+    async def close(self) -> None:
+        async with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: self._items or self._closed)
+                if not self._items:
+                    return
+                head = self._items[0]
+                if isinstance(head, _Tokens) and len(self._items) == 1 and not self._closed:
+                    # Keep collecting tokens until the coalescing window ends
+                    remaining = head.started + self.window - time.monotonic()
+                    if remaining > 0:
+                        try:
+                            await asyncio.wait_for(self._changed.wait(), remaining)
+                        except asyncio.TimeoutError:
+                            pass
+                        continue
+                self._items.popleft()
+                self._changed.notify_all()
+            if isinstance(head, _Tokens):
+                yield token_frame("".join(head.parts))
+            else:
+                yield head
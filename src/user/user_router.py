@@ -1,9 +1,12 @@
-from fastapi import APIRouter, status, HTTPException
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, status, HTTPException
 from schema import (
     ChatMessage,
     UserInput,
 )
 from .crud import collect_email
+from admission import request_priority
 from agent_services import ainvoke
 from database import db_dependency
 
@@ -11,14 +14,16 @@ from database import db_dependency
 user_router = APIRouter(prefix="/user", tags=["User"])
 
 @user_router.post("/invoke")
-async def invoke(user_input: UserInput) -> ChatMessage:
+async def invoke(
+    user_input: UserInput, priority: Annotated[int, Depends(request_priority)]
+) -> ChatMessage:
     """
     Invoke the default agent with user input to retrieve a final response.
 
     Use thread_id to persist and continue a multi-turn conversation. run_id kwarg
     is also attached to messages for recording feedback.
     """
-    return await ainvoke(user_input=user_input)
+    return await ainvoke(user_input=user_input, priority=priority)
 
 
 @user_router.post("/subscriber_mail")
@@ -0,0 +1,98 @@
+import asyncio
+from unittest.mock import patch
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
+
+from agents.context import ContextManager, count_tokens
+
+
+def _turns(count: int, size: int = 400) -> list:
+    messages = []
+    for i in range(count):
+        messages.append(HumanMessage(content=f"question {i} " + "x" * size, id=f"h{i}"))
+        messages.append(AIMessage(content=f"answer {i} " + "y" * size, id=f"a{i}"))
+    return messages
+
+
+def test_tool_outputs_truncated() -> None:
+    manager = ContextManager(tool_output_chars=10)
+    state = {
+        "messages": [
+            HumanMessage(content="Price of ETH?"),
+            AIMessage(content="", tool_calls=[{"name": "CryptoPrices", "args": {}, "id": "1"}]),
+            ToolMessage(content="z" * 50, tool_call_id="1"),
+        ]
+    }
+    tool_message = manager.messages(state)[-1]
+    assert tool_message.content == "z" * 10 + "\n[... 40 characters truncated]"
+    # The thread itself is untouched
+    assert state["messages"][-1].content == "z" * 50
+
+
+def test_trimmed_to_token_budget() -> None:
+    manager = ContextManager(max_tokens=500)
+    messages = manager.messages({"messages": _turns(10)})
+    assert count_tokens(messages) <= 500
+    assert isinstance(messages[0], HumanMessage)
+    assert messages[-1].id == "a9"
+
+    # The latest turn is always sent, even over budget
+    long_turn = [HumanMessage(content="q" * 4000, id="h")]
+    assert manager.messages({"messages": long_turn}) == long_turn
+
+
+def test_summary_in_system_message() -> None:
+    manager = ContextManager()
+    state = {
+        "messages": _turns(3),
+        "summary": "User is building on Base.",
+        "summarized_until": "a0",
+    }
+
+    messages = manager.messages(state, SystemMessage(content="You are DevBot."))
+    assert messages[0].content.startswith("You are DevBot.\n\nSummary of the earlier")
+    assert messages[0].content.endswith("User is building on Base.")
+    assert [m.id for m in messages[1:]] == ["h1", "a1", "h2", "a2"]
+
+    cached = {"type": "text", "text": "You are DevBot.", "cache_control": {"type": "ephemeral"}}
+    messages = manager.messages(state, SystemMessage(content=[cached]))
+    assert messages[0].content[0] == cached
+    assert len(messages[0].content) == 2
+
+
+def test_older_turns_summarized() -> None:
+    manager = ContextManager(max_tokens=1000)
+    model = GenericFakeChatModel(messages=iter([AIMessage(content="Talked about Base.")]))
+    config = RunnableConfig(configurable={"model": "gpt-4o-mini"})
+
+    with patch.dict("agents.models.models", {"gpt-4o-mini": model}):
+        assert asyncio.run(manager.asummarize({"messages": _turns(2)}, config)) == {}
+        update = asyncio.run(manager.asummarize({"messages": _turns(10)}, config))
+
+    assert update["summary"] == "Talked about Base."
+    state = {"messages": _turns(10), **update}
+    messages = manager.messages(state)
+    # The summarized turns aren't sent anymore, the recent ones are
+    assert messages[0].content.endswith("Talked about Base.")
+    assert messages[1].id == f"h{int(update['summarized_until'][1:]) + 1}"
+    assert messages[-1].id == "a9"
+
+
+def test_failed_summary_not_retried_in_the_same_turn() -> None:
+    manager = ContextManager(max_tokens=1000)
+    config = RunnableConfig(configurable={"model": "gpt-4o-mini"})
+    state = {"messages": _turns(10)}
+
+    with patch("agents.context.model_router.ainvoke", side_effect=ValueError) as ainvoke:
+        update = asyncio.run(manager.asummarize(state, config))
+        assert update == {"summary_failed_turn": "h9"}
+        # Later steps of the same turn don't retry
+        assert asyncio.run(manager.asummarize({**state, **update}, config)) == {}
+        assert ainvoke.call_count == 1
+
+        # The next turn does
+        state = {"messages": _turns(11), **update}
+        assert asyncio.run(manager.asummarize(state, config)) == {"summary_failed_turn": "h10"}
+        assert ainvoke.call_count == 2
@@ -0,0 +1,153 @@
+import asyncio
+import threading
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+
+from agents.llama_guard import (
+    LlamaGuard,
+    LlamaGuardOutput,
+    SafetyAssessment,
+    SafetyVerdictCache,
+    get_llama_guard,
+    llama_guard_prompt,
+    parse_llama_guard_output,
+)
+
+
+def test_llama_guard_is_shared() -> None:
+    llama_guard = get_llama_guard()
+    assert get_llama_guard() is llama_guard
+    if llama_guard.model is not None:
+        assert llama_guard.prompt is llama_guard_prompt
+
+
+def test_llama_guard_without_groq_key_is_safe(monkeypatch) -> None:
+    monkeypatch.delenv("GROQ_API_KEY", raising=False)
+    get_llama_guard.cache_clear()
+    try:
+        output = asyncio.run(get_llama_guard().ainvoke("User", [HumanMessage(content="Hi")]))
+        assert output.safety_assessment == SafetyAssessment.SAFE
+    finally:
+        get_llama_guard.cache_clear()
+
+
+def test_parse_llama_guard_output() -> None:
+    assert parse_llama_guard_output("safe").safety_assessment == SafetyAssessment.SAFE
+    unsafe = parse_llama_guard_output("unsafe\nS1,S10")
+    assert unsafe.safety_assessment == SafetyAssessment.UNSAFE
+    assert unsafe.unsafe_categories == ["Violent Crimes", "Hate"]
+    assert parse_llama_guard_output("unsafe\nS99").safety_assessment == SafetyAssessment.ERROR
+
+
+def test_llama_guard_verdict_cache(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("GROQ_API_KEY", "gsk-fake-groq-key")
+    calls = []
+
+    def fake_model(messages):
+        calls.append(messages)
+        return AIMessage(content="safe")
+
+    cache_path = str(tmp_path / "verdicts.db")
+    llama_guard = LlamaGuard(cache=SafetyVerdictCache(path=cache_path))
+    llama_guard.model = RunnableLambda(fake_model)
+    conversation = [HumanMessage(content="What is  Base?"), AIMessage(content="An L2.")]
+
+    output = asyncio.run(llama_guard.ainvoke("Agent", conversation))
+    assert output.safety_assessment == SafetyAssessment.SAFE
+    # Whitespace differences normalize to the same key
+    conversation[0] = HumanMessage(content="What is Base?")
+    asyncio.run(llama_guard.ainvoke("Agent", conversation))
+    assert len(calls) == 1
+    # Same conversation checked for a different role is a different verdict
+    asyncio.run(llama_guard.ainvoke("User", conversation))
+    assert len(calls) == 2
+
+    # Verdicts are persisted and reloaded by a fresh cache
+    restarted = LlamaGuard(cache=SafetyVerdictCache(path=cache_path))
+    restarted.model = RunnableLambda(fake_model)
+    asyncio.run(restarted.ainvoke("Agent", conversation))
+    assert len(calls) == 2
+
+
+def test_verdict_cache_deletes_expired_rows(tmp_path) -> None:
+    cache = SafetyVerdictCache(ttl=60, path=str(tmp_path / "verdicts.db"))
+    cache.prune_every = 3
+    safe = LlamaGuardOutput(safety_assessment=SafetyAssessment.SAFE)
+
+    def rows() -> int:
+        return cache.db.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+
+    cache.set("a", safe)
+    cache.set("b", safe)
+    cache.db.execute("UPDATE verdicts SET created_at = created_at - 120")
+    # An expired row is deleted when read
+    assert cache._db_get("a") is None
+    assert rows() == 1
+    # and the remaining expired rows every `prune_every` writes
+    cache.set("c", safe)
+    assert rows() == 1
+    assert cache._db_get("c") == safe
+
+
+def test_llama_guard_cache_file_off_event_loop(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("GROQ_API_KEY", "gsk-fake-groq-key")
+    cache = SafetyVerdictCache(path=str(tmp_path / "verdicts.db"))
+    threads = []
+    for name in ["_db_get", "_db_set"]:
+        method = getattr(cache, name)
+
+        def record(*args, method=method):
+            threads.append(threading.get_ident())
+            return method(*args)
+
+        monkeypatch.setattr(cache, name, record)
+
+    llama_guard = LlamaGuard(cache=cache)
+    llama_guard.model = RunnableLambda(lambda messages: AIMessage(content="safe"))
+    asyncio.run(llama_guard.ainvoke("User", [HumanMessage(content="Hi")]))
+    assert threads
+    assert threading.get_ident() not in threads
+
+
+def test_llama_guard_does_not_cache_errors(monkeypatch) -> None:
+    monkeypatch.setenv("GROQ_API_KEY", "gsk-fake-groq-key")
+    calls = []
+
+    def fake_model(messages):
+        calls.append(messages)
+        return AIMessage(content="not a verdict")
+
+    llama_guard = LlamaGuard(cache=SafetyVerdictCache())
+    llama_guard.model = RunnableLambda(fake_model)
+    for _ in range(2):
+        output = llama_guard.invoke("User", [HumanMessage(content="Hi")])
+        assert output.safety_assessment == SafetyAssessment.ERROR
+    assert len(calls) == 2
+
+
+def test_llama_guard_window(monkeypatch) -> None:
+    monkeypatch.setenv("GROQ_API_KEY", "gsk-fake-groq-key")
+    conversation = []
+    for i in range(5):
+        conversation += [HumanMessage(content=f"Question {i}"), AIMessage(content=f"Answer {i}")]
+
+    cache = SafetyVerdictCache()
+    llama_guard = LlamaGuard(cache=cache, window_turns=2)
+    earlier, window = llama_guard._window(conversation)
+    assert [m.content for m in window] == ["Question 3", "Answer 3", "Question 4", "Answer 4"]
+    assert len(earlier) == 6
+
+    # The verdict cached for the earlier turns is summarized in the prompt
+    cache.set(
+        cache.key("Agent", earlier), LlamaGuardOutput(safety_assessment=SafetyAssessment.SAFE)
+    )
+    prompt = llama_guard._compile_prompt("Agent", conversation)
+    assert "[6 earlier messages omitted, previously assessed as safe]" in prompt
+    assert "Question 2" not in prompt
+    assert "Question 3" in prompt
+
+    # Token budget keeps at least the last message
+    llama_guard = LlamaGuard(cache=cache, window_tokens=1)
+    _, window = llama_guard._window(conversation)
+    assert [m.content for m in window] == ["Answer 4"]
@@ -0,0 +1,165 @@
+import asyncio
+
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+from agents.model_router import Budget, ModelRouter, is_retryable, record_prompt_cache
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+class FlakyModel(GenericFakeChatModel):
+    """Fake model failing its first `failures` calls."""
+
+    failures: int = 0
+    error: type[Exception] = RateLimitError
+    calls: int = 0
+
+    async def ainvoke(self, input, config=None, **kwargs) -> AIMessage:
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error("upstream error")
+        return await super().ainvoke(input, config, **kwargs)
+
+
+def _model(text: str, failures: int = 0, error: type[Exception] = RateLimitError) -> FlakyModel:
+    return FlakyModel(messages=iter([AIMessage(content=text)] * 10), failures=failures, error=error)
+
+
+def _router(registry: dict, **kwargs) -> ModelRouter:
+    return ModelRouter(registry, [["claude-3-haiku", "gemini-1.5-flash"]], base_delay=0, **kwargs)
+
+
+def test_retries_then_succeeds() -> None:
+    class Timeout(Exception):
+        status_code = 503
+
+    registry = {"claude-3-haiku": _model("claude", failures=1, error=Timeout)}
+    router = _router(registry)
+    response = asyncio.run(router.ainvoke("claude-3-haiku", lambda m: m, "hi"))
+    assert response.content == "claude"
+    assert registry["claude-3-haiku"].calls == 2
+    assert router.failovers == 0
+    # Tokens of the failed attempt may have been streamed
+    assert response.response_metadata["failed_attempts"] == 1
+
+
+def test_fails_over_on_rate_limit() -> None:
+    registry = {
+        "claude-3-haiku": _model("claude", failures=5),
+        "gemini-1.5-flash": _model("gemini"),
+    }
+    router = _router(registry)
+    response = asyncio.run(router.ainvoke("claude-3-haiku", lambda m: m, "hi"))
+    assert response.content == "gemini"
+    # Rate limited models aren't retried, and are skipped while cooling down
+    assert registry["claude-3-haiku"].calls == 1
+    assert router.failovers == 1
+    assert router.candidates("claude-3-haiku") == ["gemini-1.5-flash"]
+    assert response.response_metadata["failed_attempts"] == 1
+
+
+def test_non_retryable_errors_are_raised() -> None:
+    registry = {"claude-3-haiku": _model("claude", failures=1, error=ValueError)}
+    with pytest.raises(ValueError):
+        asyncio.run(_router(registry).ainvoke("claude-3-haiku", lambda m: m, "hi"))
+    assert not is_retryable(ValueError())
+    assert is_retryable(asyncio.TimeoutError())
+
+
+def test_all_models_failing() -> None:
+    registry = {
+        "claude-3-haiku": _model("claude", failures=5),
+        "gemini-1.5-flash": _model("gemini", failures=5),
+    }
+    with pytest.raises(RateLimitError):
+        asyncio.run(_router(registry).ainvoke("claude-3-haiku", lambda m: m, "hi"))
+
+
+def test_budget_skips_model() -> None:
+    budget = Budget(rpm=1, tpm=100)
+    assert budget.has_capacity()
+    budget.record_request()
+    assert not budget.has_capacity()
+
+    registry = {"claude-3-haiku": _model("claude"), "gemini-1.5-flash": _model("gemini")}
+    router = _router(registry, rpm={"claude-3-haiku": 1})
+    responses = [
+        asyncio.run(router.ainvoke("claude-3-haiku", lambda m: m, "hi")).content for _ in range(2)
+    ]
+    assert responses == ["claude", "gemini"]
+
+
+def test_tier_routes_to_fastest_model() -> None:
+    registry = {"claude-3-haiku": _model("claude"), "gemini-1.5-flash": _model("gemini")}
+    router = _router(registry, tiers={"fast": ["claude-3-haiku", "gemini-1.5-flash"]})
+    router._stats("claude-3-haiku").ttft.extend([0.9] * 5)
+    router._stats("gemini-1.5-flash").ttft.extend([0.2] * 5)
+    assert router.resolve("fast") == "gemini-1.5-flash"
+    assert router.resolve("claude-3-haiku") == "claude-3-haiku"
+
+    response = asyncio.run(router.ainvoke("fast", lambda m: m, "hi"))
+    assert response.content == "gemini"
+
+    # An unhealthy model loses its spot
+    router._health("gemini-1.5-flash").error_rate = 1.0
+    assert router.resolve("fast") == "claude-3-haiku"
+
+
+def test_model_stats_recorded() -> None:
+    registry = {"claude-3-haiku": GenericFakeChatModel(messages=iter(["one two three"] * 3))}
+    router = _router(registry)
+    for _ in range(3):
+        asyncio.run(router.ainvoke("claude-3-haiku", lambda m: m, "hi"))
+    summary = router.summary()
+    stats = summary["models"]["claude-3-haiku"]
+    assert stats["samples"] == 3
+    assert stats["ttft_p50"] <= stats["ttft_p95"]
+    assert summary["tiers"] == {"fast": "claude-3-haiku", "smart": "claude-3-haiku"}
+
+
+def test_built_runnables_are_cached() -> None:
+    registry = {"claude-3-haiku": _model("claude")}
+    router = _router(registry)
+    builds = []
+
+    def build(model):
+        builds.append(model)
+        return model
+
+    for _ in range(3):
+        asyncio.run(router.ainvoke("claude-3-haiku", build, "hi"))
+    assert len(builds) == 1
+
+    # Replacing the model in the registry rebuilds it
+    registry["claude-3-haiku"] = _model("other")
+    response = asyncio.run(router.ainvoke("claude-3-haiku", build, "hi"))
+    assert response.content == "other"
+    assert len(builds) == 2
+
+
+def test_prompt_cache_usage_reported() -> None:
+    response = AIMessage(
+        content="hi",
+        usage_metadata={
+            "input_tokens": 2100,
+            "output_tokens": 10,
+            "total_tokens": 2110,
+            "input_token_details": {"cache_read": 2048},
+        },
+    )
+    record_prompt_cache(response)
+    assert response.response_metadata["prompt_cache"] == {
+        "cache_read": 2048,
+        "cache_creation": 0,
+        "input_tokens": 2100,
+    }
+
+    uncached = AIMessage(
+        content="hi", usage_metadata={"input_tokens": 5, "output_tokens": 1, "total_tokens": 6}
+    )
+    record_prompt_cache(uncached)
+    assert "prompt_cache" not in uncached.response_metadata
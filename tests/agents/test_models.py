@@ -0,0 +1,95 @@
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+from agents.model_router import ModelRouter
+from agents.models import ModelRegistry, system_prompt
+
+SRC = Path(__file__).parents[2] / "src"
+PROVIDER_PACKAGES = [
+    "langchain_openai",
+    "langchain_anthropic",
+    "langchain_aws",
+    "langchain_google_genai",
+    "langchain_groq",
+    "langchain_community.tools",
+]
+
+
+def test_models_are_built_on_first_use() -> None:
+    built = []
+
+    def factory() -> GenericFakeChatModel:
+        built.append("fake")
+        return GenericFakeChatModel(messages=iter([]))
+
+    registry = ModelRegistry({"fake": factory})
+    assert "fake" in registry
+    assert list(registry) == ["fake"]
+    assert built == []
+
+    assert registry["fake"] is registry["fake"]
+    assert built == ["fake"]
+    assert registry.built() == ["fake"]
+
+    registry.warm_up(["fake", "unknown"])
+    assert built == ["fake"]
+
+
+def test_router_builds_models_off_the_event_loop() -> None:
+    threads = []
+
+    def factory() -> GenericFakeChatModel:
+        threads.append(threading.get_ident())
+        return GenericFakeChatModel(messages=iter([AIMessage(content="hi")]))
+
+    router = ModelRouter(ModelRegistry({"fake": factory}), [])
+    response = asyncio.run(router.ainvoke("fake", lambda m: m, "hello"))
+    assert response.content == "hi"
+    assert len(threads) == 1
+    assert threads[0] != threading.get_ident()
+
+
+def test_system_prompt_cache_breakpoint() -> None:
+    from langchain_anthropic import ChatAnthropic
+
+    anthropic = ChatAnthropic(model="claude-3-haiku-20240307", api_key="sk-fake")
+    message = system_prompt("Be helpful.", anthropic)
+    assert message.content == [
+        {"type": "text", "text": "Be helpful.", "cache_control": {"type": "ephemeral"}}
+    ]
+
+    fake = GenericFakeChatModel(messages=iter([]))
+    assert system_prompt("Be helpful.", fake).content == "Be helpful."
+
+
+def test_service_import_skips_provider_packages() -> None:
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(SRC),
+        "OPENAI_API_KEY": "sk-fake-openai-key",
+        "DATABASE_URL": "sqlite+aiosqlite:///:memory:",
+    }
+    script = (
+        "import sys, main; "
+        f"print(','.join(m for m in {PROVIDER_PACKAGES!r} if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+
+    # On failure, show the slowest imports from the -X importtime profile
+    timings = [line.split("|") for line in result.stderr.splitlines() if line.count("|") == 2]
+    slowest = sorted(timings[1:], key=lambda t: int(t[1]), reverse=True)[:15]
+    profile = "\n".join(f"{int(t[1]) / 1000:8.1f} ms {t[2].strip()}" for t in slowest)
+    assert result.stdout.strip() == "", f"Imported at startup:\n{profile}"
@@ -0,0 +1,253 @@
+import asyncio
+from unittest.mock import AsyncMock, Mock, patch
+from uuid import uuid4
+
+import httpx
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langgraph.graph import END, StateGraph
+
+from agent_services import _stream_items
+from agents.coin_index import CoinIndex
+from agents.llama_guard import LlamaGuardOutput, SafetyAssessment
+from agents.research_assistant import (
+    AgentState,
+    DevBotTools,
+    format_price,
+    research_assistant,
+    speculative_guard_input,
+)
+from schema import StreamInput
+
+ANSWER = "Base is an Ethereum L2."
+
+
+class FakeToolCallingModel(GenericFakeChatModel):
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+def fake_models() -> dict:
+    return {"gpt-4o-mini": FakeToolCallingModel(messages=iter([AIMessage(content=ANSWER)]))}
+
+
+def fake_guard(assessment: SafetyAssessment) -> Mock:
+    guard = Mock()
+    guard.ainvoke = AsyncMock(
+        return_value=LlamaGuardOutput(safety_assessment=assessment, unsafe_categories=["Hate"])
+    )
+    return guard
+
+
+def test_research_assistant_safe_input() -> None:
+    config = RunnableConfig(configurable={"thread_id": "1", "model": "gpt-4o-mini"})
+    with (
+        patch.dict("agents.models.models", fake_models()),
+        patch(
+            "agents.research_assistant.get_llama_guard",
+            return_value=fake_guard(SafetyAssessment.SAFE),
+        ),
+    ):
+        result = asyncio.run(
+            research_assistant.ainvoke(
+                {"messages": [HumanMessage(content="What is Base?")]}, config
+            )
+        )
+    assert result["messages"][-1].content == ANSWER
+    assert result["safety"].safety_assessment == SafetyAssessment.SAFE
+
+
+def test_speculative_guard_input() -> None:
+    state = {"messages": [HumanMessage(content="What is Base?")], "is_last_step": False}
+    config = RunnableConfig(configurable={"model": "gpt-4o-mini"})
+
+    with (
+        patch.dict("agents.models.models", fake_models()),
+        patch(
+            "agents.research_assistant.get_llama_guard",
+            return_value=fake_guard(SafetyAssessment.SAFE),
+        ),
+    ):
+        output = asyncio.run(RunnableLambda(speculative_guard_input).ainvoke(state, config))
+    assert output["messages"][-1].content == ANSWER
+    assert output["safety"].safety_assessment == SafetyAssessment.SAFE
+
+    with (
+        patch.dict("agents.models.models", fake_models()),
+        patch(
+            "agents.research_assistant.get_llama_guard",
+            return_value=fake_guard(SafetyAssessment.UNSAFE),
+        ),
+    ):
+        output = asyncio.run(RunnableLambda(speculative_guard_input).ainvoke(state, config))
+    assert output["messages"][-1].content == (
+        "This conversation was flagged for unsafe content: Hate"
+    )
+    assert output["safety"].safety_assessment == SafetyAssessment.UNSAFE
+
+
+def test_speculative_tokens_streamed_after_safe_verdict() -> None:
+    graph = StateGraph(AgentState)
+    graph.add_node("guard_input", speculative_guard_input)
+    graph.set_entry_point("guard_input")
+    graph.add_edge("guard_input", END)
+    agent = graph.compile()
+
+    async def stream(assessment: SafetyAssessment) -> list[str | bytes]:
+        guard = fake_guard(assessment)
+        verdict = guard.ainvoke.return_value
+
+        async def slow_verdict(*args) -> LlamaGuardOutput:
+            # The model streams its tokens before the verdict
+            await asyncio.sleep(0.05)
+            return verdict
+
+        guard.ainvoke = slow_verdict
+        kwargs = {
+            "input": {"messages": [HumanMessage(content="What is Base?")]},
+            "config": RunnableConfig(configurable={"model": "gpt-4o-mini"}),
+        }
+        with (
+            patch.dict("agents.models.models", fake_models()),
+            patch("agents.research_assistant.get_llama_guard", return_value=guard),
+        ):
+            user_input = StreamInput(message="What is Base?")
+            return [item async for item in _stream_items(user_input, agent, kwargs, uuid4())]
+
+    items = asyncio.run(stream(SafetyAssessment.SAFE))
+    assert "".join(item for item in items if isinstance(item, str)) == ANSWER
+    # Held tokens come before the final message
+    assert isinstance(items[0], str)
+
+    items = asyncio.run(stream(SafetyAssessment.UNSAFE))
+    assert not [item for item in items if isinstance(item, str)]
+    assert b"flagged for unsafe content" in items[0]
+
+
+def test_devbot_tools_are_async_and_cached() -> None:
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if request.url.path.endswith("/coins/list"):
+            return httpx.Response(200, json=[{"id": "bitcoin", "symbol": "btc", "name": "Bitcoin"}])
+        if request.url.host == "api.coingecko.com":
+            return httpx.Response(200, json={"bitcoin": {"usd": 65000.5}})
+        return httpx.Response(
+            200, json={"RelatedTopics": [{"Text": "Base docs", "FirstURL": "https://base.org"}]}
+        )
+
+    async def amain() -> None:
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            with (
+                patch("agents.research_assistant.get_http_client", return_value=client),
+                patch("agents.research_assistant.coin_index", CoinIndex()),
+            ):
+                for _ in range(2):
+                    price = await DevBotTools.crypto_prices(["BTC"])
+                    assert price == {"prices": "symbol|id|usd\nBTC|bitcoin|65000.5"}
+                    info = await DevBotTools.base_network_info("Docs")
+                    assert info == {"results": [{"title": "Base docs", "url": "https://base.org"}]}
+
+    DevBotTools.price_cache.clear()
+    DevBotTools.search_cache.clear()
+    asyncio.run(amain())
+    assert len(requests) == 3
+
+
+def test_devbot_tools_report_network_errors() -> None:
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise httpx.ConnectTimeout("timed out", request=request)
+
+    async def amain() -> dict:
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            with (
+                patch("agents.research_assistant.get_http_client", return_value=client),
+                patch("agents.research_assistant.coin_index", CoinIndex()),
+            ):
+                return await DevBotTools.crypto_prices(["ethereum"])
+
+    DevBotTools.price_cache.clear()
+    assert asyncio.run(amain())["error"] == "Timeout Error"
+    assert DevBotTools.price_cache.get("ethereum") is None
+
+
+def test_crypto_prices_invalid_response() -> None:
+    bodies = iter([{"text": "<html>Service Unavailable</html>"}, {"json": ["rate limited"]}])
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/coins/list"):
+            return httpx.Response(200, json=[{"id": "ethereum", "symbol": "eth", "name": "Ether"}])
+        return httpx.Response(200, **next(bodies))
+
+    async def amain() -> dict:
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            with (
+                patch("agents.research_assistant.get_http_client", return_value=client),
+                patch("agents.research_assistant.coin_index", CoinIndex()),
+            ):
+                return await DevBotTools.crypto_prices(["eth"])
+
+    DevBotTools.price_cache.clear()
+    assert asyncio.run(amain())["error"] == "Invalid Response"
+    assert asyncio.run(amain())["error"] == "Invalid Response"
+
+
+def test_base_network_info_invalid_response() -> None:
+    bodies = iter([{"text": "<html>Service Unavailable</html>"}, {"json": ["not", "a", "dict"]}])
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, **next(bodies))
+
+    async def amain() -> dict:
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            with patch("agents.research_assistant.get_http_client", return_value=client):
+                return await DevBotTools.base_network_info("fees")
+
+    DevBotTools.search_cache.clear()
+    assert asyncio.run(amain())["error"] == "Invalid Response"
+    assert asyncio.run(amain())["error"] == "Invalid Response"
+
+
+def test_format_price() -> None:
+    assert format_price(0.000012) == "0.000012"
+    assert format_price(0.0000123456789) == "0.000012345679"
+    assert format_price(65000.5) == "65000.5"
+    assert format_price(2500) == "2500"
+    assert format_price(123456789.5) == "123456790"
+
+
+def test_crypto_prices_batches_symbols() -> None:
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if request.url.path.endswith("/coins/list"):
+            return httpx.Response(
+                200,
+                json=[
+                    {"id": "bitcoin", "symbol": "btc", "name": "Bitcoin"},
+                    {"id": "ethereum", "symbol": "eth", "name": "Ethereum"},
+                    {"id": "solana", "symbol": "sol", "name": "Solana"},
+                ],
+            )
+        assert request.url.params["ids"] == "ethereum,solana"
+        return httpx.Response(200, json={"ethereum": {"usd": 2500}, "solana": {"usd": 150.25}})
+
+    async def amain() -> dict:
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            with (
+                patch("agents.research_assistant.get_http_client", return_value=client),
+                patch("agents.research_assistant.coin_index", CoinIndex()),
+            ):
+                return await DevBotTools.crypto_prices(["eth", "Solana", "Ethereum", "NOPE"])
+
+    DevBotTools.price_cache.clear()
+    output = asyncio.run(amain())
+    assert output["prices"] == (
+        "symbol|id|usd\nETH|ethereum|2500\nSOLANA|solana|150.25\nETHEREUM|ethereum|2500"
+    )
+    assert "NOPE" in output["message"]
+    # One request for the coin list and one batched price request
+    assert len(requests) == 2
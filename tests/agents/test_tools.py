@@ -0,0 +1,66 @@
+import asyncio
+import time
+
+from langchain_core.messages import AIMessage, ToolCall
+from langchain_core.runnables import RunnableConfig
+
+from agents.tools import calculator, create_tool_node
+
+
+def slow_sync_tool(seconds: float) -> str:
+    """Sleep in a thread."""
+    time.sleep(seconds)
+    return "slept"
+
+
+async def slow_async_tool(seconds: float) -> str:
+    """Sleep on the event loop."""
+    await asyncio.sleep(seconds)
+    return "awaited"
+
+
+def tool_call(name: str, args: dict, id: str) -> ToolCall:
+    return ToolCall(name=name, args=args, id=id, type="tool_call")
+
+
+def test_tool_node_runs_calls_concurrently() -> None:
+    tool_node = create_tool_node([slow_sync_tool, slow_async_tool, calculator], timeout=5)
+    message = AIMessage(
+        content="",
+        tool_calls=[
+            tool_call("slow_sync_tool", {"seconds": 0.3}, "1"),
+            tool_call("slow_sync_tool", {"seconds": 0.3}, "2"),
+            tool_call("slow_async_tool", {"seconds": 0.3}, "3"),
+            tool_call("Calculator", {"expression": "2 * 21"}, "4"),
+        ],
+    )
+    start = time.perf_counter()
+    output = asyncio.run(tool_node({"messages": [message]}, RunnableConfig()))
+    assert time.perf_counter() - start < 0.6
+
+    messages = output["messages"]
+    assert [m.tool_call_id for m in messages] == ["1", "2", "3", "4"]
+    assert [m.content for m in messages] == ["slept", "slept", "awaited", "42"]
+    assert all(m.response_metadata["latency_ms"] >= 0 for m in messages)
+    assert messages[2].response_metadata["latency_ms"] >= 300
+
+
+def test_tool_node_timeouts_and_errors() -> None:
+    tool_node = create_tool_node(
+        [slow_async_tool, calculator], timeout=5, timeouts={"slow_async_tool": 0.05}
+    )
+    message = AIMessage(
+        content="",
+        tool_calls=[
+            tool_call("slow_async_tool", {"seconds": 1}, "1"),
+            tool_call("Calculator", {"expression": "1 +"}, "2"),
+            tool_call("missing_tool", {}, "3"),
+        ],
+    )
+    output = asyncio.run(tool_node({"messages": [message]}, RunnableConfig()))
+    timed_out, failed, missing = output["messages"]
+    assert timed_out.status == "error"
+    assert "timed out after 0.05 seconds" in timed_out.content
+    assert failed.status == "error"
+    assert "Please try again with a valid numerical expression" in failed.content
+    assert "missing_tool is not a valid tool" in missing.content
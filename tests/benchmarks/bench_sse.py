@@ -0,0 +1,116 @@
+"""
+Micro-benchmark of the /stream message generator.
+
+Compares the original json.dumps / model_dump based encoding with the code that ships:
+`agent_services._stream_items` feeding a `runs.Run` (and with it `sse.StreamBuffer`),
+driven by an agent stub replaying a synthetic event mix of mostly tokens and a few
+node outputs. Token coalescing is disabled so both produce a frame per token.
+
+Run with `PYTHONPATH=src python tests/benchmarks/bench_sse.py`
+"""
+
+import asyncio
+import json
+import os
+import time
+from uuid import uuid4
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from agent_services import _stream_items
+from agent_utils import convert_message_content_to_string, langchain_to_chat_message
+from runs import Run
+from schema import StreamInput
+
+TOKENS_PER_MESSAGE = 200
+ROUNDS = 200
+
+TOKEN_EVENT = {
+    "event": "on_chat_model_stream",
+    "tags": ["seq:step:2"],
+    "data": {"chunk": AIMessageChunk(content=" token")},
+}
+MESSAGE_EVENT = {
+    "event": "on_chain_end",
+    "tags": ["graph:step:3", "seq:step:1"],
+    "data": {
+        "output": {
+            "messages": [
+                AIMessage(
+                    content="Base is an Ethereum L2. " * 20,
+                    response_metadata={"model_name": "gpt-4o-mini", "finish_reason": "stop"},
+                )
+            ]
+        }
+    },
+}
+EVENTS = [TOKEN_EVENT] * TOKENS_PER_MESSAGE + [MESSAGE_EVENT]
+
+
+async def legacy(events: list[dict]) -> int:
+    size = 0
+    for event in events:
+        new_messages = []
+        if (
+            event["event"] == "on_chain_end"
+            and any(t.startswith("graph:step:") for t in event.get("tags", []))
+            and "messages" in event["data"]["output"]
+        ):
+            new_messages = event["data"]["output"]["messages"]
+        if event["event"] == "on_custom_event" and "custom_data_dispatch" in event.get("tags", []):
+            new_messages = [event["data"]]
+        for message in new_messages:
+            chat_message = langchain_to_chat_message(message)
+            chat_message.run_id = "847c6285-8fc9-4560-a83f-4e6285809254"
+            frame = (
+                f"data: {json.dumps({'type': 'message', 'content': chat_message.model_dump()})}\n\n"
+            )
+            size += len(frame.encode())
+        if event["event"] == "on_chat_model_stream" and "llama_guard" not in event.get("tags", []):
+            content = event["data"]["chunk"].content
+            if content:
+                frame = f"data: {json.dumps({'type': 'token', 'content': convert_message_content_to_string(content)})}\n\n"
+                size += len(frame.encode())
+    return size
+
+
+class ReplayAgent:
+    """Agent stub replaying recorded graph events."""
+
+    def __init__(self, events: list[dict]) -> None:
+        self.events = events
+
+    async def astream_events(self, **kwargs):
+        for event in self.events:
+            yield event
+
+
+async def current(events: list[dict]) -> int:
+    user_input = StreamInput(message="What is Base?")
+    kwargs = {"input": {}, "config": {}}
+    items = _stream_items(user_input, ReplayAgent(events), kwargs, uuid4())
+    run = Run("bench", "agent", "thread", buffer_size=len(events) + 1)
+    await run.execute(items)
+    return sum(len(frame) for _, frame in run.events)
+
+
+async def bench(name: str, encode) -> float:
+    await encode(EVENTS)
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        await encode(EVENTS)
+    rate = len(EVENTS) * ROUNDS / (time.perf_counter() - start)
+    print(f"{name:>8}: {rate:>12,.0f} events/sec")
+    return rate
+
+
+async def main() -> None:
+    # Read by StreamBuffer.from_env() in Run.execute()
+    os.environ["STREAM_COALESCE_MS"] = "0"
+    before = await bench("legacy", legacy)
+    after = await bench("current", current)
+    print(f"speedup: {after / before:.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+import asyncio
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.graph import END, MessagesState, StateGraph
+
+from checkpointer import BoundedMemorySaver
+
+
+def echo_graph(checkpointer: BoundedMemorySaver):
+    def echo(state: MessagesState) -> MessagesState:
+        return {"messages": [AIMessage(content=state["messages"][-1].content)]}
+
+    graph = StateGraph(MessagesState)
+    graph.add_node("echo", echo)
+    graph.set_entry_point("echo")
+    graph.add_edge("echo", END)
+    return graph.compile(checkpointer=checkpointer)
+
+
+def config(thread_id: str) -> RunnableConfig:
+    return RunnableConfig(configurable={"thread_id": thread_id})
+
+
+def test_prunes_checkpoint_history() -> None:
+    saver = BoundedMemorySaver(keep_last=3, ttl=0, max_threads=0, max_bytes=0)
+    graph = echo_graph(saver)
+    for i in range(5):
+        graph.invoke({"messages": [HumanMessage(content=f"Hello {i}")]}, config("1"))
+
+    assert len(list(saver.list(config("1")))) == 3
+    assert saver.stats()["pruned_checkpoints"] > 0
+    # The latest state is intact
+    messages = graph.get_state(config("1")).values["messages"]
+    assert [m.content for m in messages[-2:]] == ["Hello 4", "Hello 4"]
+    assert len(messages) == 10
+
+
+def test_evicts_least_recently_used_threads() -> None:
+    saver = BoundedMemorySaver(keep_last=2, ttl=0, max_threads=2, max_bytes=0)
+    graph = echo_graph(saver)
+
+    async def amain() -> None:
+        for thread_id in ["1", "2"]:
+            await graph.ainvoke({"messages": [HumanMessage(content="Hi")]}, config(thread_id))
+        # Reading thread 1 makes thread 2 the least recently used
+        await graph.aget_state(config("1"))
+        await graph.ainvoke({"messages": [HumanMessage(content="Hi")]}, config("3"))
+
+    asyncio.run(amain())
+    assert graph.get_state(config("2")).values == {}
+    assert graph.get_state(config("1")).values["messages"][-1].content == "Hi"
+    stats = saver.stats()
+    assert stats["threads"] == 2
+    assert stats["evicted_threads"] == 1
+    assert stats["evicted_bytes"] > 0
+
+
+def test_evicts_by_bytes_and_ttl() -> None:
+    saver = BoundedMemorySaver(keep_last=2, ttl=0, max_threads=0, max_bytes=1)
+    graph = echo_graph(saver)
+    for thread_id in ["1", "2"]:
+        graph.invoke({"messages": [HumanMessage(content="Hi")]}, config(thread_id))
+    # The thread being written is never evicted, even if it alone is over budget
+    assert saver.stats()["threads"] == 1
+    assert graph.get_state(config("2")).values["messages"][-1].content == "Hi"
+
+    saver = BoundedMemorySaver(keep_last=2, ttl=0.01, max_threads=0, max_bytes=0)
+    graph = echo_graph(saver)
+    graph.invoke({"messages": [HumanMessage(content="Hi")]}, config("1"))
+    asyncio.run(asyncio.sleep(0.02))
+    assert graph.get_state(config("1")).values == {}
+    assert saver.stats()["expired_threads"] == 1
+    assert saver.stats()["bytes"] == 0
+
+
+def test_evicted_threads_leave_no_writes() -> None:
+    saver = BoundedMemorySaver(keep_last=2, ttl=0, max_threads=2, max_bytes=0)
+    graph = echo_graph(saver)
+    for i in range(50):
+        graph.invoke({"messages": [HumanMessage(content="Hi")]}, config(str(i)))
+        graph.get_state(config(str(i)))
+
+    assert {key[0] for key in saver.writes} <= {"48", "49"}
+    for thread_id, checkpoint_ns, checkpoint_id in saver.writes:
+        assert checkpoint_id in saver.storage[thread_id][checkpoint_ns]
+    # The running total matches the stored checkpoints and writes
+    size = sum(
+        len(checkpoint[1]) + len(metadata[1])
+        for namespaces in saver.storage.values()
+        for checkpoints in namespaces.values()
+        for checkpoint, metadata, _ in checkpoints.values()
+    )
+    size += sum(len(value[1]) for w in saver.writes.values() for _, _, value in w.values())
+    assert saver.stats()["bytes"] == size
@@ -0,0 +1,55 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+import checkpointer.serde
+from checkpointer import BoundedMemorySaver, CompactSerializer, get_serializer
+
+
+def _messages(count: int) -> list:
+    return [
+        message
+        for i in range(count)
+        for message in (
+            HumanMessage(content=f"What is the price of coin number {i}?", id=f"h{i}"),
+            AIMessage(content=f"Coin number {i} trades at {i * 1.5} USD.", id=f"a{i}"),
+        )
+    ]
+
+
+@pytest.mark.parametrize("use_zstd", [True, False])
+def test_compact_serializer_round_trip(monkeypatch, use_zstd: bool) -> None:
+    if use_zstd:
+        pytest.importorskip("zstandard")
+    else:
+        monkeypatch.setattr(checkpointer.serde, "zstandard", None)
+    serde = CompactSerializer()
+    messages = _messages(50)
+
+    type_, data = serde.dumps_typed(messages)
+    assert type_ == ("msgpack+zstd" if use_zstd else "msgpack+zlib")
+    assert len(data) < len(JsonPlusSerializer().dumps_typed(messages)[1]) / 2
+    assert serde.loads_typed((type_, data)) == messages
+
+    # Small values aren't worth compressing
+    assert serde.dumps_typed(messages[:1])[0] == "msgpack"
+    assert serde.loads_typed(serde.dumps_typed(messages[:1])) == messages[:1]
+
+
+def test_compact_serializer_reads_default_format() -> None:
+    messages = _messages(50)
+    for typed in [JsonPlusSerializer().dumps_typed(messages), ("json", b'{"a": 1}')]:
+        assert CompactSerializer().loads_typed(typed) == JsonPlusSerializer().loads_typed(typed)
+
+
+def test_get_serializer(monkeypatch) -> None:
+    monkeypatch.delenv("CHECKPOINTER_SERDE", raising=False)
+    assert isinstance(get_serializer(), CompactSerializer)
+    assert isinstance(BoundedMemorySaver().serde, CompactSerializer)
+
+    monkeypatch.setenv("CHECKPOINTER_SERDE", "default")
+    assert not isinstance(get_serializer(), CompactSerializer)
+
+    monkeypatch.setenv("CHECKPOINTER_SERDE", "pickle")
+    with pytest.raises(ValueError, match="Unknown checkpoint serializer"):
+        get_serializer()
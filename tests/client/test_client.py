@@ -0,0 +1,44 @@
+import asyncio
+
+from client import AgentClient
+
+
+def test_sync_client_is_reused() -> None:
+    client = AgentClient(max_connections=5, max_keepalive_connections=2)
+    pooled = client.client
+    assert client.client is pooled
+    assert client.limits.max_connections == 5
+
+    client.close()
+    assert pooled.is_closed
+    assert client.client is not pooled
+    client.close()
+
+
+def test_async_client_is_reused_within_loop() -> None:
+    async def amain() -> None:
+        async with AgentClient() as client:
+            pooled = client.aclient
+            assert client.aclient is pooled
+        assert pooled.is_closed
+
+    asyncio.run(amain())
+
+
+def test_async_client_is_recreated_on_new_loop() -> None:
+    client = AgentClient()
+
+    async def get_aclient():
+        return client.aclient
+
+    first = asyncio.run(get_aclient())
+    second = asyncio.run(get_aclient())
+    assert first is not second
+    # The previous loop's pool is closed, not leaked
+    assert first.is_closed
+
+    async def aclose() -> None:
+        await client.aclose()
+
+    asyncio.run(aclose())
+    assert second.is_closed
@@ -0,0 +1,148 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi import Request
+from fastapi.testclient import TestClient
+from langchain_core.messages import AIMessage
+
+from admission import PRIORITIES, AdmissionController, AdmissionRejected, request_priority
+from agents import DEFAULT_AGENT
+from main import app
+
+test_client = TestClient(app)
+
+
+def test_admission_limits_concurrency() -> None:
+    async def run() -> None:
+        controller = AdmissionController(default_limit=1, max_queue=1, timeout=0.05)
+        slot = await controller.acquire("gpt-4o-mini")
+
+        # Other models have their own limit
+        other = await controller.acquire("claude-3-haiku")
+        other.release()
+
+        # The queued request times out
+        with pytest.raises(AdmissionRejected) as e:
+            await controller.acquire("gpt-4o-mini")
+        assert e.value.retry_after >= 1
+
+        queued = asyncio.create_task(controller.acquire("gpt-4o-mini"))
+        await asyncio.sleep(0)
+        # The queue is full, rejected without waiting
+        with pytest.raises(AdmissionRejected):
+            await controller.acquire("gpt-4o-mini")
+        assert controller.rejected == 2
+
+        slot.release()
+        slot.release()
+        (await queued).release()
+        assert controller.stats() == {
+            "gpt-4o-mini": {"limit": 1, "active": 0, "waiting": 0},
+            "claude-3-haiku": {"limit": 1, "active": 0, "waiting": 0},
+        }
+
+    asyncio.run(run())
+
+
+def test_admission_serves_priority_first() -> None:
+    async def run() -> list[str]:
+        controller = AdmissionController(default_limit=1, timeout=1)
+        slot = await controller.acquire("gpt-4o-mini")
+        order = []
+
+        async def request(name: str, priority: int) -> None:
+            async with controller.admit("gpt-4o-mini", priority):
+                order.append(name)
+
+        tasks = [
+            asyncio.create_task(request("low", PRIORITIES["low"])),
+            asyncio.create_task(request("normal", PRIORITIES["normal"])),
+            asyncio.create_task(request("high", PRIORITIES["high"])),
+        ]
+        await asyncio.sleep(0)
+        slot.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(run()) == ["high", "normal", "low"]
+
+
+def test_admission_priority_from_api_key(monkeypatch) -> None:
+    monkeypatch.setenv("ADMISSION_KEY_PRIORITIES", "key-a=high, key-b=low")
+    monkeypatch.setenv("MODEL_CONCURRENCY", "gpt-4o-mini=32")
+    controller = AdmissionController.from_env()
+    assert controller.priority("key-a") == PRIORITIES["high"]
+    assert controller.priority("key-b") == PRIORITIES["low"]
+    assert controller.priority(None) == PRIORITIES["normal"]
+    assert controller.gate("gpt-4o-mini").limit == 32
+
+
+def test_request_priority_ignores_api_key_header_with_auth(monkeypatch) -> None:
+    controller = AdmissionController(key_priorities={"key-a": PRIORITIES["high"]})
+    request = Request({"type": "http", "headers": [(b"x-api-key", b"key-a")]})
+    monkeypatch.setattr("admission.admission", controller)
+    monkeypatch.delenv("AUTH_SECRET", raising=False)
+    assert request_priority(request) == PRIORITIES["high"]
+    # The header isn't verified, only the bearer token is
+    monkeypatch.setenv("AUTH_SECRET", "secret")
+    assert request_priority(request) == PRIORITIES["normal"]
+
+
+def test_admission_gates_resolved_tier_model() -> None:
+    controller = AdmissionController()
+    agent_mock = AsyncMock()
+    agent_mock.ainvoke = AsyncMock(return_value={"messages": [AIMessage(content="hi")]})
+
+    with (
+        patch("agent_services.admission", controller),
+        patch("agent_services.model_router.resolve", return_value="claude-3-haiku"),
+        patch.dict("agents.models.models", {"claude-3-haiku": agent_mock}),
+        patch.dict("agent_services.agents", {DEFAULT_AGENT: agent_mock}),
+    ):
+        response = test_client.post(
+            f"/{DEFAULT_AGENT}/batch_invoke", json={"inputs": [{"message": "hi", "model": "fast"}]}
+        )
+    assert response.json()["results"][0]["output"]["content"] == "hi"
+    assert list(controller.gates) == ["claude-3-haiku"]
+    # The agent runs on the model that was admitted
+    config = agent_mock.ainvoke.await_args.kwargs["config"]
+    assert config["configurable"]["model"] == "claude-3-haiku"
+
+
+def test_stream_rejected_when_overloaded() -> None:
+    controller = AdmissionController(default_limit=0, max_queue=0)
+    agent_mock = AsyncMock()
+    agent_mock.ainvoke = AsyncMock(return_value={"messages": [AIMessage(content="hi")]})
+
+    with (
+        patch("agent_services.admission", controller),
+        patch.dict("agent_services.agents", {DEFAULT_AGENT: agent_mock}),
+    ):
+        response = test_client.post(f"/{DEFAULT_AGENT}/stream", json={"message": "hi"})
+        assert response.status_code == 503
+        assert int(response.headers["Retry-After"]) >= 1
+
+        response = test_client.post(
+            f"/{DEFAULT_AGENT}/batch_invoke", json={"inputs": [{"message": "hi"}]}
+        )
+        assert response.json()["results"][0]["error"].startswith("Too many requests")
+    agent_mock.ainvoke.assert_not_awaited()
+
+
+def test_unknown_models_rejected_before_admission() -> None:
+    controller = AdmissionController()
+    with patch("agent_services.admission", controller):
+        response = test_client.post(
+            f"/{DEFAULT_AGENT}/stream", json={"message": "hi", "model": "not-a-model"}
+        )
+        assert response.status_code == 422
+        assert response.json()["detail"] == "Model 'not-a-model' is not available"
+
+        response = test_client.post(
+            f"/{DEFAULT_AGENT}/batch_invoke",
+            json={"inputs": [{"message": "hi", "model": "not-a-model"}]},
+        )
+        assert response.json()["results"][0]["error"] == "Model 'not-a-model' is not available"
+    # No gate was created for the unknown name
+    assert controller.gates == {}
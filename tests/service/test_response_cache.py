@@ -0,0 +1,169 @@
+import asyncio
+import json
+from unittest.mock import AsyncMock, patch
+
+from fastapi.testclient import TestClient
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+from agent_services import _cache_lookup, _parse_input, ainvoke, thread_config
+from agents import agents
+from agents.llama_guard import LlamaGuardOutput, SafetyAssessment
+from main import app
+from response_cache import ResponseCache, normalize_message
+from schema import UserInput
+
+test_client = TestClient(app)
+
+
+class KeywordEmbeddings(Embeddings):
+    """Embeds text by which of a few keywords it contains."""
+
+    keywords = ["base", "fees", "bridge"]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return [float(keyword in text) for keyword in self.keywords]
+
+
+def _key(message: str) -> tuple[str, str, str, str]:
+    return ("chatbot", "gpt-4o-mini", "", normalize_message(message))
+
+
+def test_exact_match() -> None:
+    async def run() -> None:
+        cache = ResponseCache()
+        assert await cache.lookup(_key("What is Base?")) is None
+        await cache.store(_key("What is Base?"), AIMessage(content="An L2"))
+        # Tool calls aren't final responses
+        await cache.store(
+            _key("Price of ETH"),
+            AIMessage(content="", tool_calls=[{"name": "CryptoPrices", "args": {}, "id": "1"}]),
+        )
+        # Nor are safety blocks
+        blocked = AIMessage(content="Flagged", response_metadata={"cacheable": False})
+        await cache.store(_key("Something unsafe"), blocked)
+        assert await cache.lookup(_key("Something unsafe")) is None
+
+        response, tier = await cache.lookup(_key("  what is  BASE "))
+        assert (response.content, tier) == ("An L2", "exact")
+        assert await cache.lookup(_key("Price of ETH")) is None
+        stats = cache.stats()
+        assert (stats["exact_hits"], stats["misses"], stats["stores"]) == (1, 3, 1)
+
+    asyncio.run(run())
+
+
+def test_expired_entries_miss() -> None:
+    async def run() -> None:
+        cache = ResponseCache(ttl=-1)
+        await cache.store(_key("What is Base?"), AIMessage(content="An L2"))
+        assert await cache.lookup(_key("What is Base?")) is None
+
+    asyncio.run(run())
+
+
+def test_semantic_match() -> None:
+    async def run() -> None:
+        cache = ResponseCache(embeddings=KeywordEmbeddings(), similarity=0.9)
+        await cache.store(_key("What are the fees on base?"), AIMessage(content="Low"))
+
+        response, tier = await cache.lookup(_key("how high are base fees"))
+        assert (response.content, tier) == ("Low", "semantic")
+
+        async def reject() -> bool:
+            return False
+
+        # Semantic matches are only served once verified
+        assert await cache.lookup(_key("how high are base fees"), reject) is None
+        assert await cache.lookup(_key("how do I bridge to base")) is None
+        # Other models have their own entries
+        assert await cache.lookup(("chatbot", "claude-3-haiku", "", "base fees")) is None
+
+    asyncio.run(run())
+
+
+def test_semantic_match_skips_expired_entries() -> None:
+    async def run() -> None:
+        cache = ResponseCache(ttl=0.2, embeddings=KeywordEmbeddings(), similarity=0.9)
+        await cache.store(_key("What are the fees on base?"), AIMessage(content="Old"))
+        await asyncio.sleep(0.25)
+        await cache.store(_key("base fees"), AIMessage(content="Low"))
+        # Storing again replaces the entry
+        await cache.store(_key("base fees"), AIMessage(content="Lower"))
+
+        response, tier = await cache.lookup(_key("What are the fees on base?"))
+        assert (response.content, tier) == ("Lower", "semantic")
+        # The expired entry left the index
+        assert list(cache._index[("chatbot", "gpt-4o-mini", "")]) == ["base fees"]
+
+    asyncio.run(run())
+
+
+def test_cached_response_served_and_recorded() -> None:
+    cache = ResponseCache()
+    model = GenericFakeChatModel(messages=iter([AIMessage(content="An L2 built by Coinbase")]))
+    agent = agents["chatbot"]
+
+    with (
+        patch("agent_services.response_cache", cache),
+        patch.dict("agents.models.models", {"gpt-4o-mini": model}),
+    ):
+        first = asyncio.run(ainvoke(UserInput(message="What is Base?"), agent_id="chatbot"))
+        # The fake model has no responses left, so this has to come from the cache
+        second = asyncio.run(
+            ainvoke(UserInput(message="what is base", thread_id="cached"), agent_id="chatbot")
+        )
+        response = test_client.post("/chatbot/stream", json={"message": "What is Base?"})
+
+    assert first.content == second.content == "An L2 built by Coinbase"
+    assert second.response_metadata["cache"] == "exact"
+    state = asyncio.run(agent.aget_state(thread_config("chatbot", "cached")))
+    assert [m.type for m in state.values["messages"]] == ["human", "ai"]
+
+    frames = [line[6:] for line in response.text.splitlines() if line.startswith("data: ")]
+    assert json.loads(frames[0])["content"]["content"] == "An L2 built by Coinbase"
+    assert frames[-1] == "[DONE]"
+    assert cache.stats()["exact_hits"] == 2
+
+
+def test_cache_lookup_failure_is_a_miss() -> None:
+    cache = ResponseCache()
+    model = GenericFakeChatModel(messages=iter([AIMessage(content="An L2")]))
+
+    with (
+        patch("agent_services.response_cache", cache),
+        patch("agent_services.normalize_message", side_effect=RuntimeError("broken")),
+        patch.dict("agents.models.models", {"gpt-4o-mini": model}),
+    ):
+        response = test_client.post("/chatbot/stream", json={"message": "What is Base?"})
+
+    assert response.status_code == 200
+    frames = [line[6:] for line in response.text.splitlines() if line.startswith("data: ")]
+    assert json.loads(frames[-2])["content"]["content"] == "An L2"
+    assert cache.stats()["stores"] == 0
+
+
+def test_semantic_hit_checks_guarded_agent_input() -> None:
+    cache = ResponseCache(embeddings=KeywordEmbeddings(), similarity=0.9)
+    agent_id = "research-assistant"
+    asyncio.run(cache.store((agent_id, "gpt-4o-mini", "", "base fees"), AIMessage(content="Low")))
+    user_input = UserInput(message="how high are base fees")
+
+    async def lookup(assessment: SafetyAssessment) -> AIMessage | None:
+        guard = AsyncMock()
+        guard.ainvoke.return_value = LlamaGuardOutput(safety_assessment=assessment)
+        kwargs, _, _ = _parse_input(user_input, agent_id)
+        with (
+            patch("agent_services.response_cache", cache),
+            patch("agent_services.get_llama_guard", return_value=guard),
+        ):
+            _, message = await _cache_lookup(agents[agent_id], agent_id, user_input, kwargs)
+        guard.ainvoke.assert_awaited_once()
+        return message
+
+    assert asyncio.run(lookup(SafetyAssessment.UNSAFE)) is None
+    assert asyncio.run(lookup(SafetyAssessment.SAFE)).content == "Low"
@@ -0,0 +1,158 @@
+import asyncio
+
+from runs import RunManager
+from sse import DONE_FRAME
+
+
+async def _items(count: int, started: asyncio.Event | None = None, release=None):
+    for i in range(count):
+        yield f"data: {i}\n\n".encode()
+        if i == 0 and started is not None:
+            started.set()
+            await release.wait()
+    yield DONE_FRAME
+
+
+async def _tokens(count: int, started: asyncio.Event | None = None, release=None):
+    for i in range(count):
+        yield f"{i} "
+        # Output tokens reported by the model
+        yield 1
+        if i == 0 and started is not None:
+            started.set()
+            await release.wait()
+    yield DONE_FRAME
+
+
+def test_run_continues_without_subscribers() -> None:
+    async def run() -> None:
+        manager = RunManager(buffer_size=100, cancel_grace=None)
+        started, release = asyncio.Event(), asyncio.Event()
+        run = manager.start("run-1", "agent", "thread", _items(5, started, release))
+
+        # A client reads the first event and disconnects
+        subscription = run.subscribe()
+        assert await anext(subscription) == b"id: 1\ndata: 0\n\n"
+        await subscription.aclose()
+        assert run.subscribers == 0
+
+        release.set()
+        await run.task
+        assert run.status == "done"
+        assert manager.get("run-1") is run
+
+        # Reconnecting resumes after the last received event
+        frames = [frame async for frame in run.subscribe(last_event_id=1)]
+        assert frames[0] == b"id: 2\ndata: 1\n\n"
+        assert frames[-1] == b"id: 6\n" + DONE_FRAME
+
+    asyncio.run(run())
+
+
+def test_run_buffer_is_bounded() -> None:
+    async def run() -> None:
+        manager = RunManager(buffer_size=3, ttl=0)
+        run = manager.start("run-1", "agent", "thread", _items(10))
+        await run.task
+        frames = [frame async for frame in run.subscribe(last_event_id=2)]
+        # Events that left the ring buffer are reported, not silently skipped
+        assert frames[0].startswith(b'data: {"type":"error","content":"6 events')
+        assert [frame.split(b"\n")[0] for frame in frames[1:]] == [b"id: 9", b"id: 10", b"id: 11"]
+
+        await asyncio.sleep(0.01)
+        assert manager.get("run-1") is None
+
+    asyncio.run(run())
+
+
+def test_slow_subscriber_receives_every_event() -> None:
+    async def run() -> None:
+        manager = RunManager(buffer_size=3, cancel_grace=None)
+        run = manager.start("run-1", "agent", "thread", _items(20))
+        frames = []
+        async for frame in run.subscribe():
+            frames.append(frame)
+            await asyncio.sleep(0.001)
+            # The run waits for the subscriber instead of dropping its unread events
+            assert run.next_event_id - len(frames) <= 4
+        assert [int(frame.split(b"\n")[0][4:]) for frame in frames] == list(range(1, 22))
+        assert run.status == "done"
+
+    asyncio.run(run())
+
+
+def test_run_cancelled() -> None:
+    async def run() -> None:
+        manager = RunManager()
+        started, release = asyncio.Event(), asyncio.Event()
+        run = manager.start("run-1", "agent", "thread", _items(5, started, release))
+        subscription = run.subscribe()
+        assert await anext(subscription) == b"id: 1\ndata: 0\n\n"
+        run.task.cancel()
+        assert [frame async for frame in subscription] == []
+        assert run.status == "cancelled"
+
+    asyncio.run(run())
+
+
+def test_run_cancelled_before_starting() -> None:
+    async def run() -> None:
+        manager = RunManager()
+        run = manager.start("run-1", "agent", "thread", _items(5))
+        subscription = run.subscribe()
+        # The task is cancelled before it first runs
+        run.task.cancel()
+        assert [frame async for frame in subscription] == []
+        assert run.status == "cancelled"
+        assert run.finished_at is not None
+        assert manager.stats()["running"] == 0
+        assert manager.stats()["cancelled_runs"] == 1
+
+    asyncio.run(run())
+
+
+def test_run_cancelled_after_client_disconnects() -> None:
+    async def run() -> None:
+        manager = RunManager(cancel_grace=0.01)
+        completed = manager.start("run-1", "agent", "thread", _tokens(10))
+        await completed.task
+        # Runs without model calls, like cache hits, don't skew the average
+        cached = manager.start("run-cached", "agent", "thread", _items(1))
+        await cached.task
+
+        started, release = asyncio.Event(), asyncio.Event()
+        abandoned = manager.start("run-2", "agent", "thread", _tokens(10, started, release))
+        subscription = abandoned.subscribe()
+        await anext(subscription)
+        await subscription.aclose()
+        await asyncio.sleep(0.05)
+
+        assert abandoned.status == "cancelled"
+        assert manager.stats() == {
+            "running": 0,
+            "completed_runs": 1,
+            "completed_tokens": 10,
+            "cancelled_runs": 1,
+            "estimated_tokens_saved": 9,
+        }
+
+    asyncio.run(run())
+
+
+def test_run_not_cancelled_when_client_reconnects() -> None:
+    async def run() -> None:
+        manager = RunManager(cancel_grace=0.05)
+        started, release = asyncio.Event(), asyncio.Event()
+        run = manager.start("run-1", "agent", "thread", _tokens(10, started, release))
+        subscription = run.subscribe()
+        await anext(subscription)
+        await subscription.aclose()
+
+        reconnected = run.subscribe(last_event_id=1)
+        release.set()
+        frames = [frame async for frame in reconnected]
+        await asyncio.sleep(0.1)
+        assert run.status == "done"
+        assert frames[-1].endswith(DONE_FRAME)
+
+    asyncio.run(run())
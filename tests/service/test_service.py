@@ -1,13 +1,27 @@
+import asyncio
+import json
 from unittest.mock import AsyncMock, Mock, patch
 
 import langsmith
+import pytest
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
-from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
 from langgraph.pregel.types import StateSnapshot
 
+from agent_services import ahistory, ainvoke
 from agents import DEFAULT_AGENT
-from schema import ChatHistory, ChatMessage
+from schema import (
+    BatchOutput,
+    ChatHistory,
+    ChatHistoryInput,
+    ChatMessage,
+    RunStatus,
+    UserInput,
+)
 from main import app
+from runs import run_manager
 
 test_client = TestClient(app)
 
@@ -52,33 +66,225 @@ def test_feedback(mock_client: langsmith.Client) -> None:
     )
 
 
+def _state_snapshot(messages: list) -> StateSnapshot:
+    return StateSnapshot(
+        values={"messages": messages},
+        next=(),
+        config={},
+        metadata=None,
+        created_at=None,
+        parent_config=None,
+        tasks=(),
+    )
+
+
 def test_history() -> None:
     QUESTION = "What is the weather in Tokyo?"
     ANSWER = "The weather in Tokyo is 70 degrees."
     user_question = HumanMessage(content=QUESTION)
     agent_response = AIMessage(content=ANSWER)
     agent_mock = AsyncMock()
-    agent_mock.get_state = Mock(
-        return_value=StateSnapshot(
-            values={"messages": [user_question, agent_response]},
-            next=(),
-            config={},
-            metadata=None,
-            created_at=None,
-            parent_config=None,
-            tasks=(),
-        )
-    )
+    agent_mock.aget_state = AsyncMock(return_value=_state_snapshot([user_question, agent_response]))
 
-    with patch.dict("service.service.agents", {DEFAULT_AGENT: agent_mock}):
-        with test_client as c:
-            response = c.post(
-                "/history", json={"thread_id": "7bcc7cc1-99d7-4b1d-bdb5-e6f90ed44de6"}
-            )
-            assert response.status_code == 200
+    with patch.dict("agent_services.agents", {DEFAULT_AGENT: agent_mock}):
+        response = test_client.post(
+            f"/{DEFAULT_AGENT}/history", json={"thread_id": "7bcc7cc1-99d7-4b1d-bdb5-e6f90ed44de6"}
+        )
+        assert response.status_code == 200
 
     output = ChatHistory.model_validate(response.json())
     assert output.messages[0].type == "human"
     assert output.messages[0].content == QUESTION
     assert output.messages[1].type == "ai"
     assert output.messages[1].content == ANSWER
+    assert output.next_cursor is None
+
+
+def test_history_pagination() -> None:
+    messages = [HumanMessage(content=str(i)) for i in range(250)]
+    agent_mock = AsyncMock()
+    agent_mock.aget_state = AsyncMock(return_value=_state_snapshot(messages))
+
+    with patch.dict("agent_services.agents", {DEFAULT_AGENT: agent_mock}):
+        pages = []
+        body = {"thread_id": "7bcc7cc1-99d7-4b1d-bdb5-e6f90ed44de6", "limit": 100}
+        while True:
+            response = test_client.post(f"/{DEFAULT_AGENT}/history", json=body)
+            assert response.status_code == 200
+            page = ChatHistory.model_validate(response.json())
+            pages.append([int(m.content) for m in page.messages])
+            if page.next_cursor is None:
+                break
+            body["before"] = page.next_cursor
+
+        response = test_client.post(f"/{DEFAULT_AGENT}/history/stream", json=body | {"before": 150})
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.text.splitlines()]
+
+    assert pages == [list(range(150, 250)), list(range(50, 150)), list(range(50))]
+    assert [int(m["content"]) for m in lines[:-1]] == list(range(50, 150))
+    assert lines[-1] == {"next_cursor": 50}
+
+    response = test_client.post("/not-an-agent/history/stream", json={"thread_id": "1"})
+    assert response.status_code == 404
+
+
+def test_agents_keep_separate_threads() -> None:
+    model = GenericFakeChatModel(messages=iter([AIMessage(content="Hello from the chatbot")]))
+    with patch.dict("agents.models.models", {"gpt-4o-mini": model}):
+        asyncio.run(ainvoke(UserInput(message="Hi", thread_id="shared"), agent_id="chatbot"))
+
+    history_input = ChatHistoryInput(thread_id="shared")
+    chatbot_history = asyncio.run(ahistory(history_input, agent_id="chatbot"))
+    assert [m.content for m in chatbot_history.messages] == ["Hi", "Hello from the chatbot"]
+    # The same thread ID of another agent is a different conversation
+    other_history = asyncio.run(ahistory(history_input, agent_id="research-assistant"))
+    assert other_history.messages == []
+
+
+def test_invoke_unknown_agent() -> None:
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(ainvoke(UserInput(message="hi"), agent_id="not-an-agent"))
+    assert e.value.status_code == 404
+
+
+def test_batch_invoke() -> None:
+    QUESTIONS = ["What is Base?", "What is ETH?", "What is BTC?"]
+
+    async def ainvoke(input, config):
+        question = input["messages"][0].content
+        if question == QUESTIONS[1]:
+            raise ValueError("model failed")
+        return {"messages": [AIMessage(content=f"Answer to {question}")]}
+
+    agent_mock = AsyncMock()
+    agent_mock.ainvoke = AsyncMock(side_effect=ainvoke)
+
+    with patch.dict("agent_services.agents", {DEFAULT_AGENT: agent_mock}):
+        response = test_client.post(
+            f"/{DEFAULT_AGENT}/batch_invoke",
+            json={"inputs": [{"message": q} for q in QUESTIONS], "max_concurrency": 2},
+        )
+        assert response.status_code == 200
+
+    assert agent_mock.ainvoke.await_count == 3
+    output = BatchOutput.model_validate(response.json())
+    assert output.results[0].output.content == f"Answer to {QUESTIONS[0]}"
+    assert output.results[1].output is None
+    assert output.results[1].error == "Unexpected error"
+    assert output.results[2].output.content == f"Answer to {QUESTIONS[2]}"
+
+
+def test_batch_invoke_unknown_agent() -> None:
+    response = test_client.post("/not-an-agent/batch_invoke", json={"inputs": [{"message": "hi"}]})
+    assert response.status_code == 404
+
+
+def test_stream() -> None:
+    QUESTION = "What is Base?"
+    events = [
+        {"event": "on_chain_start", "tags": [], "data": {}},
+        {
+            "event": "on_chain_end",
+            "tags": ["graph:step:1"],
+            "data": {"output": {"messages": [HumanMessage(content=QUESTION)]}},
+        },
+        {
+            "event": "on_chat_model_stream",
+            "tags": ["llama_guard"],
+            "data": {"chunk": AIMessageChunk(content="safe")},
+        },
+        {
+            "event": "on_chat_model_stream",
+            "tags": [],
+            "data": {"chunk": AIMessageChunk(content="")},
+        },
+        {
+            "event": "on_chat_model_stream",
+            "tags": [],
+            "data": {"chunk": AIMessageChunk(content='Base is "an L2"')},
+        },
+        {
+            "event": "on_chat_model_end",
+            "tags": [],
+            "data": {
+                "output": AIMessage(
+                    content='Base is "an L2"',
+                    usage_metadata={"input_tokens": 5, "output_tokens": 7, "total_tokens": 12},
+                )
+            },
+        },
+        {
+            "event": "on_chain_end",
+            "tags": ["seq:step:1"],
+            "data": {"output": {"messages": [AIMessage(content="inner")]}},
+        },
+        {
+            "event": "on_chain_end",
+            "tags": ["graph:step:2"],
+            "data": {"output": {"messages": [AIMessage(content='Base is "an L2"')]}},
+        },
+    ]
+
+    async def astream_events(**kwargs):
+        for event in events:
+            yield event
+
+    agent_mock = Mock()
+    agent_mock.astream_events = astream_events
+
+    with patch.dict("agent_services.agents", {DEFAULT_AGENT: agent_mock}):
+        response = test_client.post(f"/{DEFAULT_AGENT}/stream", json={"message": QUESTION})
+        assert response.status_code == 200
+
+    lines = [line for line in response.text.splitlines() if line]
+    assert lines[::2] == ["id: 1", "id: 2", "id: 3"]
+    frames = [line[6:] for line in lines[1::2]]
+    assert frames[-1] == "[DONE]"
+    parsed = [json.loads(frame) for frame in frames[:-1]]
+    assert parsed[0] == {"type": "token", "content": 'Base is "an L2"'}
+    assert len(parsed) == 2
+    assert parsed[1]["type"] == "message"
+    message = ChatMessage.model_validate(parsed[1]["content"])
+    assert message.content == 'Base is "an L2"'
+    assert message.run_id == response.headers["X-Run-ID"]
+
+    # The run can be resumed after its last received event
+    response = test_client.get(f"/runs/{message.run_id}/stream", headers={"Last-Event-ID": "2"})
+    assert response.text == "id: 3\ndata: [DONE]\n\n"
+    status = RunStatus.model_validate(test_client.get(f"/runs/{message.run_id}").json())
+    assert status.status == "done"
+    assert status.last_event_id == 3
+    assert run_manager.get(message.run_id).output_tokens == 7
+    assert test_client.get("/runs/not-a-run").status_code == 404
+
+    response = test_client.post("/not-an-agent/stream", json={"message": QUESTION})
+    assert response.status_code == 404
+
+
+def test_stream_tool_message_latency() -> None:
+    tool_message = ToolMessage(
+        content="42", tool_call_id="1", response_metadata={"latency_ms": 12.5}
+    )
+    events = [
+        {
+            "event": "on_chain_end",
+            "tags": ["graph:step:2"],
+            "data": {"output": {"messages": [tool_message]}},
+        }
+    ]
+
+    async def astream_events(**kwargs):
+        for event in events:
+            yield event
+
+    agent_mock = Mock()
+    agent_mock.astream_events = astream_events
+
+    with patch.dict("agent_services.agents", {DEFAULT_AGENT: agent_mock}):
+        response = test_client.post(f"/{DEFAULT_AGENT}/stream", json={"message": "6 * 7?"})
+
+    frame = next(line for line in response.text.splitlines() if line.startswith("data: {"))
+    message = ChatMessage.model_validate(json.loads(frame[6:])["content"])
+    assert message.type == "tool"
+    assert message.response_metadata == {"latency_ms": 12.5}
@@ -0,0 +1,87 @@
+import asyncio
+import json
+
+import pytest
+
+from sse import DONE_FRAME, StreamBuffer
+
+
+def _parse(frames: list[bytes]) -> list:
+    return [json.loads(frame[6:]) if frame != DONE_FRAME else "[DONE]" for frame in frames]
+
+
+def test_stream_buffer_coalesces_tokens() -> None:
+    async def run() -> list[bytes]:
+        buffer = StreamBuffer(coalesce_ms=50)
+
+        async def produce() -> None:
+            for token in ["Base ", "is ", "an ", "L2"]:
+                await buffer.put_token(token)
+            await buffer.put_frame(DONE_FRAME)
+            await buffer.close()
+
+        producer = asyncio.create_task(produce())
+        frames = [frame async for frame in buffer]
+        await producer
+        return frames
+
+    assert _parse(asyncio.run(run())) == [{"type": "token", "content": "Base is an L2"}, "[DONE]"]
+
+
+def test_stream_buffer_flushes_after_window() -> None:
+    async def run() -> list[bytes]:
+        buffer = StreamBuffer(coalesce_ms=10)
+        frames = []
+
+        async def consume() -> None:
+            async for frame in buffer:
+                frames.append(frame)
+
+        consumer = asyncio.create_task(consume())
+        await buffer.put_token("first")
+        await asyncio.sleep(0.05)
+        # Sent without waiting for more tokens or the end of the stream
+        assert len(frames) == 1
+        await buffer.put_token("second")
+        await buffer.close()
+        await consumer
+        return frames
+
+    assert [frame["content"] for frame in _parse(asyncio.run(run()))] == ["first", "second"]
+
+
+@pytest.mark.parametrize("policy", ["merge", "drop"])
+def test_stream_buffer_is_bounded(policy: str) -> None:
+    async def run() -> tuple[list[bytes], StreamBuffer]:
+        buffer = StreamBuffer(maxsize=2, coalesce_ms=0, policy=policy)
+        # Nobody is reading, so the queue fills up
+        for i in range(100):
+            await buffer.put_token(f"{i} ")
+        assert len(buffer) == 2
+        frame_put = asyncio.create_task(buffer.put_frame(DONE_FRAME))
+        await asyncio.sleep(0.01)
+        assert not frame_put.done()
+
+        frames = []
+        async for frame in buffer:
+            frames.append(frame)
+            if frame == DONE_FRAME:
+                break
+        await frame_put
+        return frames, buffer
+
+    frames, buffer = asyncio.run(run())
+    parsed = _parse(frames)
+    assert parsed[0] == {"type": "token", "content": "0 "}
+    assert parsed[-1] == "[DONE]"
+    if policy == "merge":
+        assert parsed[1]["content"] == "".join(f"{i} " for i in range(1, 100))
+        assert buffer.dropped_tokens == 0
+    else:
+        assert parsed[1]["content"] == "1 "
+        assert buffer.dropped_tokens == 98
+
+
+def test_stream_buffer_unknown_policy() -> None:
+    with pytest.raises(ValueError, match="Unknown stream queue policy"):
+        StreamBuffer(policy="block")